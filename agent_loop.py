@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+import time
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ограничение количества шагов (запрос к модели + выполнение инструментов) по умолчанию
+DEFAULT_MAX_STEPS = 25
+
+# Причины остановки цикла
+STOP_END_TURN = "end_turn"
+STOP_ERROR = "error"
+STOP_MAX_STEPS = "max_steps"
+STOP_MAX_TOKENS = "max_tokens"
+STOP_DEADLINE = "deadline"
+
+
+def usage_tokens(usage):
+    """
+    Считает все токены ответа: входные (в том числе из кэша) и выходные.
+
+    Args:
+        usage (dict): Поле usage ответа Messages API
+
+    Returns:
+        int: Количество токенов
+    """
+    if not usage:
+        return 0
+    return sum(usage.get(key) or 0 for key in
+               ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens"))
+
+
+def step_limit(max_steps):
+    """Условие остановки: выполнено max_steps шагов."""
+    def condition(run):
+        return STOP_MAX_STEPS if len(run["steps"]) >= max_steps else None
+    return condition
+
+
+def token_limit(max_tokens):
+    """Условие остановки: за запуск израсходовано не меньше max_tokens токенов."""
+    def condition(run):
+        return STOP_MAX_TOKENS if run["tokens"] >= max_tokens else None
+    return condition
+
+
+def time_limit(seconds):
+    """Условие остановки: с начала запуска прошло не меньше seconds секунд."""
+    def condition(run):
+        return STOP_DEADLINE if run["elapsed"] >= seconds else None
+    return condition
+
+
+def format_step(step):
+    """
+    Форматирует шаг для вывода прогресса (CLI, Telegram).
+
+    Args:
+        step (dict): Запись шага
+
+    Returns:
+        str: Строка прогресса
+    """
+    tools = ", ".join(step["tools"]) or "без инструментов"
+    return (f"Шаг {step['step']}: {tools} (модель {step['model_time']:.1f} с, "
+            f"действия {step['action_time']:.1f} с, токенов {step['tokens']})")
+
+
+class AgentLoop:
+    """
+    Итеративный цикл агента computer use: запрос к модели, выполнение
+    вызванных инструментов, следующий запрос - пока модель не перестанет
+    вызывать инструменты или не сработает одно из условий остановки.
+
+    Условие остановки - функция, которая получает состояние запуска (словарь
+    со шагами, токенами и прошедшим временем) и возвращает причину остановки
+    или None. Условия проверяются после каждого шага, когда результаты
+    инструментов уже добавлены в историю, поэтому остановленный диалог
+    можно продолжить следующим запросом.
+
+    При потоковом ответе инструменты начинают выполняться еще во время
+    запроса к модели: время действий шага - только та часть, которую
+    пришлось ждать после получения ответа.
+    """
+
+    def __init__(self, controller, max_steps=DEFAULT_MAX_STEPS, max_tokens=None, deadline=None,
+                 stop_conditions=(), on_step=None):
+        """
+        Инициализирует цикл.
+
+        Args:
+            controller: Контроллер с методами request_model() и run_tools(response)
+            max_steps (int, optional): Максимальное количество шагов (None - без ограничения)
+            max_tokens (int, optional): Сколько токенов (входных и выходных) можно
+                израсходовать за запуск (None - без ограничения)
+            deadline (float, optional): Ограничение времени запуска в секундах (None - без ограничения)
+            stop_conditions (iterable): Дополнительные условия остановки
+            on_step (callable, optional): Вызывается после каждого шага с записью шага и ответом модели
+        """
+        self.controller = controller
+        self.stop_conditions = []
+        if max_steps is not None:
+            self.stop_conditions.append(step_limit(max_steps))
+        if max_tokens is not None:
+            self.stop_conditions.append(token_limit(max_tokens))
+        if deadline is not None:
+            self.stop_conditions.append(time_limit(deadline))
+        self.stop_conditions += list(stop_conditions)
+        self.on_step = on_step
+
+    def run(self):
+        """
+        Выполняет шаги до остановки. Первое сообщение пользователя уже должно быть в истории.
+
+        Returns:
+            dict: Последний ответ модели (None при ошибке запроса), причина остановки,
+                записи шагов, израсходованные токены, общее время, время модели и действий
+        """
+        run = self._start_run()
+        while run["stop_reason"] is None:
+            step_started = time.perf_counter()
+            response = self.controller.request_model()
+            model_time = time.perf_counter() - step_started
+            if response is None:
+                self._fail(run, model_time)
+                break
+
+            action_started = time.perf_counter()
+            tools = self.controller.run_tools(response)
+            step = self._finish_step(run, response, tools, model_time, time.perf_counter() - action_started)
+            if self.on_step:
+                self.on_step(step, response)
+        return self._end_run(run)
+
+    def _start_run(self):
+        """Создает состояние запуска."""
+        return {"response": None, "stop_reason": None, "steps": [], "tokens": 0,
+                "elapsed": 0.0, "model_time": 0.0, "action_time": 0.0, "_started": time.perf_counter()}
+
+    def _fail(self, run, model_time):
+        """Завершает запуск после ошибки запроса к модели."""
+        run["model_time"] += model_time
+        run["response"] = None
+        run["stop_reason"] = STOP_ERROR
+
+    def _finish_step(self, run, response, tools, model_time, action_time):
+        """
+        Записывает шаг и проверяет условия остановки.
+
+        Returns:
+            dict: Запись шага
+        """
+        run["response"] = response
+        run["model_time"] += model_time
+        run["action_time"] += action_time
+        tokens = usage_tokens(response.get("usage"))
+        run["tokens"] += tokens
+        run["elapsed"] = time.perf_counter() - run["_started"]
+        step = {"step": len(run["steps"]) + 1, "tools": tools, "tokens": tokens,
+                "model_time": model_time, "action_time": action_time}
+        run["steps"].append(step)
+        logger.info(format_step(step))
+
+        if not tools:
+            run["stop_reason"] = STOP_END_TURN
+            return step
+        for condition in self.stop_conditions:
+            run["stop_reason"] = condition(run)
+            if run["stop_reason"]:
+                break
+        return step
+
+    def _end_run(self, run):
+        """Завершает запуск и возвращает его результат."""
+        run["elapsed"] = time.perf_counter() - run.pop("_started")
+        return run
+
+
+class AsyncAgentLoop(AgentLoop):
+    """
+    Тот же цикл агента для асинхронного контроллера: request_model() и
+    run_tools(response) - корутины, on_step может быть обычной функцией
+    или корутиной. Отмена задачи прерывает цикл на текущем шаге.
+    """
+
+    async def run(self):
+        """
+        Выполняет шаги до остановки. Первое сообщение пользователя уже должно быть в истории.
+
+        Returns:
+            dict: Результат запуска, как у AgentLoop.run()
+        """
+        run = self._start_run()
+        while run["stop_reason"] is None:
+            step_started = time.perf_counter()
+            response = await self.controller.request_model()
+            model_time = time.perf_counter() - step_started
+            if response is None:
+                self._fail(run, model_time)
+                break
+
+            action_started = time.perf_counter()
+            tools = await self.controller.run_tools(response)
+            step = self._finish_step(run, response, tools, model_time, time.perf_counter() - action_started)
+            if self.on_step:
+                result = self.on_step(step, response)
+                if inspect.isawaitable(result):
+                    await result
+        return self._end_run(run)
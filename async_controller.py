@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import ssl
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from robot_controller import AnthropicComputerController, REQUEST_TIMEOUT, CONNECT_TIMEOUT
+from agent_loop import AsyncAgentLoop
+from message_stream import MessageStream, SSEParser
+from tool_scheduler import ToolScheduler, TIMEOUT_GRACE
+
+try:
+    # httpx ставится вместе с python-telegram-bot; без него запросы выполняются
+    # синхронным клиентом в потоке, и отмена дожидается конца текущего запроса
+    import httpx
+    import certifi
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Экран и ввод одни на процесс: все действия с ними выполняются по очереди в одном
+# потоке, даже если в цикле событий идут несколько сессий агента
+GUI_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gui")
+
+
+@functools.lru_cache(maxsize=1)
+def _ssl_context():
+    """
+    SSL-контекст для HTTP-клиентов. Загрузка сертификатов занимает десятки
+    миллисекунд и блокирует цикл событий, поэтому контекст создается один раз.
+    """
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+async def run_blocking(func, *args, executor=None, **kwargs):
+    """
+    Выполняет блокирующую функцию в пуле потоков, не останавливая цикл событий.
+
+    Args:
+        func (callable): Блокирующая функция
+        *args: Позиционные аргументы функции
+        executor (Executor, optional): Пул (по умолчанию - пул цикла событий;
+            для действий с экраном - GUI_EXECUTOR)
+        **kwargs: Именованные аргументы функции
+
+    Returns:
+        Результат функции
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+class AsyncAnthropicComputerController(AnthropicComputerController):
+    """
+    Асинхронный вариант контроллера для вызова из asyncio (Telegram-бот,
+    ASGI-сервер). Запросы к API идут через асинхронный HTTP-клиент,
+    действия с экраном и вводом - в GUI_EXECUTOR, bash и редактор -
+    в пуле потоков планировщика, поэтому одна долгая
+    сессия агента не блокирует остальные обработчики. Отмена задачи
+    прерывает запрос; уже начатое действие с экраном доводится до конца,
+    а в историю записывается ошибка отмены, так что диалог остается
+    корректным и его можно продолжить.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Действия с экраном всех сессий выполняются в общем потоке экрана
+        self.tools = ToolScheduler(self.execute_tool, gui_executor=GUI_EXECUTOR,
+                                   timeouts=kwargs.get("tool_timeouts"))
+        self._client = None
+
+    def stop(self):
+        """Останавливает контроллер (общий GUI_EXECUTOR продолжает работать)"""
+        self.tools.shutdown(wait=False)
+        self.bash.close()
+        print("Контролер зупинено")
+        return True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        """Закрывает HTTP-клиент, потоки инструментов и оболочку"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.tools.shutdown(wait=False)
+        await run_blocking(self.bash.close)
+
+    def _http_client(self):
+        """Создает HTTP-клиент при первом запросе (внутри работающего цикла событий)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(verify=_ssl_context(),
+                                             timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT))
+        return self._client
+
+    async def send_to_anthropic(self, prompt, add_coordinate=None, **loop_options):
+        """Отправляет запрос к Anthropic API с поддержкой Computer use и возвращает последний ответ"""
+        return (await self.run_agent(prompt, add_coordinate, **loop_options))["response"]
+
+    async def run_agent(self, prompt, add_coordinate=None, **loop_options):
+        """
+        Добавляет запрос пользователя в историю и выполняет асинхронный цикл агента.
+        Параметры цикла те же, что у AnthropicComputerController.run_agent;
+        on_step может быть корутиной.
+        """
+        self._add_prompt(prompt, add_coordinate)
+        run = await AsyncAgentLoop(self, **loop_options).run()
+        self._report_run(run)
+        return run
+
+    async def request_model(self):
+        """Один запрос к модели с текущей историей; None при ошибке"""
+        payload = self._build_payload()
+        if httpx is None:
+            return self._checked_response(await run_blocking(self._post_messages, payload))
+        return self._checked_response(await self._post_messages_async(payload))
+
+    async def _post_messages_async(self, payload):
+        """Отправляет запрос к Messages API через асинхронный клиент"""
+        body = self._encode_payload(payload)
+        try:
+            async with self._http_client().stream("POST", self.messages_url, headers=self.request_headers,
+                                                  content=body) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    print(f"Error: {response.status_code}")
+                    print(response.text)
+                    return None
+                if payload.get("stream"):
+                    result = await self._read_stream_async(response)
+                else:
+                    await response.aread()
+                    result = response.json()
+        except httpx.HTTPError as e:
+            print(f"Помилка запиту: {e}")
+            await self._drop_started_tools()
+            return None
+
+        if result is None:
+            return None
+        self.record_usage(result.get("usage"))
+        return result
+
+    async def _read_stream_async(self, response):
+        """
+        Читает потоковый ответ и собирает сообщение. Готовые вызовы инструментов
+        сразу ставятся в очередь GUI_EXECUTOR; их результаты забирает run_tools
+        """
+        self._started_tools = {}
+        parser = SSEParser()
+        stream = MessageStream(on_tool_use=self._start_tool_async)
+        try:
+            async for line in response.aiter_lines():
+                event = parser.feed_line(line)
+                if event:
+                    stream.feed(*event)
+            event = parser.flush()
+            if event:
+                stream.feed(*event)
+        except asyncio.CancelledError:
+            self._cancel_started_tools()
+            raise
+        except httpx.HTTPError as e:
+            stream.error = str(e)
+
+        if stream.error or not stream.complete:
+            print(f"Помилка потоку відповіді: {stream.error or 'потік обірвано'}")
+            return self._interrupted_message(stream)
+        return stream.message
+
+    def _start_tool_async(self, tool_use):
+        """Ставит готовый вызов инструмента в очередь выполнения"""
+        print(f"Інструмент {tool_use['name']} запущено до завершення відповіді")
+        self._started_tools[tool_use["id"]] = self.tools.submit(tool_use)
+
+    async def _drop_started_tools(self):
+        """Дожидается действий, начатых до ошибки запроса, у которой нет ответа для истории"""
+        started = [asyncio.wrap_future(future) for future in self._started_tools.values()]
+        self._started_tools = {}
+        await asyncio.gather(*started, return_exceptions=True)
+
+    def _cancel_started_tools(self):
+        """Отменяет действия, которые еще не начали выполняться"""
+        for future in self._started_tools.values():
+            future.cancel()
+        self._started_tools = {}
+
+    async def run_tools(self, response):
+        """
+        Добавляет ответ ассистента в историю, выполняет вызванные инструменты
+        (действия с экраном - в GUI_EXECUTOR, остальные - параллельно с ними)
+        и добавляет их результаты. При отмене в историю добавляются ошибки
+        для невыполненных вызовов
+        """
+        tool_uses = self._accept_tool_uses(response)
+        if not tool_uses:
+            return []
+
+        for tool_use in tool_uses:
+            if tool_use["id"] not in self._started_tools:
+                self._started_tools[tool_use["id"]] = self.tools.submit(tool_use)
+
+        results = {}
+        try:
+            for tool_use in tool_uses:
+                results[tool_use["id"]] = await self._tool_result(tool_use, self._started_tools.pop(tool_use["id"]))
+        except asyncio.CancelledError:
+            self._cancel_started_tools()
+            self._add_tool_results(tool_uses, results)
+            raise
+
+        return self._add_tool_results(tool_uses, results)
+
+    async def _tool_result(self, tool_use, future):
+        """Дожидается результата вызова с учетом таймаута инструмента"""
+        timeout = self.tools.timeout(tool_use["name"])
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future),
+                                          None if timeout is None else timeout + TIMEOUT_GRACE)
+        except asyncio.TimeoutError:
+            return self.tools.timeout_result(tool_use)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка инструмента {tool_use['name']}: {e}")
+            return {"error": str(e)}
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+import os
+import queue
+import codecs
+import signal
+import logging
+import secrets
+import threading
+import subprocess
+import time
+
+logger = logging.getLogger(__name__)
+
+# Оболочка сессии (запускается без профиля и rc-файлов)
+SHELL = "/bin/bash"
+
+# Таймаут команды по умолчанию (секунды)
+DEFAULT_TIMEOUT = 120.0
+
+# Сколько байт вывода каждого потока (stdout, stderr) возвращается модели:
+# половина бюджета - начало вывода, половина - конец, середина пропускается
+MAX_OUTPUT_BYTES = 16384
+
+# Размер блока чтения вывода
+READ_SIZE = 65536
+
+
+def _marker_prefix_length(data, marker):
+    """Длина конца data, совпадающего с началом метки (0, если не совпадает)."""
+    for length in range(min(len(data), len(marker) - 1), 0, -1):
+        if data.endswith(marker[:length]):
+            return length
+    return 0
+
+
+class OutputBuffer:
+    """
+    Вывод команды с ограничением по размеру. Хранится только начало и конец
+    вывода в пределах бюджета, поэтому команда с бесконечным выводом
+    не занимает память; пропущенная середина отмечается в тексте.
+    """
+
+    def __init__(self, max_bytes=MAX_OUTPUT_BYTES):
+        """
+        Инициализирует буфер.
+
+        Args:
+            max_bytes (int): Бюджет в байтах (начало + конец)
+        """
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+
+    def append(self, data):
+        """Добавляет блок вывода."""
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self.tail += data
+        excess = len(self.tail) - self.tail_limit
+        if excess > 0:
+            del self.tail[:excess]
+            self.dropped += excess
+
+    def text(self):
+        """Возвращает вывод как текст (с отметкой о пропущенной середине)."""
+        if not self.dropped:
+            return bytes(self.head + self.tail).decode("utf-8", "replace")
+        return (f"{self.head.decode('utf-8', 'replace')}\n"
+                f"[... пропущено {self.dropped} байт вывода ...]\n"
+                f"{self.tail.decode('utf-8', 'replace')}")
+
+
+class BashSession:
+    """
+    Одна долгоживущая оболочка на агента. Команды выполняются в ней по
+    очереди, поэтому рабочая директория, переменные окружения и функции
+    сохраняются между вызовами без запуска нового процесса. Конец команды
+    и ее код возврата определяются по уникальной метке, которую оболочка
+    печатает после команды. Вывод передается в on_output по мере
+    поступления и возвращается модели в пределах бюджета. По таймауту
+    оболочка вместе с запущенными из нее процессами завершается, и
+    следующая команда запускает новую.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_output_bytes=MAX_OUTPUT_BYTES, on_output=None, shell=SHELL):
+        """
+        Инициализирует сессию (оболочка запускается при первой команде).
+
+        Args:
+            timeout (float): Таймаут команды в секундах
+            max_output_bytes (int): Бюджет вывода каждого потока в байтах
+            on_output (callable, optional): Вызывается с (имя потока, фрагмент текста) по мере вывода
+            shell (str): Путь к bash
+        """
+        self.timeout = timeout
+        self.max_output_bytes = max_output_bytes
+        self.on_output = on_output
+        self.shell = shell
+        self.restarts = 0
+        self._started = False
+        self._process = None
+        self._chunks = None
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self):
+        """Работает ли оболочка."""
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Запускает оболочку и потоки чтения ее вывода."""
+        if self._started:
+            self.restarts += 1
+        self._started = True
+        self._process = subprocess.Popen([self.shell, "--noprofile", "--norc"], stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0,
+                                         start_new_session=True)
+        # У каждой оболочки своя очередь: вывод убитой оболочки не попадает в новую
+        self._chunks = queue.Queue()
+        for name, pipe in (("stdout", self._process.stdout), ("stderr", self._process.stderr)):
+            threading.Thread(target=self._read_pipe, args=(pipe, name, self._chunks), daemon=True).start()
+        logger.info(f"Запущена оболочка {self.shell} (pid {self._process.pid})")
+
+    @staticmethod
+    def _read_pipe(pipe, name, chunks):
+        """Читает поток вывода оболочки блоками; None в очереди означает конец потока."""
+        with pipe:
+            while True:
+                data = pipe.read(READ_SIZE)
+                if not data:
+                    break
+                chunks.put((name, data))
+        chunks.put((name, None))
+
+    def close(self):
+        """Завершает оболочку вместе с запущенными из нее процессами."""
+        if self._process is None:
+            return
+        try:
+            # Оболочка запущена в своей группе процессов: завершаем группу целиком
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self._process.wait()
+        self._process.stdin.close()
+        self._process = None
+
+    def restart(self):
+        """Перезапускает оболочку (состояние сессии теряется)."""
+        with self._lock:
+            self.close()
+            self.start()
+        logger.info("Оболочка перезапущена")
+
+    def run(self, command, timeout=None):
+        """
+        Выполняет команду в оболочке.
+
+        Args:
+            command (str): Команда bash
+            timeout (float, optional): Таймаут команды (по умолчанию - таймаут сессии)
+
+        Returns:
+            dict: stdout, stderr и код возврата; при ошибке, таймауте или
+                завершении оболочки - описание ошибки
+        """
+        if not command.strip():
+            return {"error": "Пуста команда", "stdout": "", "stderr": "", "exit_code": None}
+
+        timeout = timeout or self.timeout
+        with self._lock:
+            if not self.alive:
+                # Первая команда или оболочка завершилась (таймаут, exit)
+                self.close()
+                self.start()
+            marker = f"__BASH_DONE_{secrets.token_hex(8)}__"
+            # Текст команды передается дословно (here-document в кавычках) и разбирается
+            # через eval: незакрытая кавычка или ошибка синтаксиса дают код 2, а не
+            # поглощают следующие строки сценария. eval выполняется в текущей оболочке
+            # (cd и export сохраняются) и не читает stdin, где лежат эти строки
+            script = (f"IFS= read -r -d '' __bash_session_command <<'{marker}'\n"
+                      f"{command}\n"
+                      f"{marker}\n"
+                      f"eval \"$__bash_session_command\" < /dev/null\n"
+                      f"printf '%s:%d\\n' {marker} $?\n"
+                      f"printf '%s\\n' {marker} >&2\n")
+            try:
+                self._process.stdin.write(script.encode())
+            except OSError as e:
+                self.close()
+                return {"error": f"Оболонка недоступна: {e}", "stdout": "", "stderr": "", "exit_code": None}
+            return self._collect(command, marker.encode(), timeout)
+
+    def _collect(self, command, marker, timeout):
+        """Собирает вывод команды до меток конца в обоих потоках или до таймаута."""
+        buffers = {name: OutputBuffer(self.max_output_bytes) for name in ("stdout", "stderr")}
+        decoders = {name: codecs.getincrementaldecoder("utf-8")("replace") for name in buffers}
+        pending = {name: b"" for name in buffers}
+        finished = set()
+        exit_code = None
+        shell_exited = False
+        timed_out = False
+
+        def emit(name, data):
+            if not data:
+                return
+            buffers[name].append(data)
+            text = decoders[name].decode(data)
+            if text and self.on_output:
+                self.on_output(name, text)
+
+        deadline = time.monotonic() + timeout
+        while len(finished) < len(buffers):
+            try:
+                name, data = self._chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                timed_out = True
+                break
+            if data is None:
+                # Оболочка завершилась (например, командой exit)
+                emit(name, pending[name])
+                pending[name] = b""
+                finished.add(name)
+                shell_exited = True
+                continue
+
+            data = pending[name] + data
+            index = data.find(marker)
+            if index < 0:
+                # Конец блока может оказаться началом метки: придерживаем только его
+                keep = _marker_prefix_length(data, marker)
+                emit(name, data[:len(data) - keep])
+                pending[name] = data[len(data) - keep:]
+                continue
+            if name == "stdout":
+                end = data.find(b"\n", index)
+                if end < 0:
+                    pending[name] = data
+                    continue
+                exit_code = int(data[index + len(marker) + 1:end])
+            emit(name, data[:index])
+            pending[name] = b""
+            finished.add(name)
+
+        for name in buffers:
+            emit(name, pending[name])
+        result = {"stdout": buffers["stdout"].text(), "stderr": buffers["stderr"].text(), "exit_code": exit_code}
+
+        # Убитая или завершившаяся оболочка заменяется новой при следующей команде
+        if timed_out:
+            self.close()
+            result["error"] = f"Команду перервано після {timeout:g} с; оболонку буде перезапущено"
+            result["timed_out"] = True
+        elif shell_exited:
+            if self._process is not None:
+                result["exit_code"] = self._process.wait()
+            self.close()
+            result["error"] = "Оболонка завершилась; наступна команда запустить нову, стан сесії втрачено"
+        elif exit_code != 0:
+            result["error"] = f"Command '{command}' returned non-zero exit status {exit_code}."
+        return result
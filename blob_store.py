@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import hashlib
+import sqlite3
+import logging
+import threading
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """
+    Хранилище скриншотов элементов с адресацией по содержимому.
+    Одинаковые изображения хранятся один раз (ключ - SHA-1 байтов PNG),
+    на каждое изображение ведется счетчик ссылок из местоположений.
+    Изображения дописываются в файлы-сегменты, индекс и счетчики размера
+    хранятся в SQLite и обновляются при каждом изменении.
+    """
+
+    SEGMENT_PREFIX = "segment_"
+    SEGMENT_SUFFIX = ".pack"
+
+    def __init__(self, directory, segment_size=4 * 1024 * 1024):
+        """
+        Открывает хранилище в директории.
+
+        Args:
+            directory (str): Директория сегментов и индекса
+            segment_size (int): Размер сегмента в байтах, после которого начинается новый
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._readers = {}
+        self.conn = sqlite3.connect(os.path.join(directory, "blobs.db"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                key TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                refcount INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_blobs_segment ON blobs(segment);
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                size INTEGER NOT NULL,
+                live_bytes INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO counters (name, value) VALUES ('blob_count', 0), ('live_bytes', 0);
+        """)
+        if self.conn.execute("SELECT MAX(id) FROM segments").fetchone()[0] is None:
+            self._new_segment()
+
+    def _segment_path(self, segment):
+        """Путь к файлу сегмента."""
+        return os.path.join(self.directory, f"{self.SEGMENT_PREFIX}{segment:06d}{self.SEGMENT_SUFFIX}")
+
+    def _new_segment(self):
+        """Начинает новый сегмент."""
+        cursor = self.conn.execute("INSERT INTO segments (size, live_bytes) VALUES (0, 0)")
+        return cursor.lastrowid
+
+    def _add_counters(self, blob_count, live_bytes):
+        """Изменяет счетчики количества и размера живых изображений."""
+        self.conn.execute("UPDATE counters SET value = value + ? WHERE name = 'blob_count'", (blob_count,))
+        self.conn.execute("UPDATE counters SET value = value + ? WHERE name = 'live_bytes'", (live_bytes,))
+
+    def _active_segment(self):
+        """
+        Возвращает (ID, размер) сегмента, в который дописываются изображения.
+        Активный сегмент - последний в индексе, поэтому несколько процессов,
+        открывших хранилище, пишут в один и тот же сегмент.
+        """
+        row = self.conn.execute("SELECT id, size FROM segments ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            return self._new_segment(), 0
+        return row
+
+    def _append(self, data):
+        """
+        Дописывает байты в активный сегмент и возвращает (сегмент, смещение).
+        Вызывается внутри транзакции записи, которая упорядочивает запись между процессами.
+        """
+        segment, size = self._active_segment()
+        if size and size + len(data) > self.segment_size:
+            segment = self._new_segment()
+        with open(self._segment_path(segment), "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        self.conn.execute("UPDATE segments SET size = ?, live_bytes = live_bytes + ? WHERE id = ?",
+                          (offset + len(data), len(data), segment))
+        return segment, offset
+
+    def put_bytes(self, data):
+        """
+        Сохраняет байты изображения или добавляет ссылку на уже сохраненные.
+
+        Args:
+            data (bytes): PNG изображения
+
+        Returns:
+            str: Ключ изображения
+        """
+        key = hashlib.sha1(data).hexdigest()
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            cursor = self.conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE key = ?", (key,))
+            if cursor.rowcount == 0:
+                segment, offset = self._append(data)
+                self.conn.execute("INSERT INTO blobs (key, segment, offset, length, refcount) VALUES (?, ?, ?, ?, 1)",
+                                  (key, segment, offset, len(data)))
+                self._add_counters(1, len(data))
+        return key
+
+    def put(self, image):
+        """
+        Сохраняет изображение (или добавляет ссылку на такое же).
+
+        Args:
+            image (PIL.Image): Изображение
+
+        Returns:
+            str: Ключ изображения
+        """
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return self.put_bytes(buffer.getvalue())
+
+    def add_ref(self, key):
+        """
+        Добавляет ссылку на сохраненное изображение.
+
+        Args:
+            key (str): Ключ изображения
+
+        Returns:
+            bool: True если изображение есть в хранилище
+        """
+        with self._lock:
+            cursor = self.conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE key = ?", (key,))
+            return cursor.rowcount > 0
+
+    def release(self, key):
+        """
+        Убирает ссылку на изображение. Изображение без ссылок удаляется из индекса,
+        сегмент с преимущественно удаленными данными уплотняется.
+
+        Args:
+            key (str): Ключ изображения
+
+        Returns:
+            bool: True если изображение удалено (ссылок не осталось)
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                row = self.conn.execute("SELECT segment, length, refcount FROM blobs WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return False
+                segment, length, refcount = row
+                if refcount > 1:
+                    self.conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE key = ?", (key,))
+                    return False
+                self.conn.execute("DELETE FROM blobs WHERE key = ?", (key,))
+                self.conn.execute("UPDATE segments SET live_bytes = live_bytes - ? WHERE id = ?", (length, segment))
+                self._add_counters(-1, -length)
+            self._maybe_compact(segment)
+            return True
+
+    def _maybe_compact(self, segment):
+        """Переносит живые изображения из неактивного сегмента, если в нем меньше половины живых данных."""
+        moved = 0
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute("SELECT size, live_bytes FROM segments WHERE id = ?", (segment,)).fetchone()
+            if row is None or segment == self._active_segment()[0] or row[1] * 2 > row[0]:
+                return
+            for key, offset, length in self.conn.execute(
+                    "SELECT key, offset, length FROM blobs WHERE segment = ?", (segment,)).fetchall():
+                data = self._read(segment, offset, length)
+                new_segment, new_offset = self._append(data)
+                self.conn.execute("UPDATE blobs SET segment = ?, offset = ? WHERE key = ?", (new_segment, new_offset, key))
+                moved += 1
+            self.conn.execute("DELETE FROM segments WHERE id = ?", (segment,))
+        reader = self._readers.pop(segment, None)
+        if reader:
+            reader.close()
+        try:
+            os.remove(self._segment_path(segment))
+        except OSError:
+            pass
+        logger.info(f"Сегмент скриншотов {segment} уплотнен, перенесено изображений: {moved}")
+
+    def _read(self, segment, offset, length):
+        """Читает байты из сегмента."""
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = open(self._segment_path(segment), "rb")
+            self._readers[segment] = reader
+        reader.seek(offset)
+        return reader.read(length)
+
+    def get_bytes(self, key):
+        """
+        Возвращает байты изображения.
+
+        Args:
+            key (str): Ключ изображения
+
+        Returns:
+            bytes или None: PNG изображения или None, если его нет
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT segment, offset, length FROM blobs WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            try:
+                return self._read(*row)
+            except FileNotFoundError:
+                # Сегмент уплотнил другой процесс: изображение уже перенесено в другой сегмент
+                row = self.conn.execute("SELECT segment, offset, length FROM blobs WHERE key = ?", (key,)).fetchone()
+                return self._read(*row) if row else None
+
+    def get(self, key):
+        """
+        Возвращает изображение.
+
+        Args:
+            key (str): Ключ изображения
+
+        Returns:
+            PIL.Image или None: Изображение или None, если его нет
+        """
+        data = self.get_bytes(key)
+        if data is None:
+            return None
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+
+    def __contains__(self, key):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM blobs WHERE key = ?", (key,)).fetchone() is not None
+
+    def count(self):
+        """
+        Возвращает количество сохраненных изображений.
+        """
+        with self._lock:
+            return self.conn.execute("SELECT value FROM counters WHERE name = 'blob_count'").fetchone()[0]
+
+    def total_bytes(self):
+        """
+        Возвращает суммарный размер сохраненных изображений в байтах.
+        """
+        with self._lock:
+            return self.conn.execute("SELECT value FROM counters WHERE name = 'live_bytes'").fetchone()[0]
+
+    def disk_bytes(self):
+        """
+        Возвращает размер сегментов на диске (с еще не уплотненными удаленными данными).
+        """
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()[0]
+
+    def close(self):
+        """
+        Закрывает файлы сегментов и индекс.
+        """
+        with self._lock:
+            for reader in self._readers.values():
+                reader.close()
+            self._readers = {}
+            self.conn.close()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+import os
+import zlib
+import logging
+import threading
+import numpy as np
+from text_index import normalize_search_text
+
+try:
+    # scipy ставится вместе со scikit-learn; без него используется чистый NumPy
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+logger = logging.getLogger(__name__)
+
+# Контексты короче этого порога не индексируются (как и раньше в find_elements_by_context)
+MIN_CONTEXT_LENGTH = 5
+
+
+def context_signature(screen_context):
+    """
+    Контрольная сумма контекста, по которой проверяется актуальность сохраненного вектора.
+
+    Args:
+        screen_context (str): Контекст экрана
+
+    Returns:
+        int: CRC32 контекста
+    """
+    return zlib.crc32((screen_context or "").encode("utf-8"))
+
+
+class ContextVectorIndex:
+    """
+    Инкрементальный индекс векторов контекста экрана.
+    Каждый контекст векторизуется один раз при сохранении (хеширование слов и биграмм,
+    сублинейная частота), строки хранятся в разреженной матрице CSR с дописыванием
+    в конец, а запрос считается одним умножением матрицы на вектор с весами IDF
+    по текущим частотам документов.
+    """
+
+    def __init__(self, path=None, n_features=2 ** 18):
+        """
+        Инициализирует пустой индекс.
+
+        Args:
+            path (str, optional): Файл .npz для сохранения векторов между запусками
+            n_features (int): Размерность пространства хешированных признаков
+        """
+        self.path = path
+        self.n_features = n_features
+        self._df = np.zeros(n_features, dtype=np.int32)
+        self._rows = {}
+        self._ids = []
+        self._signatures = []
+        self._alive = []
+        self._indptr = [0]
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._data = np.zeros(0, dtype=np.float32)
+        self._pending_indices = []
+        self._pending_data = []
+        # Запросы выполняются параллельно и могут одновременно переносить дописанные строки
+        self._flush_lock = threading.Lock()
+        self._dead_count = 0
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._rows)
+
+    def vectorize(self, screen_context):
+        """
+        Превращает контекст в разреженный L2-нормированный вектор частот.
+
+        Args:
+            screen_context (str): Контекст экрана
+
+        Returns:
+            tuple: (индексы признаков int32, значения float32)
+        """
+        words = normalize_search_text(screen_context).split()
+        tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not tokens:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        hashed = np.array([zlib.crc32(token.encode("utf-8")) % self.n_features for token in tokens], dtype=np.int32)
+        indices, counts = np.unique(hashed, return_counts=True)
+        values = (1.0 + np.log(counts)).astype(np.float32)
+        values /= np.linalg.norm(values)
+        return indices.astype(np.int32), values
+
+    def load(self, contexts):
+        """
+        Заполняет индекс контекстами элементов. Векторы из файла path используются
+        повторно, если контекст не изменился; векторизуются только новые контексты.
+
+        Args:
+            contexts (iterable): Пары (ID элемента, screen_context)
+        """
+        saved = self._read_saved()
+        reused = 0
+        for element_id, screen_context in contexts:
+            vector = saved.get(element_id)
+            if vector is not None and vector[0] == context_signature(screen_context):
+                self._append(element_id, vector[0], vector[1], vector[2])
+                reused += 1
+            else:
+                self.add(element_id, screen_context)
+        self._dirty = reused != len(self._rows) or len(saved) != reused
+        logger.info(f"Индекс контекстов загружен: {len(self._rows)} векторов, из файла взято {reused}")
+
+    def _read_saved(self):
+        """Читает сохраненные векторы из файла path."""
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                if int(saved["n_features"]) != self.n_features:
+                    return {}
+                ids, signatures, indptr = saved["ids"], saved["signatures"], saved["indptr"]
+                indices, data = saved["indices"], saved["data"]
+                return {
+                    str(element_id): (int(signatures[i]), indices[indptr[i]:indptr[i + 1]], data[indptr[i]:indptr[i + 1]])
+                    for i, element_id in enumerate(ids)
+                }
+        except Exception as e:
+            logger.error(f"Ошибка при чтении индекса контекстов: {str(e)}")
+            return {}
+
+    def save(self):
+        """
+        Сохраняет векторы в файл path (только живые строки).
+        """
+        if not self.path or not self._dirty:
+            return
+        try:
+            self._compact()
+            temp_file = f"{self.path}.{os.getpid()}.temp.npz"
+            np.savez(
+                temp_file,
+                n_features=np.int64(self.n_features),
+                ids=np.array(self._ids, dtype=str),
+                signatures=np.array(self._signatures, dtype=np.int64),
+                indptr=np.array(self._indptr, dtype=np.int64),
+                indices=self._indices,
+                data=self._data
+            )
+            os.replace(temp_file, self.path)
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении индекса контекстов: {str(e)}")
+
+    def _append(self, element_id, signature, indices, values):
+        """Дописывает строку в конец матрицы."""
+        self._rows[element_id] = len(self._ids)
+        self._ids.append(element_id)
+        self._signatures.append(signature)
+        self._alive.append(True)
+        self._indptr.append(self._indptr[-1] + len(indices))
+        self._pending_indices.append(indices)
+        self._pending_data.append(values)
+        self._df[indices] += 1
+
+    def add(self, element_id, screen_context):
+        """
+        Добавляет или обновляет контекст элемента. Неизменившийся контекст
+        повторно не векторизуется.
+
+        Args:
+            element_id (str): ID элемента
+            screen_context (str): Контекст экрана
+        """
+        signature = context_signature(screen_context)
+        row = self._rows.get(element_id)
+        if row is not None and self._signatures[row] == signature:
+            return
+        self.remove(element_id)
+        if not screen_context or len(screen_context.strip()) <= MIN_CONTEXT_LENGTH:
+            return
+        indices, values = self.vectorize(screen_context)
+        if len(indices):
+            self._append(element_id, signature, indices, values)
+            self._dirty = True
+
+    def remove(self, element_id):
+        """
+        Удаляет контекст элемента (строка помечается удаленной до уплотнения).
+
+        Args:
+            element_id (str): ID элемента
+        """
+        row = self._rows.pop(element_id, None)
+        if row is None:
+            return
+        self._flush_pending()
+        self._alive[row] = False
+        self._df[self._indices[self._indptr[row]:self._indptr[row + 1]]] -= 1
+        self._dead_count += 1
+        self._dirty = True
+        if self._dead_count > 64 and self._dead_count > len(self._ids) // 4:
+            self._compact()
+
+    def _flush_pending(self):
+        """Переносит дописанные строки в общие массивы CSR."""
+        with self._flush_lock:
+            if self._pending_indices:
+                self._indices = np.concatenate([self._indices] + self._pending_indices)
+                self._data = np.concatenate([self._data] + self._pending_data)
+                self._pending_indices = []
+                self._pending_data = []
+
+    def _compact(self):
+        """Физически удаляет помеченные строки."""
+        self._flush_pending()
+        if not self._dead_count:
+            return
+        indptr = np.array(self._indptr)
+        alive = np.array(self._alive, dtype=bool)
+        keep_rows = np.flatnonzero(alive)
+        lengths = indptr[keep_rows + 1] - indptr[keep_rows]
+        keep_values = np.repeat(alive, np.diff(indptr))
+        self._indices = self._indices[keep_values]
+        self._data = self._data[keep_values]
+        self._indptr = [0] + np.cumsum(lengths).tolist()
+        self._ids = [self._ids[row] for row in keep_rows]
+        self._signatures = [self._signatures[row] for row in keep_rows]
+        self._alive = [True] * len(self._ids)
+        self._rows = {element_id: row for row, element_id in enumerate(self._ids)}
+        self._dead_count = 0
+
+    def query(self, screen_context, similarity_threshold=0.6):
+        """
+        Находит элементы с похожим контекстом (косинусное сходство TF-IDF).
+
+        Args:
+            screen_context (str): Контекст текущего экрана
+            similarity_threshold (float): Порог сходства (0-1)
+
+        Returns:
+            list: Пары (ID элемента, сходство), отсортированные по убыванию сходства
+        """
+        if not self._rows:
+            return []
+        query_indices, query_values = self.vectorize(screen_context)
+        if not len(query_indices):
+            return []
+        self._flush_pending()
+
+        # Веса IDF по текущим частотам документов
+        document_count = len(self._rows)
+        idf = (np.log((1.0 + document_count) / (1.0 + self._df)) + 1.0).astype(np.float32)
+
+        query = np.zeros(self.n_features, dtype=np.float32)
+        query[query_indices] = query_values * idf[query_indices]
+        query /= np.linalg.norm(query)
+        weighted_query = query * idf
+
+        if sparse is not None:
+            matrix = sparse.csr_matrix((self._data, self._indices, np.array(self._indptr)),
+                                       shape=(len(self._ids), self.n_features))
+            dots = matrix @ weighted_query
+            norms = np.sqrt(matrix.multiply(matrix) @ (idf * idf))
+        else:
+            starts = np.array(self._indptr[:-1])
+            dots = np.add.reduceat(self._data * weighted_query[self._indices], starts)
+            norms = np.sqrt(np.add.reduceat((self._data * idf[self._indices]) ** 2, starts))
+
+        alive = np.array(self._alive, dtype=bool)
+        similarities = np.where(alive & (norms > 0), dots / np.maximum(norms, 1e-12), 0.0)
+        rows = np.flatnonzero(similarities >= similarity_threshold)
+        rows = rows[np.argsort(-similarities[rows])]
+        return [(self._ids[row], float(similarities[row])) for row in rows]
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Примерная стоимость изображения в токенах (скриншот, уменьшенный API до ~1.15 МП)
+IMAGE_TOKENS = 1600
+
+# Сколько символов JSON в среднем приходится на один токен
+CHARS_PER_TOKEN = 4
+
+# Максимальная длина краткого содержания старых шагов
+MAX_SUMMARY_CHARS = 4000
+
+_PLACEHOLDER_PREFIX = "[Скриншот шага"
+
+
+def _is_image_block(block):
+    """Проверяет, является ли блок содержимого изображением."""
+    return isinstance(block, dict) and block.get("type") == "image"
+
+
+def _screenshot_placeholder(step):
+    """Текст, которым заменяется старый скриншот."""
+    return f"{_PLACEHOLDER_PREFIX} {step} удален из истории для экономии контекста]"
+
+
+def estimate_tokens(content):
+    """
+    Грубо оценивает количество токенов содержимого сообщения: текст и JSON
+    по длине, изображения - фиксированной стоимостью.
+
+    Args:
+        content: Строка, блок или список блоков содержимого
+
+    Returns:
+        int: Оценка количества токенов
+    """
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + 1
+    if isinstance(content, list):
+        return sum(estimate_tokens(block) for block in content)
+    if _is_image_block(content):
+        return IMAGE_TOKENS
+    if isinstance(content, dict):
+        if content.get("type") == "tool_result":
+            return estimate_tokens(content.get("content") or "") + 10
+        if "screenshot" in content and len(str(content["screenshot"])) > 1000:
+            return IMAGE_TOKENS
+        return len(json.dumps(content, ensure_ascii=False)) // CHARS_PER_TOKEN + 1
+    return len(str(content)) // CHARS_PER_TOKEN + 1
+
+
+def summarize_turns(messages):
+    """
+    Составляет краткое содержание шагов без обращения к API: реплики
+    ассистента, вызванные инструменты и ошибки их выполнения.
+
+    Args:
+        messages (list): Сообщения истории
+
+    Returns:
+        list: Строки краткого содержания
+    """
+    lines = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        for block in content:
+            if not isinstance(block, dict):
+                continue
+            if block.get("type") == "text" and block.get("text", "").strip():
+                who = "Ассистент" if message["role"] == "assistant" else "Пользователь"
+                text = " ".join(block["text"].split())
+                lines.append(f"{who}: {text[:200]}")
+            elif block.get("type") == "tool_use":
+                arguments = json.dumps(block.get("input", {}), ensure_ascii=False)
+                lines.append(f"Инструмент {block.get('name')}: {arguments[:150]}")
+            elif block.get("type") == "tool_result":
+                result = block.get("content")
+                if block.get("is_error") or (isinstance(result, dict) and "error" in result):
+                    error = result.get("error") if isinstance(result, dict) else result
+                    lines.append(f"Ошибка инструмента: {str(error)[:150]}")
+    return lines
+
+
+class ConversationHistory:
+    """
+    История сообщений агента computer use с ограниченным размером запроса.
+
+    В полном виде хранятся только последние keep_screenshots скриншотов,
+    более старые заменяются короткими текстовыми заглушками - сразу пачкой
+    по elide_batch, чтобы префикс истории (и кэш промпта) менялся не на
+    каждом шаге. Когда оценка размера истории превышает token_budget,
+    старые шаги сворачиваются в краткое содержание, которое добавляется
+    к первому сообщению. Размер каждого запроса в байтах учитывается
+    для статистики сессии.
+    """
+
+    def __init__(self, keep_screenshots=3, token_budget=40000, keep_recent_turns=4, summarizer=summarize_turns,
+                 elide_batch=3):
+        """
+        Инициализирует историю.
+
+        Args:
+            keep_screenshots (int): Сколько последних скриншотов хранить полностью
+            token_budget (int): Оценка размера истории в токенах, после которой
+                старые шаги сворачиваются в краткое содержание
+            keep_recent_turns (int): Сколько последних ответов ассистента (с результатами
+                инструментов) никогда не сворачивается
+            summarizer (callable): Принимает сворачиваемые сообщения и возвращает строки
+                краткого содержания (по умолчанию - без обращения к API)
+            elide_batch (int): Сколько лишних скриншотов накапливается перед заменой заглушками
+        """
+        self.keep_screenshots = keep_screenshots
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.summarizer = summarizer
+        self.elide_batch = max(1, elide_batch)
+        self.messages = []
+        self.summary_lines = []
+        self.request_sizes = []
+        self.screenshots_elided = 0
+        self.turns_summarized = 0
+        self._screenshot_count = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add(self, role, content):
+        """
+        Добавляет сообщение и при необходимости сжимает историю.
+
+        Args:
+            role (str): "user" или "assistant"
+            content: Строка или список блоков содержимого
+        """
+        self.messages.append({"role": role, "content": content})
+        self._number_screenshots(content)
+        self._elide_old_screenshots()
+        if self.estimate_tokens() > self.token_budget:
+            self._summarize_old_turns()
+
+    def _screenshot_slots(self, content):
+        """
+        Находит скриншоты в содержимом сообщения.
+
+        Returns:
+            list: Пары (контейнер, ключ) - список блоков и индекс изображения
+                или словарь результата и ключ "screenshot"
+        """
+        slots = []
+        if isinstance(content, list):
+            for index, block in enumerate(content):
+                if _is_image_block(block):
+                    slots.append((content, index))
+                elif isinstance(block, dict) and block.get("type") == "tool_result":
+                    slots += self._screenshot_slots(block.get("content"))
+        elif (isinstance(content, dict) and isinstance(content.get("screenshot"), str)
+              and not content["screenshot"].startswith(_PLACEHOLDER_PREFIX)):
+            slots.append((content, "screenshot"))
+        return slots
+
+    def _number_screenshots(self, content):
+        """Запоминает номер шага каждого нового скриншота (для текста заглушки)."""
+        for container, key in self._screenshot_slots(content):
+            self._screenshot_count += 1
+            if isinstance(container, dict):
+                container.setdefault("_step", self._screenshot_count)
+            else:
+                container[key] = dict(container[key], _step=self._screenshot_count)
+
+    def _elide_old_screenshots(self):
+        """Заменяет заглушками все скриншоты, кроме последних keep_screenshots, когда лишних накопилось elide_batch."""
+        slots = [slot for message in self.messages for slot in self._screenshot_slots(message["content"])]
+        if len(slots) - self.keep_screenshots < self.elide_batch:
+            return
+        for container, key in slots[:max(0, len(slots) - self.keep_screenshots)]:
+            if isinstance(container, dict):
+                container[key] = _screenshot_placeholder(container.pop("_step", "?"))
+            else:
+                container[key] = {"type": "text", "text": _screenshot_placeholder(container[key].get("_step", "?"))}
+            self.screenshots_elided += 1
+
+    def _summarize_old_turns(self):
+        """
+        Сворачивает старые шаги в краткое содержание, оставляя первое сообщение
+        (задачу) и последние keep_recent_turns ответов ассистента. Граница
+        проходит перед ответом ассистента, поэтому каждый вызов инструмента
+        остается вместе со своим результатом.
+        """
+        assistant_indexes = [index for index, message in enumerate(self.messages)
+                             if index > 1 and message["role"] == "assistant"]
+        candidates = assistant_indexes[:max(0, len(assistant_indexes) - self.keep_recent_turns)]
+        if not candidates:
+            return
+        # Сворачиваем с запасом (до половины бюджета), чтобы не делать этого на каждом шаге
+        cut = candidates[-1]
+        for index in candidates:
+            if self.estimate_tokens(self.messages[index:]) <= self.token_budget // 2:
+                cut = index
+                break
+        folded = self.messages[1:cut]
+        self.summary_lines += self.summarizer(folded)
+        # Самые старые строки отбрасываются, краткое содержание не растет бесконечно
+        while len(self.summary_lines) > 1 and len("\n".join(self.summary_lines)) > MAX_SUMMARY_CHARS:
+            self.summary_lines.pop(0)
+        self.turns_summarized += sum(1 for message in folded if message["role"] == "assistant")
+        self.messages = self.messages[:1] + self.messages[cut:]
+        logger.info(f"История агента сжата: свернуто {len(folded)} сообщений, "
+                    f"оценка размера {self.estimate_tokens()} токенов")
+
+    def summary(self):
+        """Возвращает краткое содержание свернутых шагов."""
+        return "\n".join(self.summary_lines)
+
+    def estimate_tokens(self, messages=None):
+        """
+        Оценивает размер истории в токенах.
+
+        Args:
+            messages (list, optional): Сообщения (по умолчанию - вся история)
+
+        Returns:
+            int: Оценка количества токенов
+        """
+        messages = self.messages if messages is None else messages
+        return sum(estimate_tokens(message["content"]) for message in messages) + len(self.summary()) // CHARS_PER_TOKEN
+
+    def request_messages(self, cache_breakpoints=0):
+        """
+        Возвращает сообщения для запроса к API: краткое содержание свернутых
+        шагов добавляется к первому сообщению, служебные поля удаляются.
+
+        Args:
+            cache_breakpoints (int): Сколько последних сообщений пользователя отметить
+                точками кэширования промпта. Последняя точка записывает в кэш префикс
+                текущего запроса, предыдущая совпадает с точкой прошлого запроса
+                и позволяет прочитать его префикс из кэша.
+
+        Returns:
+            list: Сообщения в формате Messages API
+        """
+        messages = [{"role": message["role"], "content": self._clean(message["content"])} for message in self.messages]
+        summary = self.summary()
+        if summary and messages:
+            first = messages[0]["content"]
+            blocks = [{"type": "text", "text": first}] if isinstance(first, str) else list(first)
+            blocks.append({"type": "text", "text": f"Краткое содержание предыдущих шагов:\n{summary}"})
+            messages[0] = {"role": messages[0]["role"], "content": blocks}
+        if cache_breakpoints:
+            user_indexes = [index for index, message in enumerate(messages) if message["role"] == "user"]
+            for index in user_indexes[-cache_breakpoints:]:
+                messages[index] = self._with_cache_breakpoint(messages[index])
+        return messages
+
+    def _with_cache_breakpoint(self, message):
+        """Возвращает копию сообщения с точкой кэширования на последнем блоке."""
+        content = message["content"]
+        blocks = [{"type": "text", "text": content}] if isinstance(content, str) else list(content)
+        if not blocks:
+            return message
+        blocks[-1] = dict(blocks[-1], cache_control={"type": "ephemeral"})
+        return {"role": message["role"], "content": blocks}
+
+    def _clean(self, content):
+        """Убирает служебный номер шага из скриншотов."""
+        if isinstance(content, list):
+            return [self._clean(block) for block in content]
+        if isinstance(content, dict):
+            if "_step" in content:
+                content = {key: value for key, value in content.items() if key != "_step"}
+            if content.get("type") == "tool_result":
+                content = dict(content, content=self._clean(content.get("content")))
+            return content
+        return content
+
+    def record_request(self, size_bytes):
+        """
+        Учитывает размер отправленного запроса.
+
+        Args:
+            size_bytes (int): Размер тела запроса в байтах
+        """
+        self.request_sizes.append(size_bytes)
+
+    def stats(self):
+        """
+        Возвращает статистику истории за сессию.
+
+        Returns:
+            dict: Количество запросов, размеры последнего, максимального и среднего
+                запроса в байтах, удаленные скриншоты и свернутые шаги
+        """
+        sizes = self.request_sizes
+        return {
+            "requests": len(sizes),
+            "last_request_bytes": sizes[-1] if sizes else 0,
+            "max_request_bytes": max(sizes, default=0),
+            "avg_request_bytes": sum(sizes) / len(sizes) if sizes else 0,
+            "messages": len(self.messages),
+            "estimated_tokens": self.estimate_tokens(),
+            "screenshots_elided": self.screenshots_elided,
+            "turns_summarized": self.turns_summarized
+        }
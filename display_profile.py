@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import base64
+import logging
+from io import BytesIO
+import pyautogui
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Размеры, до которых рекомендуется уменьшать скриншоты для computer use:
+# XGA (4:3), WXGA (16:10), FWXGA (~16:9). Большие изображения API все равно
+# уменьшает сам, а точность координат модели на них падает
+RECOMMENDED_SIZES = [(1024, 768), (1280, 800), (1366, 768)]
+
+# Допустимое относительное искажение пропорций экрана при выборе рекомендуемого размера
+MAX_ASPECT_ERROR = 0.02
+
+# PNG с минимальным сжатием кодируется в несколько раз быстрее уровня по умолчанию
+PNG_COMPRESS_LEVEL = 1
+JPEG_QUALITY = 85
+
+
+def recommended_size(width, height):
+    """
+    Выбирает рекомендуемый размер с соотношением сторон, ближайшим к экрану.
+    Если ни один не подходит по пропорциям (например, широкоформатный экран),
+    экран уменьшается с сохранением пропорций до площади самого большого
+    рекомендуемого размера. Экран меньше рекомендуемых размеров не уменьшается.
+
+    Args:
+        width (int): Ширина экрана
+        height (int): Высота экрана
+
+    Returns:
+        tuple: (ширина, высота) объявляемого дисплея
+    """
+    aspect = width / height
+    candidates = [(w, h) for w, h in RECOMMENDED_SIZES if w <= width and h <= height]
+    if not candidates:
+        return width, height
+    best = min(candidates, key=lambda size: abs(size[0] / size[1] - aspect))
+    if abs(best[0] / best[1] - aspect) <= MAX_ASPECT_ERROR * aspect:
+        return best
+    max_pixels = max(w * h for w, h in RECOMMENDED_SIZES)
+    scale = min(1.0, (max_pixels / (width * height)) ** 0.5)
+    return int(width * scale), int(height * scale)
+
+
+class DisplayProfile:
+    """
+    Геометрия дисплея, объявляемого модели, и ее связь с реальным экраном.
+    Скриншот (на HiDPI-экранах он больше логического размера экрана)
+    уменьшается до объявленного размера, а координаты модели в объявленном
+    дисплее пересчитываются в координаты экрана для pyautogui.
+    """
+
+    def __init__(self, width=None, height=None, image_format="PNG"):
+        """
+        Инициализирует профиль по текущему размеру экрана.
+
+        Args:
+            width (int, optional): Ширина объявляемого дисплея (по умолчанию - рекомендуемая)
+            height (int, optional): Высота объявляемого дисплея (по умолчанию - рекомендуемая)
+            image_format (str): Формат скриншотов для модели: "PNG", "JPEG" или "WEBP"
+        """
+        self.screen_width, self.screen_height = pyautogui.size()
+        if width is None or height is None:
+            width, height = recommended_size(self.screen_width, self.screen_height)
+        self.width = width
+        self.height = height
+        self.image_format = image_format.upper()
+        self.screenshot_size = None
+        logger.info(f"Дисплей для модели {self.width}x{self.height}, "
+                    f"экран {self.screen_width}x{self.screen_height}")
+
+    def fit(self, screenshot):
+        """
+        Уменьшает скриншот до объявленного размера.
+
+        Args:
+            screenshot (PIL.Image): Скриншот экрана
+
+        Returns:
+            PIL.Image: Кадр объявленного размера
+        """
+        self.screenshot_size = screenshot.size
+        if screenshot.size != (self.width, self.height):
+            # reduce() на целый коэффициент быстрее и четче, чем один resize с большого HiDPI-скриншота
+            factor = min(screenshot.width // self.width, screenshot.height // self.height)
+            if factor > 1:
+                screenshot = screenshot.reduce(factor)
+            screenshot = screenshot.resize((self.width, self.height), Image.BILINEAR)
+        return screenshot
+
+    def encode(self, image):
+        """
+        Кодирует кадр (или его часть) в выбранном формате.
+
+        Args:
+            image (PIL.Image): Изображение
+
+        Returns:
+            str: Изображение в base64
+        """
+        buffered = BytesIO()
+        if self.image_format == "PNG":
+            image.save(buffered, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+        else:
+            image.convert("RGB").save(buffered, format=self.image_format, quality=JPEG_QUALITY)
+        return base64.b64encode(buffered.getvalue()).decode()
+
+    def encode_screenshot(self, screenshot):
+        """
+        Уменьшает скриншот до объявленного размера и кодирует его.
+
+        Args:
+            screenshot (PIL.Image): Скриншот экрана
+
+        Returns:
+            str: Изображение в base64
+        """
+        return self.encode(self.fit(screenshot))
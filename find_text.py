@@ -11,7 +11,7 @@ import time
 import glob
 import logging
 import random
-from memory_manager import MemoryManager
+from memory_manager import get_memory_manager, find_element_in_namespaces
 
 # Настройка логирования
 logging.basicConfig(
@@ -78,8 +78,8 @@ api_keys = load_api_keys()
 api_key = api_keys["openai"]  # OpenAI API ключ
 logger.info("API ключ OpenAI установлен")
 
-# Инициализация менеджера памяти
-memory_manager = MemoryManager()
+# Общий менеджер памяти процесса (бот и HTTP API используют тот же экземпляр)
+memory_manager = get_memory_manager()
 logger.info("Менеджер памяти инициализирован")
 
 # Пути к файлам
@@ -551,8 +551,61 @@ def find_text_recursively(img, screen_img_base64, search_text, test_folder, squa
     # Текст не найден в этой части изображения
     return None
 
-def find_text_on_image(img_path, search_text, context_info=None):
-    """Находит текст на изображении и возвращает его координаты"""
+def save_memory_result(img, search_text, context_info, screen_context, coordinates, description):
+    """Сохраняет в папке теста результат, найденный в памяти"""
+    # Создаем новые папки для текущего теста, чтобы сохранить результат
+    test_folder, squares_folder, test_num = create_test_folder()
+    
+    # Сохраняем информацию о тесте
+    info_path = os.path.join(test_folder, "info.txt")
+    with open(info_path, 'w') as f:
+        f.write(f"Поисковый запрос: {search_text}\n")
+        if context_info:
+            f.write(f"Контекстная информация: {context_info}\n")
+        f.write(f"Контекст скриншота: {screen_context}\n")
+        f.write(f"Результат: {description}\n")
+        f.write(f"Координаты: {coordinates}\n")
+        f.write(f"Соответствие: 100%\n")
+    
+    # Сохраняем результат
+    result_img = img.copy()
+    draw = ImageDraw.Draw(result_img)
+    x, y = coordinates
+    
+    # Рисуем перекрестие
+    draw.line((x-20, y, x+20, y), fill=(255, 0, 0), width=2)
+    draw.line((x, y-20, x, y+20), fill=(255, 0, 0), width=2)
+    
+    # Рисуем круг
+    draw.ellipse((x-30, y-30, x+30, y+30), outline=(255, 0, 0), width=2)
+    
+    # Добавляем текст
+    try:
+        font = ImageFont.truetype("arial.ttf", 20)
+    except IOError:
+        font = ImageFont.load_default()
+    
+    draw.text((x+40, y-10), f"{search_text}", fill=(255, 0, 0), font=font)
+    
+    # Сохраняем результат
+    result_path = os.path.join(test_folder, "result.png")
+    result_img.save(result_path)
+    logger.info(f"Результат сохранен в {result_path}")
+    
+    # Сохраняем координаты
+    coords_path = os.path.join(test_folder, "coordinates.txt")
+    with open(coords_path, 'w') as f:
+        f.write(f"{x},{y}")
+    logger.info(f"Координаты сохранены в {coords_path}")
+
+def find_text_on_image(img_path, search_text, context_info=None, namespace=None, search_other_namespaces=False):
+    """
+    Находит текст на изображении и возвращает его координаты.
+    namespace - пространство имен памяти (приложение или экран): память ищется
+    и сохраняется в нем. search_other_namespaces - явно включаемый запасной
+    вариант: при промахе проверить память остальных пространств имен.
+    """
+    memory_manager = get_memory_manager(namespace)
     
     # Проверяем, существует ли изображение
     if not os.path.exists(img_path):
@@ -563,6 +616,15 @@ def find_text_on_image(img_path, search_text, context_info=None):
     img = Image.open(img_path)
     screen_img_base64 = image_to_base64(img)
     
+    # Если экран почти совпадает с экраном, на котором элемент уже находили,
+    # берем координаты из памяти без запросов к API
+    coordinates = memory_manager.find_element_on_same_screen(search_text, img, context_info)
+    if coordinates:
+        logger.info(f"Элемент '{search_text}' найден в памяти на том же экране: {coordinates}")
+        save_memory_result(img, search_text, context_info, "не анализировался (экран совпал с сохраненным)",
+                           coordinates, "Найден из памяти по совпадению экрана.")
+        return coordinates
+    
     # Анализируем общий контекст скриншота для более интеллектуального поиска
     logger.info(f"Анализируем контекст скриншота для поиска '{search_text}'")
     screen_context = analyze_screen_context(screen_img_base64)
@@ -570,62 +632,20 @@ def find_text_on_image(img_path, search_text, context_info=None):
     
     # Сначала проверяем в памяти, есть ли этот элемент с учетом контекста экрана
     logger.info(f"Выполняем интеллектуальный поиск элемента '{search_text}' в памяти")
-    memory_result = memory_manager.find_element_by_text(
+    memory_result = find_element_in_namespaces(
         search_text=search_text,
         screen_context=screen_context,
+        namespace=namespace,
         context_info=context_info,
-        check_visually=True
+        check_visually=True,
+        search_other_namespaces=search_other_namespaces
     )
     
     # Если элемент найден в памяти и подтвержден визуально
     if memory_result["coordinates"]:
         logger.info(f"Элемент '{search_text}' найден в памяти и подтвержден визуально: {memory_result['coordinates']}")
-        # Создаем новые папки для текущего теста, чтобы сохранить результат
-        test_folder, squares_folder, test_num = create_test_folder()
-        
-        # Сохраняем информацию о тесте
-        info_path = os.path.join(test_folder, "info.txt")
-        with open(info_path, 'w') as f:
-            f.write(f"Поисковый запрос: {search_text}\n")
-            if context_info:
-                f.write(f"Контекстная информация: {context_info}\n")
-            f.write(f"Контекст скриншота: {screen_context}\n")
-            f.write(f"Результат: Найден из памяти с использованием контекста.\n")
-            f.write(f"Координаты: {memory_result['coordinates']}\n")
-            f.write(f"Соответствие: 100%\n")
-        
-        # Сохраняем результат
-        width, height = img.size
-        result_img = img.copy()
-        draw = ImageDraw.Draw(result_img)
-        x, y = memory_result['coordinates']
-        
-        # Рисуем перекрестие
-        draw.line((x-20, y, x+20, y), fill=(255, 0, 0), width=2)
-        draw.line((x, y-20, x, y+20), fill=(255, 0, 0), width=2)
-        
-        # Рисуем круг
-        draw.ellipse((x-30, y-30, x+30, y+30), outline=(255, 0, 0), width=2)
-        
-        # Добавляем текст
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except IOError:
-            font = ImageFont.load_default()
-        
-        draw.text((x+40, y-10), f"{search_text}", fill=(255, 0, 0), font=font)
-        
-        # Сохраняем результат
-        result_path = os.path.join(test_folder, "result.png")
-        result_img.save(result_path)
-        logger.info(f"Результат сохранен в {result_path}")
-        
-        # Сохраняем координаты
-        coords_path = os.path.join(test_folder, "coordinates.txt")
-        with open(coords_path, 'w') as f:
-            f.write(f"{x},{y}")
-        logger.info(f"Координаты сохранены в {coords_path}")
-        
+        save_memory_result(img, search_text, context_info, screen_context, memory_result['coordinates'],
+                           "Найден из памяти с использованием контекста.")
         return memory_result['coordinates']
     else:
         logger.info(f"Элемент '{search_text}' не найден в памяти или не подтвержден визуально. Выполняем полный поиск.")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+import math
+import logging
+from screen_hash import SAME_SCREEN_DISTANCE, hash_from_hex, hamming_distance
+
+logger = logging.getLogger(__name__)
+
+
+class LocationClusterer:
+    """
+    Кластеры местоположений элемента памяти. Близкие позиции на экране того же
+    размера объединяются в один кластер; у кластера есть центр, недавние хеши
+    экранов и счетчики подтверждений и промахов. При поиске первым проверяется
+    самый вероятный кластер, а чередующиеся раскладки (например, два размера
+    окна) сохраняют каждая свой кластер.
+
+    Кластеры хранятся в поле "clusters" элемента, номер кластера - в поле
+    "cluster" местоположения.
+    """
+
+    def __init__(self, radius=24, max_screen_hashes=4):
+        """
+        Инициализирует кластеризацию.
+
+        Args:
+            radius (int): Расстояние в пикселях, в пределах которого позиции относятся к одному кластеру
+            max_screen_hashes (int): Сколько последних хешей экранов хранить в кластере
+        """
+        self.radius = radius
+        self.max_screen_hashes = max_screen_hashes
+
+    def _find_cluster(self, clusters, location):
+        """Находит кластер, к которому относится позиция местоположения."""
+        screen_size = list(location["screen_size"])
+        x, y = location["coordinates"]
+        best_cluster = None
+        best_distance = self.radius
+        for cluster in clusters:
+            if cluster["screen_size"] != screen_size:
+                continue
+            distance = math.hypot(x - cluster["center"][0], y - cluster["center"][1])
+            if distance <= best_distance:
+                best_cluster, best_distance = cluster, distance
+        return best_cluster
+
+    def _add_location(self, clusters, location):
+        """Относит местоположение к кластеру (или создает новый) без учета подтверждения."""
+        cluster = self._find_cluster(clusters, location)
+        if cluster is None:
+            cluster = {
+                "id": max((cluster["id"] for cluster in clusters), default=0) + 1,
+                "center": [float(value) for value in location["coordinates"]],
+                "screen_size": list(location["screen_size"]),
+                "screen_hashes": [],
+                "count": 0,
+                "hits": 0,
+                "misses": 0,
+                "last_hit": 0
+            }
+            clusters.append(cluster)
+        else:
+            # Центр - среднее всех позиций кластера
+            count = cluster["count"] + 1
+            cluster["center"] = [center + (value - center) / count
+                                 for center, value in zip(cluster["center"], location["coordinates"])]
+
+        cluster["count"] += 1
+        screen_hash = location.get("screen_hash")
+        if screen_hash and hash_from_hex(screen_hash) is not None:
+            hashes = [value for value in cluster["screen_hashes"] if value != screen_hash]
+            cluster["screen_hashes"] = ([screen_hash] + hashes)[:self.max_screen_hashes]
+        location["cluster"] = cluster["id"]
+        return cluster
+
+    def ensure(self, element):
+        """
+        Строит кластеры элемента, сохраненного до появления кластеров.
+        Каждое местоположение считается одним подтверждением своего кластера.
+
+        Args:
+            element (dict): Элемент памяти
+
+        Returns:
+            list: Кластеры элемента
+        """
+        if "clusters" in element:
+            return element["clusters"]
+        clusters = []
+        # От старых местоположений к новым, чтобы хеши экранов шли от новых к старым
+        for location in reversed(element.get("locations", [])):
+            if not location.get("coordinates") or not location.get("screen_size"):
+                continue
+            cluster = self._add_location(clusters, location)
+            cluster["hits"] += 1
+            cluster["last_hit"] = max(cluster["last_hit"], location.get("timestamp") or 0)
+        element["clusters"] = clusters
+        return clusters
+
+    def assign(self, element, location, timestamp):
+        """
+        Относит новое подтвержденное местоположение к кластеру элемента.
+
+        Args:
+            element (dict): Элемент памяти
+            location (dict): Новое местоположение (еще не добавленное в список местоположений)
+            timestamp (int): Время нахождения
+
+        Returns:
+            dict: Кластер местоположения
+        """
+        cluster = self._add_location(self.ensure(element), location)
+        cluster["hits"] += 1
+        cluster["last_hit"] = timestamp
+        return cluster
+
+    def record(self, element, outcomes, timestamp):
+        """
+        Учитывает результаты проверки кластеров.
+
+        Args:
+            element (dict): Элемент памяти
+            outcomes (dict): ID кластера -> True (элемент подтвержден) или False (промах)
+            timestamp (int): Время проверки
+
+        Returns:
+            bool: True если какой-либо кластер изменился
+        """
+        changed = False
+        for cluster in self.ensure(element):
+            hit = outcomes.get(cluster["id"])
+            if hit is None:
+                continue
+            if hit:
+                cluster["hits"] += 1
+                cluster["last_hit"] = timestamp
+            else:
+                cluster["misses"] += 1
+            changed = True
+        return changed
+
+    def probability(self, cluster):
+        """Оценка вероятности подтверждения кластера (со сглаживанием Лапласа)."""
+        return (cluster["hits"] + 1) / (cluster["hits"] + cluster["misses"] + 2)
+
+    def rank(self, element, screen_size=None, screen_hash=None):
+        """
+        Сортирует кластеры элемента от самого вероятного к наименее вероятному:
+        сначала кластеры, сохраненные на похожем экране, затем на экране того же
+        размера, затем по вероятности подтверждения и давности.
+
+        Args:
+            element (dict): Элемент памяти
+            screen_size (tuple, optional): Размер текущего экрана
+            screen_hash (int, optional): pHash текущего экрана
+
+        Returns:
+            list: Пары (кластер, расстояние до похожего экрана или None)
+        """
+        screen_size = list(screen_size) if screen_size else None
+        ranked = []
+        for cluster in self.ensure(element):
+            distance = None
+            if screen_hash is not None:
+                distances = [hamming_distance(screen_hash, value) for value in
+                             (hash_from_hex(text) for text in cluster["screen_hashes"]) if value is not None]
+                if distances and min(distances) <= SAME_SCREEN_DISTANCE:
+                    distance = min(distances)
+            key = (
+                distance if distance is not None else SAME_SCREEN_DISTANCE + 1,
+                0 if screen_size is None or cluster["screen_size"] == screen_size else 1,
+                -self.probability(cluster),
+                -cluster["last_hit"]
+            )
+            ranked.append((key, cluster, distance))
+        ranked.sort(key=lambda item: item[0])
+        return [(cluster, distance) for _, cluster, distance in ranked]
+
+    def representative(self, element, cluster_id, require_screenshot=False):
+        """
+        Возвращает самое недавнее местоположение кластера.
+
+        Args:
+            element (dict): Элемент памяти
+            cluster_id (int): ID кластера
+            require_screenshot (bool): Только местоположения с изображением элемента
+
+        Returns:
+            dict или None: Местоположение
+        """
+        for location in element.get("locations", []):
+            if location.get("cluster") != cluster_id:
+                continue
+            if require_screenshot and not location.get("screenshot"):
+                continue
+            return location
+        return None
+
+    def select_kept(self, element, max_locations):
+        """
+        Выбирает местоположения, которые остаются после обрезки: сначала самое
+        недавнее местоположение каждого кластера (от вероятных к маловероятным),
+        затем остальные по давности. Кластеры без местоположений удаляются.
+
+        Args:
+            element (dict): Элемент памяти
+            max_locations (int): Максимальное количество местоположений
+
+        Returns:
+            tuple: (оставшиеся местоположения в прежнем порядке, удаленные местоположения)
+        """
+        locations = element.get("locations", [])
+        if len(locations) <= max_locations:
+            return locations, []
+        kept = set()
+        for cluster, _ in self.rank(element):
+            if len(kept) >= max_locations:
+                break
+            for index, location in enumerate(locations):
+                if location.get("cluster") == cluster["id"]:
+                    kept.add(index)
+                    break
+        for index in range(len(locations)):
+            if len(kept) >= max_locations:
+                break
+            kept.add(index)
+
+        kept_locations = [location for index, location in enumerate(locations) if index in kept]
+        dropped = [location for index, location in enumerate(locations) if index not in kept]
+        live_clusters = {location.get("cluster") for location in kept_locations}
+        element["clusters"] = [cluster for cluster in element["clusters"] if cluster["id"] in live_clusters]
+        return kept_locations, dropped
@@ -5,6 +5,7 @@ import time
 import sys
 from robot_controller import AnthropicComputerController
 from find_element import find_element_on_image
+from agent_loop import format_step
 
 def main():
     # Ініціалізація контролера
@@ -71,7 +72,10 @@ def main():
                     prompt = "Це демонстрація можливостей API для керування комп'ютером."
                 
                 print(f"Надсилаємо запит до Anthropic API зі знайденими координатами ({x}, {y})...")
-                response = controller.send_to_anthropic(prompt, add_coordinate=(x, y))
+                response = controller.send_to_anthropic(
+                    prompt, add_coordinate=(x, y),
+                    on_step=lambda step, response: print(format_step(step))
+                )
                 
                 if response:
                     print("Запит до Anthropic API виконано успішно")
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк запуска системы памяти.
+
+Создает во временной директории память из 1k, 10k и 100k синтетических
+элементов и измеряет:
+  - запуск MemoryManager без снимка индекса и первый текстовый поиск
+    (индексы строятся по хранилищу);
+  - запуск со снимком индекса и первый текстовый поиск;
+  - для сравнения - запуск с JSON хранилищем (полный разбор файла).
+
+С ключом --stress вместо измерений запуска выполняется нагрузочная проверка
+потокобезопасности: несколько потоков одновременно сохраняют, ищут, изменяют
+и удаляют элементы одного MemoryManager, после чего проверяется, что не было
+ошибок, а хранилище, индексы и скриншоты согласованы.
+
+Пример:
+    python memory_benchmark.py --sizes 1000 10000 100000
+    python memory_benchmark.py --stress --threads 8 --duration 10
+"""
+
+import os
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+from PIL import Image, ImageDraw
+from memory_manager import MemoryManager
+from memory_eviction import EvictionPolicy
+from memory_storage import SqliteMemoryStorage
+
+WORDS = ["Save", "Open", "File", "Edit", "View", "Submit", "Cancel", "Settings", "Profile",
+         "Search", "Help", "Close", "Сохранить", "Открыть", "Настройки", "Поиск", "Отмена", "Войти"]
+
+
+def generate_elements(count, seed=0):
+    """
+    Генерирует синтетические элементы памяти с двумя местоположениями.
+
+    Args:
+        count (int): Количество элементов
+        seed (int): Начальное значение генератора
+
+    Returns:
+        generator: Элементы памяти
+    """
+    rnd = random.Random(seed)
+    now = int(time.time())
+    for i in range(count):
+        search_text = f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} {i}"
+        locations = []
+        for _ in range(2):
+            x, y = rnd.randrange(1920), rnd.randrange(1080)
+            locations.append({
+                "coordinates": [x, y],
+                "screen_size": [1920, 1080],
+                "element_rect": [x - 40, y - 15, 80, 30],
+                "match_percentage": 90,
+                "timestamp": now,
+                "screen_hash": f"{rnd.getrandbits(64):016x}",
+                "screenshot": None
+            })
+        yield {
+            "id": f"{i:032x}",
+            "search_text": search_text,
+            "context_info": "",
+            "screen_context": f"Окно приложения {i % 200} с главным меню и панелью инструментов",
+            "created": now,
+            "last_found": now,
+            "locations": locations,
+            "success_count": 1,
+            "total_searches": 1,
+            "success_rate": 1.0
+        }
+
+
+def _open(memory_file, directory):
+    """Открывает менеджер памяти без фонового вытеснения."""
+    return MemoryManager(memory_file=memory_file, eviction_interval=0,
+                         screenshots_dir=os.path.join(directory, "screenshots"))
+
+
+def measure_startup(memory_file, directory):
+    """
+    Измеряет запуск менеджера памяти и первый текстовый поиск.
+
+    Returns:
+        tuple: (время запуска, время первого поиска) в секундах
+    """
+    started = time.perf_counter()
+    manager = _open(memory_file, directory)
+    startup = time.perf_counter() - started
+    started = time.perf_counter()
+    manager.text_index.search("Настройки Save")
+    first_search = time.perf_counter() - started
+    manager.close()
+    return startup, first_search
+
+
+def run(count, directory):
+    """
+    Выполняет бенчмарк для памяти из count элементов.
+
+    Returns:
+        dict: Результаты измерений в секундах
+    """
+    memory_file = os.path.join(directory, f"memory_{count}.db")
+    storage = SqliteMemoryStorage(memory_file)
+    storage.put_many(generate_elements(count))
+    storage.close()
+
+    results = {}
+    results["cold_startup"], results["cold_first_search"] = measure_startup(memory_file, directory)
+    results["snapshot_startup"], results["snapshot_first_search"] = measure_startup(memory_file, directory)
+
+    json_file = os.path.join(directory, f"memory_{count}.json")
+    manager = _open(memory_file, directory)
+    manager.export_json(json_file)
+    manager.close()
+    results["json_startup"], results["json_first_search"] = measure_startup(json_file, directory)
+    return results
+
+
+class _ErrorCounter(logging.Handler):
+    """Считает сообщения об ошибках, записанные в лог во время нагрузочной проверки."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def generate_screens(directory, count=4, size=(640, 400), seed=0):
+    """
+    Рисует синтетические экраны с кнопками и сохраняет их в PNG.
+
+    Args:
+        directory (str): Директория для файлов
+        count (int): Количество экранов
+        size (tuple): Размер экрана
+        seed (int): Начальное значение генератора
+
+    Returns:
+        list: Кортежи (путь к файлу, изображение, список пар (текст кнопки, прямоугольник))
+    """
+    rnd = random.Random(seed)
+    screens = []
+    for number in range(count):
+        image = Image.new("RGB", size, (rnd.randrange(200, 256),) * 3)
+        draw = ImageDraw.Draw(image)
+        buttons = []
+        for button in range(6):
+            x, y = rnd.randrange(10, size[0] - 130), rnd.randrange(10, size[1] - 50)
+            rect = (x, y, 120, 40)
+            color = tuple(rnd.randrange(256) for _ in range(3))
+            draw.rectangle((x, y, x + 119, y + 39), fill=color, outline=(0, 0, 0))
+            # Полосы делают изображение кнопки различимым при сопоставлении шаблонов
+            for line in range(3):
+                offset = rnd.randrange(5, 110)
+                draw.line((x + offset, y + 5, x + offset, y + 34), fill=(0, 0, 0), width=2)
+            buttons.append((f"{rnd.choice(WORDS)} {number}-{button}", rect))
+        path = os.path.join(directory, f"screen_{number}.png")
+        image.save(path)
+        screens.append((path, image, buttons))
+    return screens
+
+
+def stress(directory, threads=8, duration=5.0, seed=0):
+    """
+    Нагрузочная проверка: потоки одновременно сохраняют, ищут, изменяют
+    и удаляют элементы одного менеджера памяти.
+
+    Args:
+        directory (str): Рабочая директория
+        threads (int): Количество потоков
+        duration (float): Длительность в секундах
+        seed (int): Начальное значение генератора
+
+    Returns:
+        dict: Количество операций, ошибки и найденные несоответствия
+    """
+    screens = generate_screens(directory, seed=seed)
+    # Небольшой бюджет, чтобы фоновое вытеснение работало одновременно с остальными потоками
+    manager = MemoryManager(memory_file=os.path.join(directory, "memory_stress.db"),
+                            eviction_policy=EvictionPolicy(max_elements=20), eviction_interval=0.2,
+                            screenshots_dir=os.path.join(directory, "screenshots"))
+    errors = _ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    operations = {}
+    operations_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(number):
+        rnd = random.Random(seed + number)
+        counts = {}
+        while time.perf_counter() < deadline:
+            screen = rnd.randrange(len(screens))
+            path, image, buttons = screens[screen]
+            text, rect = rnd.choice(buttons)
+            context = f"Окно приложения {screen} с главным меню"
+            operation = rnd.choice(("save", "save", "find", "find", "context", "similar", "update", "remove", "clean"))
+            try:
+                if operation == "save":
+                    center = (rect[0] + rect[2] // 2, rect[1] + rect[3] // 2)
+                    manager.save_element(text, center, 90, screen_context=context, element_rect=rect,
+                                         screen_size=image.size, screenshot_path=path)
+                elif operation == "find":
+                    manager.find_element_on_same_screen(text, image)
+                elif operation == "context":
+                    manager.find_elements_by_context(context)
+                elif operation == "similar":
+                    manager.find_similar_screens(image)
+                elif operation == "update":
+                    manager.update_element(manager._generate_element_id(text), new_context_info="")
+                elif operation == "remove":
+                    manager.remove_element(manager._generate_element_id(text))
+                else:
+                    manager.clean_old_entries(max_age_days=0, min_success_rate=0.5)
+            except Exception as e:
+                errors.messages.append(f"{operation}: {e!r}")
+            counts[operation] = counts.get(operation, 0) + 1
+        with operations_lock:
+            for operation, count in counts.items():
+                operations[operation] = operations.get(operation, 0) + count
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    try:
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        manager.enforce_budgets()
+
+        # Хранилище, индексы и скриншоты должны описывать одни и те же элементы
+        problems = []
+        elements = manager.storage.all()
+        if len(manager.text_index) != len(elements):
+            problems.append(f"текстовый индекс: {len(manager.text_index)} элементов, хранилище: {len(elements)}")
+        for element in elements:
+            if not any(element_id == element["id"] for element_id, _ in
+                       manager.text_index.search(element["search_text"], limit=len(elements))):
+                problems.append(f"элемент {element['search_text']!r} не найден текстовым поиском")
+            for location in element["locations"]:
+                key = location.get("screenshot")
+                if key and (key not in manager.blobs or not manager.verifier.load_template(key)):
+                    problems.append(f"нет скриншота {key} элемента {element['search_text']!r}")
+    finally:
+        logging.getLogger().removeHandler(errors)
+        manager.close()
+    return {"operations": operations, "errors": errors.messages, "problems": problems, "elements": len(elements)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска системы памяти")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Количество элементов памяти")
+    parser.add_argument("--dir", help="Рабочая директория (по умолчанию - временная)")
+    parser.add_argument("--stress", action="store_true", help="Нагрузочная проверка потокобезопасности")
+    parser.add_argument("--threads", type=int, default=8, help="Количество потоков для --stress")
+    parser.add_argument("--duration", type=float, default=5.0, help="Длительность --stress в секундах")
+    args = parser.parse_args()
+
+    # Сообщения о загрузке и сохранении не должны влиять на измерения
+    logging.getLogger().setLevel(logging.WARNING)
+
+    directory = args.dir or tempfile.mkdtemp(prefix="memory_benchmark_")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        if args.stress:
+            results = stress(directory, args.threads, args.duration)
+            total = sum(results["operations"].values())
+            print(f"Операций: {total} ({', '.join(f'{name}: {count}' for name, count in sorted(results['operations'].items()))}), "
+                  f"элементов в конце: {results['elements']}")
+            for message in results["errors"] + results["problems"]:
+                print(f"  {message}")
+            print("Ошибок нет, память согласована" if not results["errors"] and not results["problems"] else
+                  f"Ошибок: {len(results['errors'])}, несоответствий: {len(results['problems'])}")
+            return
+        print(f"{'элементов':>10} | {'запуск':>8} | {'поиск':>8} | {'запуск (снимок)':>15} | "
+              f"{'поиск (снимок)':>14} | {'запуск (JSON)':>13}")
+        for count in args.sizes:
+            results = run(count, directory)
+            print(f"{count:>10} | {results['cold_startup']:>7.3f}с | {results['cold_first_search']:>7.3f}с | "
+                  f"{results['snapshot_startup']:>14.3f}с | {results['snapshot_first_search']:>13.3f}с | "
+                  f"{results['json_startup']:>12.3f}с")
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
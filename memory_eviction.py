@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+import math
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class EvictionPolicy:
+    """
+    Политика вытеснения элементов памяти по бюджетам количества элементов,
+    местоположений и байтов скриншотов. Приоритет элемента сочетает давность
+    последнего нахождения (LRU), частоту успешных поисков (LFU) и коэффициент
+    успеха; первыми вытесняются элементы с наименьшим приоритетом.
+    """
+
+    def __init__(self, max_elements=5000, max_locations=20000, max_blob_bytes=200 * 1024 * 1024,
+                 half_life_days=14.0, batch_size=50, ghost_size=1000):
+        """
+        Инициализирует политику.
+
+        Args:
+            max_elements (int, optional): Бюджет количества элементов (None - без ограничения)
+            max_locations (int, optional): Бюджет количества местоположений (None - без ограничения)
+            max_blob_bytes (int, optional): Бюджет размера скриншотов в байтах (None - без ограничения)
+            half_life_days (float): Через сколько дней без нахождения вклад давности падает вдвое
+            batch_size (int): Сколько элементов обрабатывается за один проход
+            ghost_size (int): Сколько ID вытесненных элементов помнить для оценки промахов
+        """
+        self.max_elements = max_elements
+        self.max_locations = max_locations
+        self.max_blob_bytes = max_blob_bytes
+        self.half_life_days = half_life_days
+        self.batch_size = batch_size
+        self.ghost_size = ghost_size
+        self._ghosts = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            "evicted_elements": 0,
+            "trimmed_locations": 0,
+            "freed_bytes": 0,
+            "runs": 0,
+            "lookups": 0,
+            "hits": 0,
+            "ghost_hits": 0
+        }
+
+    def priority(self, summary, now):
+        """
+        Вычисляет приоритет элемента (чем меньше, тем раньше вытесняется).
+
+        Args:
+            summary (dict): Статистика элемента (last_found, success_count, success_rate)
+            now (int): Текущее время в секундах
+
+        Returns:
+            float: Приоритет
+        """
+        age_days = max(0, now - summary["last_found"]) / 86400.0
+        recency = 0.5 ** (age_days / self.half_life_days)
+        frequency = 1.0 + math.log1p(summary["success_count"])
+        return recency * frequency * (0.5 + summary["success_rate"])
+
+    def rank(self, summaries, now):
+        """
+        Сортирует элементы от первого кандидата на вытеснение к последнему.
+
+        Args:
+            summaries (list): Статистика элементов
+            now (int): Текущее время в секундах
+
+        Returns:
+            list: Статистика элементов по возрастанию приоритета
+        """
+        return sorted(summaries, key=lambda summary: self.priority(summary, now))
+
+    def over_budget(self, element_count, location_count, blob_bytes):
+        """
+        Проверяет, превышен ли какой-либо бюджет.
+
+        Returns:
+            bool: True если нужно вытеснение
+        """
+        return ((self.max_elements is not None and element_count > self.max_elements) or
+                (self.max_locations is not None and location_count > self.max_locations) or
+                (self.max_blob_bytes is not None and blob_bytes > self.max_blob_bytes))
+
+    def excess_locations(self, location_count):
+        """Возвращает, на сколько превышен бюджет местоположений."""
+        if self.max_locations is None:
+            return 0
+        return max(0, location_count - self.max_locations)
+
+    def record_eviction(self, element_ids, trimmed_locations, freed_bytes):
+        """
+        Учитывает результат прохода вытеснения.
+
+        Args:
+            element_ids (list): ID вытесненных элементов
+            trimmed_locations (int): Сколько местоположений удалено у оставшихся элементов
+            freed_bytes (int): Сколько байтов скриншотов освобождено
+        """
+        with self._lock:
+            self.counters["runs"] += 1
+            self.counters["evicted_elements"] += len(element_ids)
+            self.counters["trimmed_locations"] += trimmed_locations
+            self.counters["freed_bytes"] += freed_bytes
+            for element_id in element_ids:
+                self._ghosts[element_id] = True
+                self._ghosts.move_to_end(element_id)
+            while len(self._ghosts) > self.ghost_size:
+                self._ghosts.popitem(last=False)
+
+    def record_lookup(self, element_id, hit):
+        """
+        Учитывает поиск в памяти. Промах по недавно вытесненному элементу
+        считается промахом из-за вытеснения.
+
+        Args:
+            element_id (str): ID искомого элемента
+            hit (bool): Найден ли элемент в памяти
+        """
+        with self._lock:
+            self.counters["lookups"] += 1
+            if hit:
+                self.counters["hits"] += 1
+            elif element_id in self._ghosts:
+                self.counters["ghost_hits"] += 1
+                del self._ghosts[element_id]
+
+    def stats(self):
+        """
+        Возвращает счетчики вытеснения и влияние на долю попаданий.
+
+        Returns:
+            dict: Счетчики, hit_rate и hit_rate_without_eviction
+        """
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["lookups"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        # Доля попаданий, если бы вытесненные элементы остались в памяти
+        stats["hit_rate_without_eviction"] = (stats["hits"] + stats["ghost_hits"]) / lookups if lookups else 0.0
+        stats["budgets"] = {
+            "max_elements": self.max_elements,
+            "max_locations": self.max_locations,
+            "max_blob_bytes": self.max_blob_bytes
+        }
+        return stats
+
+
+class EvictionWorker:
+    """
+    Фоновый поток, который периодически (и после сохранения элементов)
+    выполняет проход вытеснения, пока бюджеты превышены.
+    """
+
+    def __init__(self, run_once, interval=60.0):
+        """
+        Запускает фоновый поток.
+
+        Args:
+            run_once (callable): Один проход вытеснения; возвращает True, если работа осталась
+            interval (float): Период проверки бюджетов в секундах
+        """
+        self.run_once = run_once
+        self.interval = interval
+        self._wake_event = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="memory-eviction", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """
+        Просит поток проверить бюджеты без ожидания периода.
+        """
+        self._wake_event.set()
+
+    def _loop(self):
+        """Фоновый поток: ждет периода или пробуждения и вытесняет порциями."""
+        while not self._closed.is_set():
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+            if self._closed.is_set():
+                break
+            try:
+                # Порции обрабатываются подряд, пока бюджеты превышены
+                while self.run_once() and not self._closed.is_set():
+                    pass
+            except Exception as e:
+                logger.error(f"Ошибка при вытеснении элементов памяти: {str(e)}")
+
+    def stop(self):
+        """
+        Останавливает фоновый поток.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._wake_event.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 
 import os
-import json
 import time
-import datetime
+import atexit
 import logging
+import threading
 import hashlib
 from PIL import Image, ImageDraw
 import pyautogui
-import numpy as np
+from memory_storage import JsonMemoryStorage, SqliteMemoryStorage, export_to_json
+from memory_snapshot import IndexSnapshot
+from text_index import TrigramTextIndex
+from context_index import ContextVectorIndex
+from screen_hash import ScreenHashIndex, SAME_SCREEN_DISTANCE, phash, hash_to_hex, hash_from_hex, hamming_distance
+from template_matching import TemplateVerifier
+from blob_store import BlobStore
+from memory_eviction import EvictionPolicy, EvictionWorker
+from location_clusters import LocationClusterer
+from rw_lock import ReadWriteLock
+from memory_namespaces import DEFAULT_NAMESPACE, namespace_key, namespace_paths, list_namespaces
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,97 +37,330 @@ class MemoryManager:
     Сохраняет информацию о найденных элементах и их координатах для быстрого повторного использования.
     """
 
-    def __init__(self, memory_file=None):
+    # Сколько лучших совпадений по тексту рассматривается в find_element_by_text
+    text_match_limit = 10
+    
+    # Для скольких лучших кандидатов выполняется поиск сдвинувшегося элемента
+    relocation_limit = 3
+
+    def __init__(self, memory_file=None, backend=None, flush_interval=2.0, eviction_policy=None, eviction_interval=60.0,
+                 screenshots_dir=None, namespace=None):
         """
         Инициализирует менеджер памяти.
         
         Args:
             memory_file (str, optional): Путь к файлу для хранения памяти. 
-                По умолчанию - 'search_memory.json' в рабочей директории.
+                По умолчанию - 'search_memory.db' в рабочей директории.
+            backend (str, optional): Тип хранилища: "sqlite" или "json".
+                По умолчанию определяется по расширению memory_file, иначе "sqlite".
+            flush_interval (float): Для JSON хранилища - окно в секундах, за которое
+                изменения объединяются в одну фоновую запись файла (0 - писать сразу).
+            eviction_policy (EvictionPolicy, optional): Бюджеты и политика автоматического
+                вытеснения. По умолчанию - EvictionPolicy() с бюджетами по умолчанию.
+            eviction_interval (float): Период фоновой проверки бюджетов в секундах
+                (0 - без фонового потока, только явный вызов enforce_budgets).
+            screenshots_dir (str, optional): Директория хранилища скриншотов элементов.
+                По умолчанию - 'memory_screenshots' в рабочей директории.
+            namespace (str, optional): Пространство имен памяти (приложение или экран).
+                У каждого пространства свои файлы памяти, индексы и скриншоты
+                в memory_namespaces/<имя>; по умолчанию - прежняя общая память.
         """
         self.working_dir = os.path.dirname(os.path.abspath(__file__))
+        self.namespace = namespace_key(namespace)
+        namespace_file, namespace_screenshots_dir = namespace_paths(self.working_dir, namespace)
+        if namespace_file:
+            os.makedirs(os.path.dirname(namespace_file), exist_ok=True)
+            memory_file = memory_file or namespace_file
+            screenshots_dir = screenshots_dir or namespace_screenshots_dir
+        if backend is None:
+            backend = "json" if memory_file and memory_file.endswith(".json") else "sqlite"
+        if backend not in ("sqlite", "json"):
+            raise ValueError(f"Неизвестный тип хранилища памяти: {backend}")
+        self.backend = backend
+        
         if memory_file:
             self.memory_file = memory_file
+        elif backend == "sqlite":
+            self.memory_file = os.path.join(self.working_dir, 'search_memory.db')
         else:
             self.memory_file = os.path.join(self.working_dir, 'search_memory.json')
         
-        # Создаем директорию для хранения скриншотов памяти
-        self.screenshots_dir = os.path.join(self.working_dir, 'memory_screenshots')
-        os.makedirs(self.screenshots_dir, exist_ok=True)
+        # Старый JSON файл памяти, из которого выполняется однократная миграция:
+        # рядом с базой и с тем же именем (search_memory.db <- search_memory.json),
+        # поэтому база с другим именем не получает чужую общую память
+        legacy_json_file = os.path.splitext(self.memory_file)[0] + '.json'
+        
+        # Скриншоты элементов хранятся в сегментах с адресацией по содержимому
+        self.screenshots_dir = screenshots_dir or os.path.join(self.working_dir, 'memory_screenshots')
+        self.blobs = BlobStore(self.screenshots_dir)
+        
+        # Пакетная проверка шаблонов элементов на скриншоте
+        # (признаки шаблонов хранятся рядом с файлом памяти)
+        self.verifier = TemplateVerifier(self._load_screenshot, self.memory_file + ".templates.npy")
+        
+        # Открываем хранилище (при первом запуске SQLite переносим данные из JSON;
+        # старая память целиком относится к пространству имен по умолчанию)
+        if backend == "sqlite":
+            migrate_from = legacy_json_file if self.namespace == DEFAULT_NAMESPACE else None
+            self.storage = SqliteMemoryStorage(self.memory_file, migrate_from=migrate_from)
+        else:
+            self.storage = JsonMemoryStorage(self.memory_file, flush_interval=flush_interval)
+        
+        # Старые PNG файлы скриншотов переносим в хранилище изображений
+        self._import_legacy_screenshots()
+        
+        # Изменения других процессов с той же базой SQLite подхватываются по журналу изменений
+        self._data_version = self.storage.data_version()
+        self._change_seq = self.storage.last_change()
+        
+        # Заголовочный индекс (тексты и хеши экранов) читается из компактного снимка,
+        # поисковые структуры восстанавливаются из него при первом обращении
+        self._index_snapshot = IndexSnapshot(self.memory_file + ".index.npz")
+        self._snapshot_revision = self.storage.revision()
+        self._snapshot_arrays = self._index_snapshot.load(self._snapshot_revision)
+        if self._snapshot_arrays is None:
+            self._snapshot_revision = None
+        self._indexes_lock = threading.Lock()
+        self._text_index = None
+        self._screen_index = None
+        self._context_index = None
         
-        # Загружаем существующую память или создаем новую
-        self.memory = self._load_memory()
+        # Кластеры местоположений: первым проверяется самый вероятный кластер
+        self.clusterer = LocationClusterer()
         
-        logger.info(f"Менеджер памяти инициализирован. Файл памяти: {self.memory_file}")
-        logger.info(f"Загружено {len(self.memory.get('elements', []))} элементов")
+        # Изменения памяти (включая фоновое вытеснение) выполняются под общей блокировкой
+        self._write_lock = threading.RLock()
+        
+        # Поиск по индексам идет параллельно в разных потоках (бот, HTTP API, агент);
+        # изменение индексов ждет выхода читателей и занимает их ненадолго
+        self._index_lock = ReadWriteLock()
+        
+        # Автоматическое вытеснение по бюджетам в фоновом потоке
+        self.eviction = eviction_policy or EvictionPolicy()
+        self._eviction_worker = EvictionWorker(self.enforce_budgets, eviction_interval) if eviction_interval > 0 else None
+        
+        # Индексы и хранилище сохраняются при завершении процесса
+        self._closed = False
+        atexit.register(self.close)
+        
+        logger.info(f"Менеджер памяти инициализирован. Пространство имен: {self.namespace}, "
+                    f"файл памяти: {self.memory_file} ({self.backend})")
+        logger.info(f"Загружено {self.storage.count()} элементов")
 
-    def _load_memory(self):
+    def close(self):
+        """
+        Сохраняет несохраненные изменения и закрывает хранилище памяти.
         """
-        Загружает данные из файла памяти или создает пустую структуру.
+        if self._closed:
+            return
+        self._closed = True
+        if self._eviction_worker:
+            self._eviction_worker.stop()
+        self._save_index_snapshot()
+        if self._context_index is not None:
+            with self._index_lock.write():
+                self._context_index.save()
+        self.verifier.close()
+        self.storage.close()
+        self.blobs.close()
+        atexit.unregister(self.close)
+    
+    def _snapshot_section(self, section):
+        """Забирает массивы индекса из прочитанного снимка (один раз)."""
+        if self._snapshot_arrays is None:
+            return None
+        return self._snapshot_arrays.pop(section, None)
+    
+    @property
+    def text_index(self):
+        """Текстовый индекс для нечеткого поиска элементов по search_text (строится при первом обращении)."""
+        if self._text_index is None:
+            with self._indexes_lock:
+                if self._text_index is None:
+                    started = time.time()
+                    arrays = self._snapshot_section("text")
+                    if arrays is not None:
+                        text_index = TrigramTextIndex.from_arrays(arrays)
+                    else:
+                        text_index = TrigramTextIndex()
+                        text_index.load(self.storage.texts())
+                    self._text_index = text_index
+                    logger.info(f"Текстовый индекс памяти построен {'из снимка' if arrays is not None else 'по хранилищу'}: "
+                                f"{len(text_index)} элементов за {time.time() - started:.2f} с")
+        return self._text_index
+    
+    @property
+    def screen_index(self):
+        """BK-дерево перцептивных хешей экранов для поиска похожих экранов (строится при первом обращении)."""
+        if self._screen_index is None:
+            with self._indexes_lock:
+                if self._screen_index is None:
+                    arrays = self._snapshot_section("screen")
+                    if arrays is not None:
+                        screen_index = ScreenHashIndex.from_arrays(arrays)
+                    else:
+                        screen_index = ScreenHashIndex()
+                        hashes_by_element = {}
+                        for element_id, screen_hash in self.storage.screen_hashes():
+                            value = hash_from_hex(screen_hash)
+                            if value is not None:
+                                hashes_by_element.setdefault(element_id, set()).add(value)
+                        for element_id, hashes in hashes_by_element.items():
+                            screen_index.set_element(element_id, hashes)
+                    self._screen_index = screen_index
+        return self._screen_index
+    
+    @property
+    def context_index(self):
+        """Индекс векторов контекста экрана (векторы сохраняются рядом с файлом памяти)."""
+        if self._context_index is None:
+            with self._indexes_lock:
+                if self._context_index is None:
+                    context_index = ContextVectorIndex(self.memory_file + ".contexts.npz")
+                    context_index.load(self.storage.contexts())
+                    self._context_index = context_index
+        return self._context_index
+    
+    def _save_index_snapshot(self):
+        """
+        Сохраняет снимок заголовочного индекса, если хранилище изменилось
+        после последнего снимка. Индексы, к которым не обращались, строятся
+        из прочитанного снимка или по хранилищу.
+        """
+        with self._write_lock:
+            revision = self.storage.revision()
+            if revision == self._snapshot_revision or self.storage.count() == 0:
+                return
+            # Снимок записывается после изменений других процессов, сделанных до чтения ревизии
+            self.sync_external_changes()
+            self._index_snapshot.save(revision, {"text": self.text_index, "screen": self.screen_index})
+            self._snapshot_revision = revision
+    
+    def sync_external_changes(self):
+        """
+        Подхватывает изменения памяти, сделанные другими процессами (бот, HTTP API,
+        find_text) или другими экземплярами хранилища в общей базе SQLite.
+        Проверка - один PRAGMA data_version; при изменениях элементы из журнала
+        изменений переиндексируются, статистика и местоположения и так читаются из базы.
         
         Returns:
-            dict: Структура памяти
+            int: Количество переиндексированных элементов
         """
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    memory = json.load(f)
-                
-                # Детальное логирование загруженных элементов
-                elements = memory.get("elements", [])
-                logger.info(f"Память успешно загружена из {self.memory_file} - найдено {len(elements)} элементов")
-                
-                for i, element in enumerate(elements):
-                    search_text = element.get("search_text", "Неизвестный")
-                    context_info = element.get("context_info", "")
-                    locations = element.get("locations", [])
-                    
-                    logger.info(f"Загружен элемент {i+1}/{len(elements)}: '{search_text}' - "
-                               f"контекст: '{context_info[:30]}...', позиций: {len(locations)}")
-                
-                return memory
-            except Exception as e:
-                logger.error(f"Ошибка при загрузке памяти: {str(e)}")
-                return self._create_empty_memory()
-        else:
-            logger.info(f"Файл памяти не найден: {self.memory_file}. Создаем новую память.")
-            return self._create_empty_memory()
+        version = self.storage.data_version()
+        if version is None or version == self._data_version:
+            return 0
+        with self._write_lock:
+            version = self.storage.data_version()
+            if version == self._data_version:
+                return 0
+            self._data_version = version
+            
+            # Индексы, которые еще читаются из снимка, восстанавливаются до того, как снимок устареет
+            if self._snapshot_arrays is not None:
+                self.text_index
+                self.screen_index
+            self._snapshot_arrays = None
+            self._snapshot_revision = None
+            
+            self._change_seq, changed = self.storage.changes_since(self._change_seq)
+            if changed is None:
+                # Журнал уже очищен: индексы будут построены заново по хранилищу
+                with self._index_lock.write(), self._indexes_lock:
+                    self._text_index = None
+                    self._screen_index = None
+                    self._context_index = None
+                logger.info("Память изменена другим процессом, индексы будут построены заново")
+                return 0
+            
+            # Элементы читаются до захвата индексов, чтобы поиск в других потоках ждал недолго
+            elements = {element_id: self.storage.get(element_id) for element_id in changed}
+            with self._index_lock.write():
+                for element_id, element in elements.items():
+                    if self._text_index is not None:
+                        if element:
+                            self._text_index.add(element_id, element["search_text"])
+                        else:
+                            self._text_index.remove(element_id)
+                    if self._context_index is not None:
+                        if element:
+                            self._context_index.add(element_id, element["screen_context"])
+                        else:
+                            self._context_index.remove(element_id)
+                    if self._screen_index is not None:
+                        if element:
+                            self._index_screen_hashes(element)
+                        else:
+                            self._screen_index.remove(element_id)
+            if changed:
+                logger.info(f"Подхвачены изменения других процессов: {len(changed)} элементов")
+            return len(changed)
     
-    def _create_empty_memory(self):
+    def export_json(self, json_path):
         """
-        Создает пустую структуру памяти.
+        Выгружает память в JSON файл (формат прежнего search_memory.json).
         
+        Args:
+            json_path (str): Путь к JSON файлу
+            
         Returns:
-            dict: Пустая структура памяти
+            int: Количество выгруженных элементов или 0 при ошибке
         """
-        return {
-            "elements": [],
-            "last_updated": datetime.datetime.now().isoformat(),
-            "version": "1.0"
-        }
+        try:
+            return export_to_json(self.storage, json_path)
+        except Exception as e:
+            logger.error(f"Ошибка при выгрузке памяти в JSON: {str(e)}")
+            return 0
     
-    def _save_memory(self):
+    def _import_legacy_screenshots(self):
         """
-        Сохраняет текущую память в файл.
+        Переносит скриншоты из отдельных PNG файлов ({id}_{timestamp}.png)
+        в хранилище изображений и удаляет эти файлы.
         """
-        try:
-            # Обновляем время последнего обновления
-            self.memory["last_updated"] = datetime.datetime.now().isoformat()
-            
-            # Сначала сохраняем во временный файл для предотвращения повреждения при сбое
-            temp_file = self.memory_file + ".temp"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(self.memory, f, ensure_ascii=False, indent=2)
-            
-            # Переименовываем временный файл в основной
-            if os.path.exists(self.memory_file):
-                os.remove(self.memory_file)
-            os.rename(temp_file, self.memory_file)
+        png_files = [name for name in os.listdir(self.screenshots_dir) if name.endswith('.png')]
+        if not png_files:
+            return
+        imported = 0
+        for element in self.storage.all():
+            changed = False
+            for location in element.get("locations", []):
+                name = location.get("screenshot")
+                path = os.path.join(self.screenshots_dir, name) if name else None
+                if path and name.endswith('.png') and os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        location["screenshot"] = self.blobs.put_bytes(f.read())
+                    self.verifier.remove_template(name)
+                    changed = True
+                    imported += 1
+            if changed:
+                self.storage.put(element)
+        # Файлы, на которые не ссылается ни одно местоположение, больше не нужны
+        for name in png_files:
+            self.verifier.remove_template(name)
+            os.remove(os.path.join(self.screenshots_dir, name))
+        logger.info(f"Скриншоты перенесены в хранилище изображений: {imported} ссылок, {self.blobs.count()} изображений")
+    
+    def _load_screenshot(self, key):
+        """
+        Загружает изображение элемента по значению поля "screenshot" местоположения.
+        
+        Args:
+            key (str): Ключ изображения
             
-            elements_count = len(self.memory.get("elements", []))
-            logger.info(f"Память успешно сохранена в {self.memory_file} - {elements_count} элементов")
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении памяти: {str(e)}")
+        Returns:
+            PIL.Image или None: Изображение или None, если его нет
+        """
+        return self.blobs.get(key) if key else None
+    
+    def _release_screenshot(self, key):
+        """
+        Убирает ссылку местоположения на изображение; изображение без ссылок удаляется.
+        
+        Args:
+            key (str): Ключ изображения
+        """
+        if key and self.blobs.release(key):
+            self.verifier.remove_template(key)
+            logger.info(f"Удален скриншот без ссылок: {key}")
     
     def _generate_element_id(self, search_text, context_info=None):
         """
@@ -145,22 +388,122 @@ class MemoryManager:
     
     def _get_screenshot_hash(self, screenshot):
         """
-        Генерирует хеш скриншота для сравнения.
+        Генерирует перцептивный хеш скриншота для сравнения.
+        Похожие экраны (изменились часы, курсор, значок) дают хеши
+        с малым расстоянием Хэмминга.
         
         Args:
             screenshot (PIL.Image): Скриншот для хеширования
             
         Returns:
-            str: Хеш скриншота
+            str: pHash скриншота (16 шестнадцатеричных символов)
+        """
+        return hash_to_hex(phash(screenshot))
+    
+    def _index_screen_hashes(self, element):
+        """
+        Обновляет хеши экранов элемента в индексе похожих экранов.
+        
+        Args:
+            element (dict): Элемент памяти
+        """
+        hashes = [hash_from_hex(location.get("screen_hash")) for location in element.get("locations", [])]
+        screen_index = self.screen_index
+        with self._index_lock.write():
+            screen_index.set_element(element["id"], (value for value in hashes if value is not None))
+    
+    def _unindex_element(self, element_id):
+        """
+        Удаляет элемент из всех индексов.
+        
+        Args:
+            element_id (str): ID элемента
         """
-        # Уменьшаем размер для более быстрого и обобщенного хеширования
-        small_img = screenshot.resize((100, 100), Image.LANCZOS)
-        gray_img = small_img.convert('L')
+        text_index, context_index, screen_index = self.text_index, self.context_index, self.screen_index
+        with self._index_lock.write():
+            text_index.remove(element_id)
+            context_index.remove(element_id)
+            screen_index.remove(element_id)
+    
+    def _closest_location(self, element, screen_hash, max_distance=SAME_SCREEN_DISTANCE):
+        """
+        Выбирает местоположение элемента, сохраненное на самом похожем экране.
         
-        # Преобразуем в массив и хешируем
-        img_array = np.array(gray_img).flatten()
-        img_hash = hashlib.md5(img_array.tobytes()).hexdigest()
-        return img_hash
+        Args:
+            element (dict): Элемент памяти
+            screen_hash (int): pHash текущего экрана
+            max_distance (int): Максимальное расстояние Хэмминга для "того же экрана"
+            
+        Returns:
+            tuple: (местоположение, True если экран тот же); без похожего экрана - самое недавнее местоположение
+        """
+        best_location = None
+        best_distance = max_distance + 1
+        for location in element["locations"]:
+            saved_hash = hash_from_hex(location.get("screen_hash"))
+            if saved_hash is not None:
+                distance = hamming_distance(screen_hash, saved_hash)
+                if distance < best_distance:
+                    best_location, best_distance = location, distance
+        if best_location is not None:
+            return best_location, True
+        return (element["locations"][0] if element["locations"] else None), False
+    
+    def _trim_locations(self, element, max_locations=10):
+        """
+        Оставляет не более max_locations местоположений и убирает ссылки
+        удаленных местоположений на скриншоты. Самое недавнее местоположение
+        каждого вероятного кластера сохраняется, даже если оно старше остальных.
+        
+        Args:
+            element (dict): Элемент памяти
+            max_locations (int): Максимальное количество местоположений
+        """
+        if len(element["locations"]) <= max_locations:
+            return
+        kept, dropped = self.clusterer.select_kept(element, max_locations)
+        for old_location in dropped:
+            self._release_screenshot(old_location.get("screenshot"))
+        
+        # Обрезаем список местоположений
+        element["locations"] = kept
+    
+    def _record_cluster_outcomes(self, element_id, outcomes):
+        """
+        Сохраняет результаты проверки кластеров местоположений элемента.
+        
+        Args:
+            element_id (str): ID элемента
+            outcomes (dict): ID кластера -> True (подтвержден) или False (промах)
+        """
+        outcomes = {cluster_id: hit for cluster_id, hit in outcomes.items() if cluster_id is not None}
+        if not outcomes:
+            return
+        timestamp = int(time.time())
+        with self._write_lock:
+            self.storage.update(element_id, lambda stored: stored if stored and self.clusterer.record(
+                stored, outcomes, timestamp) else None)
+    
+    def _ranked_locations(self, element, screen_size, screen_hash=None, require_screenshot=False):
+        """
+        Возвращает самые недавние местоположения кластеров элемента,
+        от самого вероятного кластера к наименее вероятному.
+        
+        Args:
+            element (dict): Элемент памяти
+            screen_size (tuple): Размер текущего экрана
+            screen_hash (int, optional): pHash текущего экрана
+            require_screenshot (bool): Только местоположения с изображением элемента
+            
+        Returns:
+            list: Пары (местоположение, True если кластер сохранен на том же экране)
+        """
+        ranked = []
+        for cluster, distance in self.clusterer.rank(element, screen_size, screen_hash):
+            location = self.clusterer.representative(element, cluster["id"], require_screenshot)
+            if location is not None:
+                ranked.append((location, distance is not None))
+        return ranked
     
     def _capture_element_area(self, x, y, width, height):
         """
@@ -264,14 +607,13 @@ class MemoryManager:
                     element_x, element_y, element_width, element_height
                 )
             
-            # Сохраняем скриншот элемента
+            # Сохраняем скриншот элемента (одинаковые изображения хранятся один раз)
             timestamp = int(time.time())
-            screenshot_filename = f"{element_id}_{timestamp}.png"
-            screenshot_path_to_save = os.path.join(self.screenshots_dir, screenshot_filename)
-            
+            screenshot_key = None
             if element_screenshot:
-                element_screenshot.save(screenshot_path_to_save)
-                logger.info(f"Сохранен скриншот элемента: {screenshot_path_to_save}")
+                screenshot_key = self.blobs.put(element_screenshot)
+                self.verifier.add_template(screenshot_key, element_screenshot)
+                logger.info(f"Сохранен скриншот элемента: {screenshot_key}")
             
             # Создаем запись о местоположении
             location_entry = {
@@ -281,66 +623,61 @@ class MemoryManager:
                 "match_percentage": match_percentage,
                 "timestamp": timestamp,
                 "screen_hash": screen_hash,
-                "screenshot": screenshot_filename if element_screenshot else None
+                "screenshot": screenshot_key
             }
             
-            # Проверяем, существует ли элемент в памяти
-            element_exists = False
-            for element in self.memory["elements"]:
-                if element["id"] == element_id:
-                    # Элемент существует, добавляем новое местоположение
+            def add_location(element):
+                if element:
+                    # Элемент существует, добавляем новое местоположение в его кластер
+                    self.clusterer.assign(element, location_entry, timestamp)
                     element["locations"].insert(0, location_entry)  # Добавляем в начало списка
-                    
+                
                     # Ограничиваем количество сохраненных местоположений
-                    if len(element["locations"]) > 10:  # Храним не более 10 местоположений
-                        # Удаляем лишние, но сначала проверяем, есть ли у них скриншоты
-                        for old_location in element["locations"][10:]:
-                            if old_location.get("screenshot"):
-                                old_screenshot_path = os.path.join(self.screenshots_dir, old_location["screenshot"])
-                                if os.path.exists(old_screenshot_path):
-                                    try:
-                                        os.remove(old_screenshot_path)
-                                        logger.info(f"Удален устаревший скриншот: {old_screenshot_path}")
-                                    except Exception as e:
-                                        logger.error(f"Ошибка при удалении устаревшего скриншота: {str(e)}")
-                        
-                        # Обрезаем список местоположений
-                        element["locations"] = element["locations"][:10]
-                    
+                    self._trim_locations(element)
+                
                     # Обновляем поле last_found и screen_context
                     element["last_found"] = timestamp
                     if screen_context:
                         element["screen_context"] = screen_context
-                    
+                
                     # Обновляем success_rate
                     element["success_count"] += 1
                     element["total_searches"] += 1
                     element["success_rate"] = element["success_count"] / element["total_searches"]
-                    element_exists = True
-                    break
-            
-            # Если элемент не существует, создаем новый
-            if not element_exists:
-                new_element = {
-                    "id": element_id,
-                    "search_text": search_text,
-                    "context_info": context_info or "",
-                    "screen_context": screen_context,
-                    "created": timestamp,
-                    "last_found": timestamp,
-                    "locations": [location_entry],
-                    "success_count": 1,
-                    "total_searches": 1,
-                    "success_rate": 1.0
-                }
-                self.memory["elements"].append(new_element)
-            
-            # Обновляем время последнего изменения
-            self.memory["last_updated"] = timestamp
-            
-            # Сохраняем обновленную память
-            self._save_memory()
+                else:
+                    # Если элемент не существует, создаем новый
+                    element = {
+                        "id": element_id,
+                        "search_text": search_text,
+                        "context_info": context_info or "",
+                        "screen_context": screen_context,
+                        "created": timestamp,
+                        "last_found": timestamp,
+                        "locations": [],
+                        "success_count": 1,
+                        "total_searches": 1,
+                        "success_rate": 1.0
+                    }
+                    self.clusterer.assign(element, location_entry, timestamp)
+                    element["locations"].append(location_entry)
+                return element
+            
+            # Элемент читается и записывается в одной транзакции хранилища:
+            # статистика и местоположения, записанные другими процессами, не теряются
+            with self._write_lock:
+                element = self.storage.update(element_id, add_location)
+                
+                # Обновляем индексы
+                text_index, context_index = self.text_index, self.context_index
+                with self._index_lock.write():
+                    text_index.add(element_id, element["search_text"])
+                    context_index.add(element_id, element["screen_context"])
+                    self._index_screen_hashes(element)
             logger.info(f"Элемент '{search_text}' успешно сохранен в памяти")
+            
+            # Бюджеты проверяются в фоне, чтобы сохранение не ждало вытеснения
+            if self._eviction_worker:
+                self._eviction_worker.wake()
             return True
         
         except Exception as e:
@@ -360,15 +697,14 @@ class MemoryManager:
             tuple или None: Координаты найденного элемента или None, если не найден
         """
         try:
+            self.sync_external_changes()
             # Генерируем ID элемента
             element_id = self._generate_element_id(search_text, context_info)
             
             # Ищем элемент в памяти
-            target_element = None
-            for element in self.memory["elements"]:
-                if element["id"] == element_id:
-                    target_element = element
-                    break
+            target_element = self.storage.get(element_id)
+            
+            self.eviction.record_lookup(element_id, target_element is not None)
             
             # Если элемент не найден в памяти
             if not target_element:
@@ -379,97 +715,61 @@ class MemoryManager:
             # Получаем текущий скриншот и размер экрана
             full_screenshot = pyautogui.screenshot()
             screen_width, screen_height = full_screenshot.size
-            screen_hash = self._get_screenshot_hash(full_screenshot)
+            screen_hash = phash(full_screenshot)
             
-            # Проверяем все сохраненные местоположения, начиная с самого недавнего
-            for location in target_element["locations"]:
-                # Проверяем размер экрана
+            # Кластеры местоположений от самого вероятного к наименее вероятному
+            ranked = self._ranked_locations(target_element, full_screenshot.size, screen_hash)
+            if ranked:
+                location, same_screen = ranked[0]
+                # Масштабируем координаты, если размер экрана изменился
                 saved_width, saved_height = location["screen_size"]
-                
-                # Вычисляем масштаб, если размер экрана изменился
-                scale_x = screen_width / saved_width
-                scale_y = screen_height / saved_height
-                
-                # Масштабируем координаты
                 original_x, original_y = location["coordinates"]
-                scaled_x = int(original_x * scale_x)
-                scaled_y = int(original_y * scale_y)
+                scaled_x = int(original_x * screen_width / saved_width)
+                scaled_y = int(original_y * screen_height / saved_height)
                 
                 # Если нужно визуально проверить наличие элемента
                 if check_visually:
-                    # Получаем границы сохраненного элемента
-                    element_x, element_y, element_width, element_height = location["element_rect"]
-                    
-                    # Масштабируем границы
-                    element_x = int(element_x * scale_x)
-                    element_y = int(element_y * scale_y)
-                    element_width = int(element_width * scale_x)
-                    element_height = int(element_height * scale_y)
-                    
-                    # Проверяем, находимся ли мы на том же экране по хешу
-                    # Если хеши похожи, вероятно мы на том же экране
-                    if screen_hash == location["screen_hash"]:
-                        confidence = 0.9  # Высокая уверенность
-                    else:
-                        confidence = 0.5  # Умеренная уверенность
+                    outcomes = {}
+                    try:
+                        match = self._verify_ranked(target_element, full_screenshot, screen_hash, outcomes)
+                    except Exception as e:
+                        logger.error(f"Ошибка при сравнении изображений: {str(e)}")
+                        match = None
                     
-                    # Получаем область на текущем экране
-                    current_area = full_screenshot.crop((
-                        element_x, element_y, 
-                        element_x + element_width, element_y + element_height
-                    ))
-                    
-                    # Загружаем сохраненный скриншот для сравнения
-                    if location["screenshot"]:
-                        screenshot_path = os.path.join(self.screenshots_dir, location["screenshot"])
-                        if os.path.exists(screenshot_path):
-                            try:
-                                saved_area = Image.open(screenshot_path)
-                                
-                                # Преобразуем изображения для сравнения
-                                current_small = current_area.resize((50, 50), Image.LANCZOS).convert('L')
-                                saved_small = saved_area.resize((50, 50), Image.LANCZOS).convert('L')
-                                
-                                # Преобразуем в numpy массивы
-                                current_array = np.array(current_small)
-                                saved_array = np.array(saved_small)
-                                
-                                # Вычисляем среднеквадратичную ошибку (MSE)
-                                mse = np.mean((current_array - saved_array) ** 2)
-                                # Преобразуем MSE в показатель сходства (0-100%)
-                                similarity = max(0, 100 - min(100, mse / 10))
-                                
-                                logger.info(f"Сходство изображений: {similarity:.2f}% для элемента '{search_text}'")
-                                
-                                # Если сходство достаточно высокое, считаем что элемент найден
-                                if similarity >= 70:  # Порог сходства
-                                    # Увеличиваем счетчик успешных поисков
-                                    target_element["success_count"] += 1
-                                    target_element["total_searches"] += 1
-                                    target_element["success_rate"] = target_element["success_count"] / target_element["total_searches"]
-                                    target_element["last_found"] = int(time.time())
-                                    
-                                    # Обновляем память
-                                    self._save_memory()
-                                    
-                                    logger.info(f"Элемент '{search_text}' найден в памяти по визуальному сходству")
-                                    return (scaled_x, scaled_y)
-                            except Exception as e:
-                                logger.error(f"Ошибка при сравнении изображений: {str(e)}")
+                    if match:
+                        logger.info(f"Сходство изображений: {match['score'] * 100:.2f}% для элемента '{search_text}'")
+                        
+                        # Если сходство достаточно высокое, считаем что элемент найден
+                        if match["matched"]:
+                            self._record_cluster_outcomes(element_id, outcomes)
+                            # Увеличиваем счетчик успешных поисков
+                            self.storage.record_search(element_id, True, int(time.time()))
+                            
+                            logger.info(f"Элемент '{search_text}' найден в памяти по визуальному сходству")
+                            return match["coordinates"]
+                        
+                        self._record_cluster_outcomes(element_id, outcomes)
+                        # Элемент мог сдвинуться: ищем его дальше от сохраненной позиции
+                        coordinates = self.relocate_element(target_element, full_screenshot)
+                        if coordinates:
+                            self.storage.record_search(element_id, True, int(time.time()))
+                            return coordinates
+                    elif same_screen:
+                        # Изображения элемента нет, но экран совпадает с сохраненным
+                        self.storage.record_search(element_id, True, int(time.time()))
+                        
+                        logger.info(f"Элемент '{search_text}' найден в памяти на том же экране")
+                        return (scaled_x, scaled_y)
                 
                 # Даже если не смогли визуально проверить, возвращаем координаты с пометкой
-                target_element["total_searches"] += 1
-                target_element["success_rate"] = target_element["success_count"] / target_element["total_searches"]
-                self._save_memory()
+                self.storage.record_search(element_id, False, int(time.time()))
                 
                 logger.info(f"Элемент '{search_text}' найден в памяти по последним координатам")
                 return (scaled_x, scaled_y)
             
             # Если дошли до этой точки, элемент не найден ни в одном месте
             # Увеличиваем счетчик поисков, но не успешных
-            target_element["total_searches"] += 1
-            target_element["success_rate"] = target_element["success_count"] / target_element["total_searches"]
-            self._save_memory()
+            self.storage.record_search(element_id, False, int(time.time()))
             
             logger.info(f"Элемент '{search_text}' не найден в памяти по сохраненным координатам")
             return None
@@ -493,23 +793,11 @@ class MemoryManager:
         try:
             element_id = self._generate_element_id(search_text, context_info)
             
-            # Ищем элемент в памяти
-            for element in self.memory["elements"]:
-                if element["id"] == element_id:
-                    # Обновляем статистику
-                    element["total_searches"] += 1
-                    if success:
-                        element["success_count"] += 1
-                    element["success_rate"] = element["success_count"] / element["total_searches"]
-                    
-                    # Обновляем время последнего нахождения, если успешно
-                    if success:
-                        element["last_found"] = int(time.time())
-                    
-                    # Сохраняем обновления
-                    self._save_memory()
-                    logger.info(f"Обновлена статистика поиска для '{search_text}': {element['success_rate']:.2f}")
-                    return True
+            # Обновляем статистику (и время последнего нахождения, если успешно) одной записью
+            element = self.storage.record_search(element_id, success, int(time.time()))
+            if element:
+                logger.info(f"Обновлена статистика поиска для '{search_text}': {element['success_rate']:.2f}")
+                return True
             
             logger.info(f"Элемент '{search_text}' не найден для обновления статистики")
             return False
@@ -533,35 +821,25 @@ class MemoryManager:
             now = int(time.time())
             max_age_seconds = max_age_days * 24 * 60 * 60
             
-            original_count = len(self.memory["elements"])
-            
-            # Фильтруем элементы по возрасту и коэффициенту успеха
-            self.memory["elements"] = [
-                element for element in self.memory["elements"]
-                if (now - element["last_found"] <= max_age_seconds) or 
-                   (element["success_rate"] >= min_success_rate)
-            ]
-            
-            # Очищаем старые файлы скриншотов
-            all_screenshot_files = os.listdir(self.screenshots_dir)
-            used_screenshots = set()
-            
-            # Собираем используемые скриншоты
-            for element in self.memory["elements"]:
-                for location in element["locations"]:
-                    if location["screenshot"]:
-                        used_screenshots.add(location["screenshot"])
+            with self._write_lock:
+                # Выбираем элементы, которые не проходят ни по возрасту, ни по коэффициенту успеха
+                elements = self.storage.all()
+                expired_ids = [
+                    element["id"] for element in elements
+                    if not ((now - element["last_found"] <= max_age_seconds) or 
+                            (element["success_rate"] >= min_success_rate))
+                ]
+                removed_count = self.storage.delete(expired_ids)
+                expired = set(expired_ids)
+                for element_id in expired:
+                    self._unindex_element(element_id)
+            
+                # Убираем ссылки удаленных элементов на скриншоты
+                for element in elements:
+                    if element["id"] in expired:
+                        for location in element["locations"]:
+                            self._release_screenshot(location.get("screenshot"))
             
-            # Удаляем неиспользуемые скриншоты
-            for screenshot_file in all_screenshot_files:
-                if screenshot_file not in used_screenshots:
-                    os.remove(os.path.join(self.screenshots_dir, screenshot_file))
-                    logger.info(f"Удален неиспользуемый скриншот: {screenshot_file}")
-            
-            # Сохраняем обновленную память
-            self._save_memory()
-            
-            removed_count = original_count - len(self.memory["elements"])
             logger.info(f"Очистка памяти: удалено {removed_count} устаревших элементов")
             return removed_count
         
@@ -569,6 +847,73 @@ class MemoryManager:
             logger.error(f"Ошибка при очистке устаревших записей: {str(e)}")
             return 0
     
+    def enforce_budgets(self):
+        """
+        Выполняет один проход автоматического вытеснения, если бюджеты превышены.
+        Сначала у элементов с наименьшим приоритетом удаляются старые местоположения
+        (самое свежее остается), затем вытесняются целые элементы. За проход
+        обрабатывается не больше eviction.batch_size элементов.
+        
+        Returns:
+            bool: True если бюджеты все еще превышены и нужен следующий проход
+        """
+        policy = self.eviction
+        with self._write_lock:
+            element_count = self.storage.count()
+            location_count = self.storage.location_count()
+            bytes_before = self.blobs.total_bytes()
+            if not policy.over_budget(element_count, location_count, bytes_before):
+                return False
+            
+            ranked = policy.rank(self.storage.element_summaries(), int(time.time()))
+            budget = policy.batch_size
+            
+            # Лишние местоположения наименее ценных элементов
+            trimmed = 0
+            excess = policy.excess_locations(location_count)
+            for summary in ranked:
+                if excess <= 0 or budget <= 0:
+                    break
+                if summary["location_count"] <= 1:
+                    continue
+                trim = {}
+                
+                def trim_locations(element):
+                    if not element:
+                        return None
+                    trim["keep"] = max(1, len(element["locations"]) - excess)
+                    trim["removed"] = len(element["locations"]) - trim["keep"]
+                    self._trim_locations(element, trim["keep"])
+                    return element
+                
+                element = self.storage.update(summary["id"], trim_locations)
+                if not element:
+                    continue
+                keep, removed = trim["keep"], trim["removed"]
+                self._index_screen_hashes(element)
+                summary["location_count"] = keep
+                excess -= removed
+                trimmed += removed
+                location_count -= removed
+                budget -= 1
+            
+            # Целые элементы, пока превышен бюджет элементов, местоположений или байтов
+            evicted = []
+            for summary in ranked:
+                if budget <= 0 or not policy.over_budget(element_count, location_count, self.blobs.total_bytes()):
+                    break
+                if self.remove_element(summary["id"]):
+                    evicted.append(summary["id"])
+                    element_count -= 1
+                    location_count -= summary["location_count"]
+                    budget -= 1
+            
+            freed_bytes = bytes_before - self.blobs.total_bytes()
+            policy.record_eviction(evicted, trimmed, freed_bytes)
+            logger.info(f"Вытеснение: удалено {len(evicted)} элементов и {trimmed} местоположений, "
+                        f"освобождено {freed_bytes / 1024:.1f} KB")
+            return bool(evicted or trimmed) and policy.over_budget(element_count, location_count, self.blobs.total_bytes())
+    
     def get_all_elements(self):
         """
         Возвращает все элементы из памяти.
@@ -577,8 +922,9 @@ class MemoryManager:
             list: Список всех элементов в памяти
         """
         try:
-            logger.info(f"Запрошен список всех элементов из памяти: {len(self.memory['elements'])} элементов")
-            return self.memory["elements"]
+            elements = self.storage.all()
+            logger.info(f"Запрошен список всех элементов из памяти: {len(elements)} элементов")
+            return elements
         except Exception as e:
             logger.error(f"Ошибка при получении всех элементов из памяти: {str(e)}")
             return []
@@ -594,39 +940,23 @@ class MemoryManager:
             bool: True если успешно, иначе False
         """
         try:
-            # Находим элемент в памяти
-            original_count = len(self.memory["elements"])
+            with self._write_lock:
+                # Находим элемент в памяти
+                element = self.storage.get(element_id)
             
-            # Находим и удаляем все скриншоты, связанные с этим элементом
-            elements_to_remove = [element for element in self.memory["elements"] if element["id"] == element_id]
+                if not element:
+                    logger.info(f"Элемент с ID {element_id} не найден для удаления")
+                    return False
             
-            if not elements_to_remove:
-                logger.info(f"Элемент с ID {element_id} не найден для удаления")
-                return False
-            
-            # Удаляем скриншоты
-            screenshots_to_remove = set()
-            for element in elements_to_remove:
+                # Убираем ссылки всех местоположений элемента на скриншоты
                 for location in element.get("locations", []):
-                    if location.get("screenshot"):
-                        screenshots_to_remove.add(location["screenshot"])
-            
-            # Удаляем файлы скриншотов
-            for screenshot_file in screenshots_to_remove:
-                screenshot_path = os.path.join(self.screenshots_dir, screenshot_file)
-                if os.path.exists(screenshot_path):
-                    os.remove(screenshot_path)
-                    logger.info(f"Удален скриншот: {screenshot_file}")
-            
-            # Фильтруем элементы, оставляя только те, которые не совпадают с ID для удаления
-            self.memory["elements"] = [element for element in self.memory["elements"] if element["id"] != element_id]
+                    self._release_screenshot(location.get("screenshot"))
             
-            # Сохраняем обновленную память
-            self._save_memory()
-            
-            removed_count = original_count - len(self.memory["elements"])
-            logger.info(f"Удалено {removed_count} элементов с ID {element_id}")
-            return True
+                # Удаляем элемент из хранилища и индексов
+                removed_count = self.storage.delete([element_id])
+                self._unindex_element(element_id)
+                logger.info(f"Удалено {removed_count} элементов с ID {element_id}")
+                return True
             
         except Exception as e:
             logger.error(f"Ошибка при удалении элемента: {str(e)}")
@@ -645,18 +975,20 @@ class MemoryManager:
             bool: True если успешно, иначе False
         """
         try:
-            # Ищем элемент в памяти
-            for element in self.memory["elements"]:
-                if element["id"] == element_id:
-                    # Обновляем данные, если они предоставлены
+            # Обновляем данные, если они предоставлены
+            fields = {}
+            if new_search_text is not None:
+                fields["search_text"] = new_search_text
+            
+            if new_context_info is not None:
+                fields["context_info"] = new_context_info
+            
+            with self._write_lock:
+                if self.storage.update_fields(element_id, **fields):
                     if new_search_text is not None:
-                        element["search_text"] = new_search_text
-                    
-                    if new_context_info is not None:
-                        element["context_info"] = new_context_info
-                    
-                    # Сохраняем обновленную память
-                    self._save_memory()
+                        text_index = self.text_index
+                        with self._index_lock.write():
+                            text_index.add(element_id, new_search_text)
                     logger.info(f"Элемент с ID {element_id} успешно обновлен")
                     return True
             
@@ -699,7 +1031,8 @@ class MemoryManager:
             coordinates = find_text.find_text_on_image(
                 screenshot_path, 
                 search_text,
-                context_info=context_info
+                context_info=context_info,
+                namespace=self.namespace
             )
             
             # Обновляем статистику поиска
@@ -724,25 +1057,18 @@ class MemoryManager:
             dict: Статистика памяти
         """
         try:
-            total_elements = len(self.memory["elements"])
-            total_locations = sum(len(element["locations"]) for element in self.memory["elements"])
+            total_elements = self.storage.count()
+            total_locations = self.storage.location_count()
             
             # Вычисляем среднюю точность
-            if total_elements > 0:
-                avg_success_rate = sum(element["success_rate"] for element in self.memory["elements"]) / total_elements
-            else:
-                avg_success_rate = 0
+            avg_success_rate = self.storage.average_success_rate()
             
-            # Подсчитываем количество скриншотов и их размер
-            screenshot_count = 0
-            screenshot_size = 0
-            for filename in os.listdir(self.screenshots_dir):
-                if filename.endswith('.png'):
-                    screenshot_count += 1
-                    screenshot_size += os.path.getsize(os.path.join(self.screenshots_dir, filename))
+            # Количество и размер скриншотов ведутся хранилищем изображений
+            screenshot_count = self.blobs.count()
+            screenshot_size = self.blobs.total_bytes()
             
             # Размер файла памяти
-            memory_file_size = os.path.getsize(self.memory_file) if os.path.exists(self.memory_file) else 0
+            memory_file_size = self.storage.file_size()
             
             stats = {
                 "total_elements": total_elements,
@@ -752,8 +1078,12 @@ class MemoryManager:
                 "screenshot_size_kb": screenshot_size / 1024,
                 "memory_file_size_kb": memory_file_size / 1024,
                 "memory_file": self.memory_file,
+                "namespace": self.namespace,
+                "namespaces": list_namespaces(self.working_dir),
+                "backend": self.backend,
                 "screenshots_dir": self.screenshots_dir,
-                "last_updated": self.memory.get("last_updated", "")
+                "eviction": self.eviction.stats(),
+                "last_updated": self.storage.last_updated()
             }
             
             logger.info(f"Статистика памяти: {stats['total_elements']} элементов, {stats['total_locations']} местоположений")
@@ -766,6 +1096,8 @@ class MemoryManager:
     def find_elements_by_context(self, screen_context, similarity_threshold=0.6):
         """
         Ищет элементы в памяти, которые связаны с текущим контекстом экрана.
+        Использует индекс векторов контекста: сохраненные контексты уже векторизованы,
+        запрос считается одним умножением матрицы на вектор.
         
         Args:
             screen_context (str): Описание контекста текущего экрана
@@ -775,216 +1107,319 @@ class MemoryManager:
             list: Список элементов, подходящих под текущий контекст
         """
         try:
+            self.sync_external_changes()
             # Проверяем, что есть описание контекста
             if not screen_context or len(screen_context.strip()) < 5:
                 logger.warning("Недостаточно информации о контексте экрана для поиска элементов")
                 return []
             
-            # Импортируем только при необходимости
-            try:
-                import openai
-                from sklearn.feature_extraction.text import TfidfVectorizer
-                from sklearn.metrics.pairwise import cosine_similarity
-                import numpy as np
-                
-                # Для текстового сравнения используем TF-IDF и косинусное сходство
-                vectorizer = TfidfVectorizer().fit_transform([screen_context.lower()])
-                
-                matching_elements = []
-                
-                # Формируем список контекстов всех элементов
-                contexts = []
-                elements = []
-                
-                for element in self.memory["elements"]:
-                    element_context = element.get("screen_context", "")
-                    if element_context and len(element_context.strip()) > 5:
-                        contexts.append(element_context.lower())
-                        elements.append(element)
-                
-                if not contexts:
-                    logger.info("В памяти нет элементов с контекстной информацией")
-                    return []
-                
-                # Преобразуем все контексты в векторы
-                all_vectors = vectorizer.fit_transform([screen_context.lower()] + contexts)
-                
-                # Вычисляем косинусное сходство между текущим контекстом и всеми сохраненными
-                similarities = cosine_similarity(all_vectors[0:1], all_vectors[1:]).flatten()
-                
-                # Выбираем элементы, чье сходство превышает порог
-                for i, similarity in enumerate(similarities):
-                    if similarity >= similarity_threshold:
-                        elements[i]["context_similarity"] = float(similarity)
-                        matching_elements.append(elements[i])
-                
-                # Сортируем элементы по убыванию сходства
-                matching_elements.sort(key=lambda x: x.get("context_similarity", 0), reverse=True)
-                
-                logger.info(f"Найдено {len(matching_elements)} элементов с похожим контекстом")
-                return matching_elements
+            if not len(self.context_index):
+                logger.info("В памяти нет элементов с контекстной информацией")
+                return []
             
-            except ImportError:
-                # Если sklearn не установлен, используем более простой алгоритм
-                logger.warning("Библиотека sklearn не установлена, используем упрощенный алгоритм сравнения контекста")
-                
-                matching_elements = []
-                
-                # Преобразуем контексты в наборы слов для сравнения
-                screen_words = set(screen_context.lower().split())
-                
-                for element in self.memory["elements"]:
-                    element_context = element.get("screen_context", "")
-                    if element_context:
-                        element_words = set(element_context.lower().split())
-                        
-                        # Вычисляем простое сходство как отношение общих слов к общему количеству
-                        if element_words:
-                            common_words = screen_words.intersection(element_words)
-                            all_words = screen_words.union(element_words)
-                            
-                            if all_words:
-                                similarity = len(common_words) / len(all_words)
-                                
-                                if similarity >= similarity_threshold:
-                                    element["context_similarity"] = similarity
-                                    matching_elements.append(element)
-                
-                # Сортируем элементы по убыванию сходства
-                matching_elements.sort(key=lambda x: x.get("context_similarity", 0), reverse=True)
-                
-                logger.info(f"Найдено {len(matching_elements)} элементов с похожим контекстом (упрощенный алгоритм)")
-                return matching_elements
+            # Вычисляем косинусное сходство TF-IDF между текущим контекстом и всеми сохраненными
+            with self._index_lock.read():
+                matches = self.context_index.query(screen_context, similarity_threshold)
+            matching_elements = []
+            for element_id, similarity in matches:
+                element = self.storage.get(element_id)
+                if element:
+                    element["context_similarity"] = similarity
+                    matching_elements.append(element)
+            
+            logger.info(f"Найдено {len(matching_elements)} элементов с похожим контекстом")
+            return matching_elements
         
         except Exception as e:
             logger.error(f"Ошибка при поиске элементов по контексту: {str(e)}")
             return []
     
-    def verify_element_on_screen(self, element, max_offset_pixels=10):
+    def find_similar_screens(self, screenshot, max_distance=SAME_SCREEN_DISTANCE):
         """
-        Проверяет, находится ли элемент на текущем экране, сравнивая
-        область вокруг сохраненных координат с сохраненным изображением.
+        Ищет элементы, сохраненные на экранах, похожих на данный скриншот.
+        Использует BK-дерево перцептивных хешей, поэтому не перебирает все местоположения.
         
         Args:
-            element (dict): Элемент для проверки
-            max_offset_pixels (int): Максимальное смещение в пикселях для поиска
+            screenshot (PIL.Image): Скриншот экрана
+            max_distance (int): Максимальное расстояние Хэмминга между хешами экранов
             
         Returns:
-            tuple или None: Актуальные координаты элемента или None, если не найден
+            list: Пары (ID элемента, расстояние), отсортированные по возрастанию расстояния
         """
         try:
-            # Проверяем, что у элемента есть местоположения
-            if not element.get("locations"):
-                logger.info(f"У элемента '{element.get('search_text')}' нет сохраненных местоположений")
-                return None
-            
-            # Берем последнее (самое свежее) местоположение
-            location = element["locations"][0]
-            
-            # Проверяем, что у местоположения есть скриншот
-            if not location.get("screenshot"):
-                logger.info(f"У местоположения элемента '{element.get('search_text')}' нет скриншота")
-                return None
+            self.sync_external_changes()
+            screen_hash = phash(screenshot)
+            with self._index_lock.read():
+                similar = self.screen_index.query(screen_hash, max_distance)
+            return [(element_id, distance) for distance, element_id in similar]
+        except Exception as e:
+            logger.error(f"Ошибка при поиске похожих экранов: {str(e)}")
+            return []
+    
+    def find_element_on_same_screen(self, search_text, screenshot, context_info=None, max_distance=SAME_SCREEN_DISTANCE):
+        """
+        Находит элемент без запросов к API, если скриншот почти совпадает с экраном,
+        на котором элемент уже был найден. Координаты берутся из местоположения
+        с ближайшим хешем экрана и подтверждаются сравнением изображения элемента.
+        
+        Args:
+            search_text (str): Искомый текст
+            screenshot (PIL.Image): Скриншот, на котором ищется элемент
+            context_info (str, optional): Контекстная информация
+            max_distance (int): Максимальное расстояние Хэмминга между хешами экранов
             
-            # Загружаем сохраненный скриншот
-            screenshot_path = os.path.join(self.screenshots_dir, location["screenshot"])
-            if not os.path.exists(screenshot_path):
-                logger.warning(f"Файл скриншота не найден: {screenshot_path}")
+        Returns:
+            tuple или None: Координаты элемента на скриншоте или None
+        """
+        try:
+            self.sync_external_changes()
+            screen_hash = phash(screenshot)
+            with self._index_lock.read():
+                similar = {element_id: distance for distance, element_id in self.screen_index.query(screen_hash, max_distance)}
+            if not similar:
                 return None
             
-            # Получаем текущий скриншот
-            current_screen = pyautogui.screenshot()
-            current_width, current_height = current_screen.size
-            
-            # Извлекаем координаты и размеры
-            saved_x, saved_y = location["coordinates"]
-            saved_width, saved_height = location["screen_size"]
-            element_x, element_y, element_width, element_height = location["element_rect"]
-            
-            # Масштабируем координаты, если размер экрана изменился
-            scale_x = current_width / saved_width
-            scale_y = current_height / saved_height
-            
-            scaled_x = int(saved_x * scale_x)
-            scaled_y = int(saved_y * scale_y)
-            
-            # Масштабируем размеры прямоугольника элемента
-            scaled_element_x = int(element_x * scale_x)
-            scaled_element_y = int(element_y * scale_y)
-            scaled_element_width = int(element_width * scale_x)
-            scaled_element_height = int(element_height * scale_y)
-            
-            # Загружаем сохраненное изображение элемента
-            saved_element_img = Image.open(screenshot_path)
-            
-            # Создаем область для поиска элемента с учетом допустимого смещения
-            search_left = max(0, scaled_element_x - max_offset_pixels)
-            search_top = max(0, scaled_element_y - max_offset_pixels)
-            search_right = min(current_width, scaled_element_x + scaled_element_width + max_offset_pixels)
-            search_bottom = min(current_height, scaled_element_y + scaled_element_height + max_offset_pixels)
+            # Сначала точный ID, затем элементы с почти тем же текстом
+            candidate_ids = [self._generate_element_id(search_text, context_info)]
+            with self._index_lock.read():
+                text_matches = self.text_index.search(search_text, limit=self.text_match_limit, min_score=0.9)
+            candidate_ids += [element_id for element_id, _ in text_matches]
+            
+            # У каждого кандидата берем местоположение, сохраненное на самом похожем экране
+            candidates = []
+            for element_id in dict.fromkeys(candidate_ids):
+                if element_id not in similar:
+                    continue
+                element = self.storage.get(element_id)
+                if not element:
+                    continue
+                location, same_screen = self._closest_location(element, screen_hash, max_distance)
+                if same_screen:
+                    candidates.append(dict(element, locations=[location]))
+            
+            # Изображения всех кандидатов проверяются одним проходом по скриншоту
+            matches = self.verifier.verify(screenshot, candidates)
+            screen_width, screen_height = screenshot.size
+            for element in candidates:
+                location = element["locations"][0]
+                match = matches.get(element["id"])
+                if match is None:
+                    # Изображения элемента нет, достаточно совпадения экрана
+                    saved_width, saved_height = location["screen_size"]
+                    original_x, original_y = location["coordinates"]
+                    coordinates = (int(original_x * screen_width / saved_width), int(original_y * screen_height / saved_height))
+                elif match["matched"]:
+                    coordinates = match["coordinates"]
+                else:
+                    logger.info(f"Экран совпал, но элемент '{element['search_text']}' не подтвержден (сходство: {match['score'] * 100:.2f}%)")
+                    continue
+                
+                self.storage.record_search(element["id"], True, int(time.time()))
+                self._record_cluster_outcomes(element["id"], {location.get("cluster"): True})
+                logger.info(f"Элемент '{element['search_text']}' найден на том же экране: {coordinates}")
+                return coordinates
             
-            # Вырезаем область поиска из текущего скриншота
-            search_area = current_screen.crop((search_left, search_top, search_right, search_bottom))
+            return None
+        
+        except Exception as e:
+            logger.error(f"Ошибка при поиске элемента на том же экране: {str(e)}")
+            return None
+    
+    def verify_elements_on_screen(self, elements, max_offset_pixels=10, screenshot=None):
+        """
+        Проверяет все местоположения всех элементов на одном скриншоте.
+        Шаблоны складываются в одну пачку и сравниваются нормированной
+        кросс-корреляцией в окне допустимого смещения.
+        
+        Args:
+            elements (list): Элементы для проверки
+            max_offset_pixels (int): Максимальное смещение в пикселях для поиска
+            screenshot (PIL.Image, optional): Скриншот; по умолчанию делается новый
             
-            # Ресайзим сохраненное изображение элемента до масштабированного размера
-            saved_element_img = saved_element_img.resize((scaled_element_width, scaled_element_height))
+        Returns:
+            dict: ID элемента -> лучшее совпадение {"score", "location", "coordinates", "matched"}
+        """
+        try:
+            if screenshot is None:
+                screenshot = pyautogui.screenshot()
+            return self.verifier.verify(screenshot, elements, max_offset_pixels=max_offset_pixels)
+        except Exception as e:
+            logger.error(f"Ошибка при проверке элементов на экране: {str(e)}")
+            return {}
+    
+    def verify_element_on_screen(self, element, max_offset_pixels=10):
+        """
+        Проверяет, находится ли элемент на текущем экране, сравнивая
+        области вокруг всех сохраненных местоположений с сохраненными изображениями.
+        
+        Args:
+            element (dict): Элемент для проверки
+            max_offset_pixels (int): Максимальное смещение в пикселях для поиска
             
-            # Используем шаблонное сопоставление для поиска элемента
-            import cv2
-            import numpy as np
+        Returns:
+            tuple или None: Актуальные координаты элемента или None, если не найден
+        """
+        # Проверяем, что у элемента есть местоположения
+        if not element.get("locations"):
+            logger.info(f"У элемента '{element.get('search_text')}' нет сохраненных местоположений")
+            return None
+        
+        screenshot = pyautogui.screenshot()
+        match = self.verify_elements_on_screen([element], max_offset_pixels, screenshot).get(element.get("id"))
+        if not match:
+            logger.info(f"У элемента '{element.get('search_text')}' нет сохраненных изображений для проверки")
+            return None
+        
+        if match["matched"]:
+            logger.info(f"Элемент '{element.get('search_text')}' найден на экране в координатах {match['coordinates']}")
+            return match["coordinates"]
+        
+        logger.info(f"Элемент '{element.get('search_text')}' не найден рядом с сохраненной позицией (уверенность: {match['score']:.2f})")
+        return self.relocate_element(element, screenshot)
+    
+    def relocate_element(self, element, screenshot=None):
+        """
+        Ищет элемент, который сдвинулся (прокрутка списка, перемещение окна):
+        расширяющиеся окна вокруг сохраненной позиции, затем весь экран
+        от грубого масштаба к точному. Найденная позиция сохраняется в памяти
+        как новое местоположение элемента.
+        
+        Args:
+            element (dict): Элемент памяти
+            screenshot (PIL.Image, optional): Скриншот; по умолчанию делается новый
             
-            # Конвертируем изображения в формат для cv2
-            search_area_cv = np.array(search_area)
-            search_area_cv = cv2.cvtColor(search_area_cv, cv2.COLOR_RGB2BGR)
+        Returns:
+            tuple или None: Координаты элемента на текущем экране или None
+        """
+        try:
+            # Используется самое недавнее местоположение с сохраненным изображением
+            location = next((location for location in element.get("locations", [])
+                             if location.get("screenshot") and location["screenshot"] in self.blobs), None)
+            if location is None:
+                return None
             
-            saved_element_cv = np.array(saved_element_img)
-            saved_element_cv = cv2.cvtColor(saved_element_cv, cv2.COLOR_RGB2BGR)
+            if screenshot is None:
+                screenshot = pyautogui.screenshot()
+            found = self.verifier.relocate(screenshot, location)
+            if not found:
+                logger.info(f"Элемент '{element.get('search_text')}' не найден на экране при расширенном поиске")
+                return None
             
-            # Выполняем шаблонное сопоставление
-            try:
-                result = cv2.matchTemplate(search_area_cv, saved_element_cv, cv2.TM_CCOEFF_NORMED)
-                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-                
-                # Если найдено совпадение с достаточной уверенностью
-                if max_val >= 0.7:  # Порог уверенности
-                    # Вычисляем координаты найденного элемента на полном экране
-                    found_x = search_left + max_loc[0] + scaled_element_width // 2
-                    found_y = search_top + max_loc[1] + scaled_element_height // 2
-                    
-                    logger.info(f"Элемент '{element.get('search_text')}' найден на экране в координатах ({found_x}, {found_y})")
-                    return (found_x, found_y)
-                else:
-                    logger.info(f"Элемент '{element.get('search_text')}' не найден на текущем экране (уверенность: {max_val:.2f})")
-                    return None
+            # Записываем найденную позицию как новое местоположение (изображение элемента то же)
+            timestamp = int(time.time())
+            new_location = dict(
+                location,
+                coordinates=found["coordinates"],
+                screen_size=screenshot.size,
+                element_rect=found["element_rect"],
+                match_percentage=int(found["score"] * 100),
+                timestamp=timestamp,
+                screen_hash=self._get_screenshot_hash(screenshot)
+            )
             
-            except Exception as cv_error:
-                logger.error(f"Ошибка при шаблонном сопоставлении: {str(cv_error)}")
-                
-                # Используем простое сравнение, если cv2 не доступен или произошла ошибка
-                # Сравниваем изображения попиксельно
-                current_small = search_area.resize((50, 50), Image.LANCZOS).convert('L')
-                saved_small = saved_element_img.resize((50, 50), Image.LANCZOS).convert('L')
-                
-                # Преобразуем в массивы
-                current_array = np.array(current_small)
-                saved_array = np.array(saved_small)
-                
-                # Вычисляем среднеквадратичную ошибку (MSE)
-                mse = np.mean((current_array - saved_array) ** 2)
-                # Преобразуем MSE в показатель сходства (0-100%)
-                similarity = max(0, 100 - min(100, mse / 10))
-                
-                # Если сходство достаточно высокое, считаем что элемент найден
-                if similarity >= 70:  # Порог сходства
-                    logger.info(f"Элемент '{element.get('search_text')}' найден на экране с помощью простого сравнения")
-                    return (scaled_x, scaled_y)
-                else:
-                    logger.info(f"Элемент '{element.get('search_text')}' не найден на текущем экране (сходство: {similarity:.2f}%)")
+            def add_location(stored):
+                if not stored or not self.blobs.add_ref(location["screenshot"]):
                     return None
+                # Новая позиция попадает в свой кластер (например, другой размер окна)
+                self.clusterer.assign(stored, new_location, timestamp)
+                stored["locations"].insert(0, new_location)
+                self._trim_locations(stored)
+                stored["last_found"] = timestamp
+                return stored
+            
+            with self._write_lock:
+                stored = self.storage.update(element["id"], add_location)
+                if stored:
+                    self._index_screen_hashes(stored)
+            
+            logger.info(f"Элемент '{element.get('search_text')}' найден на новом месте: {found['coordinates']}")
+            return found["coordinates"]
         
         except Exception as e:
-            logger.error(f"Ошибка при проверке элемента на экране: {str(e)}")
+            logger.error(f"Ошибка при поиске сдвинутого элемента: {str(e)}")
+            return None
+    
+    def _verify_ranked(self, element, screenshot, screen_hash, outcomes):
+        """
+        Проверяет элемент на скриншоте, начиная с самого вероятного кластера.
+        Обычно достаточно одной проверки; если она не подтвердила элемент,
+        остальные местоположения проверяются одной пачкой.
+        
+        Args:
+            element (dict): Элемент памяти
+            screenshot (PIL.Image): Текущий скриншот
+            screen_hash (int): pHash скриншота
+            outcomes (dict): Сюда записываются результаты по кластерам (ID кластера -> подтвержден)
+            
+        Returns:
+            dict или None: Лучшее совпадение {"score", "location", "coordinates", "matched"}
+        """
+        ranked = self._ranked_locations(element, screenshot.size, screen_hash, require_screenshot=True)
+        if not ranked:
             return None
+        first_location = ranked[0][0]
+        match = self.verifier.verify(screenshot, [dict(element, locations=[first_location])]).get(element["id"])
+        if match is None or match["matched"]:
+            if match:
+                outcomes[first_location.get("cluster")] = True
+            return match
+        outcomes[first_location.get("cluster")] = False
+        
+        rest = [location for location in element["locations"] if location is not first_location]
+        other = self.verifier.verify(screenshot, [dict(element, locations=rest)]).get(element["id"]) if rest else None
+        if other and other["matched"]:
+            outcomes[other["location"].get("cluster")] = True
+            return other
+        return match
+    
+    def _verify_best_candidate(self, candidates):
+        """
+        Проверяет всех кандидатов одним проходом и выбирает первого подтвержденного.
+        
+        Args:
+            candidates (list): Элементы, отсортированные по убыванию сходства
+            
+        Returns:
+            tuple: (элемент, координаты); если никто не найден - (первый кандидат, None)
+        """
+        screenshot = pyautogui.screenshot()
+        screen_hash = phash(screenshot)
+        
+        # Сначала по одному местоположению каждого кандидата - из его самого вероятного кластера
+        first_locations = {}
+        for element in candidates:
+            ranked = self._ranked_locations(element, screenshot.size, screen_hash, require_screenshot=True)
+            if ranked:
+                first_locations[element["id"]] = ranked[0][0]
+        matches = self.verify_elements_on_screen(
+            [dict(element, locations=[first_locations[element["id"]]]) for element in candidates if element["id"] in first_locations],
+            screenshot=screenshot)
+        for element in candidates:
+            match = matches.get(element.get("id"))
+            if match and match["matched"]:
+                self._record_cluster_outcomes(element["id"], {match["location"].get("cluster"): True})
+                return element, match["coordinates"]
+        
+        # Затем остальные местоположения всех кандидатов одной пачкой
+        rest = [dict(element, locations=[location for location in element.get("locations", [])
+                                         if location is not first_locations.get(element["id"])])
+                for element in candidates]
+        matches = self.verify_elements_on_screen([element for element in rest if element["locations"]], screenshot=screenshot)
+        for element in candidates:
+            match = matches.get(element.get("id"))
+            if match and match["matched"]:
+                first_location = first_locations.get(element["id"])
+                outcomes = {first_location.get("cluster"): False} if first_location else {}
+                outcomes[match["location"].get("cluster")] = True
+                self._record_cluster_outcomes(element["id"], outcomes)
+                return element, match["coordinates"]
+        
+        # Рядом с сохраненными позициями никого нет - ищем сдвинувшиеся элементы
+        for element in candidates[:self.relocation_limit]:
+            coordinates = self.relocate_element(element, screenshot)
+            if coordinates:
+                return element, coordinates
+        return candidates[0], None
     
     def find_element_by_text(self, search_text, screen_context, context_info=None, check_visually=True, ask_confirmation=False):
         """
@@ -1008,6 +1443,7 @@ class MemoryManager:
                 - "ask_confirmation": True если нужно запросить подтверждение
         """
         try:
+            self.sync_external_changes()
             result = {
                 "coordinates": None,
                 "found_in_memory": False,
@@ -1016,34 +1452,25 @@ class MemoryManager:
                 "ask_confirmation": False
             }
             
-            # Поиск всех элементов с похожим текстом в памяти
-            all_elements = self.get_all_elements()
+            # Поиск элементов с похожим текстом по триграммному индексу
+            # (результаты уже отсортированы по убыванию сходства текста)
+            with self._index_lock.read():
+                found = self.text_index.search(search_text, limit=self.text_match_limit)
             text_matches = []
-            
-            # Фильтруем элементы с похожим текстом, игнорируя регистр
-            search_text_lower = search_text.lower()
-            for element in all_elements:
-                element_text = element.get("search_text", "").lower()
-                if search_text_lower in element_text or element_text in search_text_lower:
-                    # Если элемент найден по тексту, добавляем его в список
+            for element_id, text_score in found:
+                element = self.storage.get(element_id)
+                if element:
+                    element["text_match"] = text_score
                     text_matches.append(element)
             
             logger.info(f"Найдено {len(text_matches)} элементов с похожим текстом '{search_text}'")
+            self.eviction.record_lookup(self._generate_element_id(search_text, context_info), bool(text_matches))
             
             if not text_matches:
                 # Если элементы не найдены по тексту, возвращаем пустой результат
                 logger.info(f"Элементы с текстом '{search_text}' не найдены в памяти")
                 return result
             
-            # Сортируем элементы по точности совпадения текста
-            # Чем меньше разница в длине, тем лучше совпадение
-            for element in text_matches:
-                element_text = element.get("search_text", "").lower()
-                text_difference = abs(len(element_text) - len(search_text_lower))
-                element["text_match"] = 1.0 - min(text_difference / max(len(element_text), len(search_text_lower)), 0.5)
-            
-            text_matches.sort(key=lambda x: x.get("text_match", 0), reverse=True)
-            
             # Если есть контекст экрана, вычисляем сходство контекста для каждого элемента
             if screen_context:
                 # Фильтруем элементы с высоким сходством контекста
@@ -1082,8 +1509,8 @@ class MemoryManager:
                     
                     # Если нужно визуально проверить наличие элемента на экране
                     if check_visually:
-                        logger.info(f"Проверяем наличие элемента на текущем экране...")
-                        coordinates = self.verify_element_on_screen(best_match)
+                        logger.info(f"Проверяем наличие {len(final_candidates)} кандидатов на текущем экране...")
+                        best_match, coordinates = self._verify_best_candidate(final_candidates)
                         
                         if coordinates:
                             # Элемент найден на текущем экране
@@ -1138,8 +1565,8 @@ class MemoryManager:
                     
                     # Если нужно визуально проверить наличие элемента на экране
                     if check_visually:
-                        logger.info(f"Проверяем наличие элемента на текущем экране...")
-                        coordinates = self.verify_element_on_screen(best_match)
+                        logger.info(f"Проверяем наличие {len(text_matches)} кандидатов на текущем экране...")
+                        best_match, coordinates = self._verify_best_candidate(text_matches)
                         
                         if coordinates:
                             # Элемент найден на текущем экране
@@ -1162,8 +1589,8 @@ class MemoryManager:
                 
                 # Если нужно визуально проверить наличие элемента на экране
                 if check_visually:
-                    logger.info(f"Проверяем наличие элемента на текущем экране...")
-                    coordinates = self.verify_element_on_screen(best_match)
+                    logger.info(f"Проверяем наличие {len(text_matches)} кандидатов на текущем экране...")
+                    best_match, coordinates = self._verify_best_candidate(text_matches)
                     
                     if coordinates:
                         # Элемент найден на текущем экране
@@ -1196,7 +1623,94 @@ class MemoryManager:
             logger.error(f"Ошибка при поиске элемента по тексту и контексту: {str(e)}", exc_info=True)
             return {"coordinates": None, "found_in_memory": False, "similar_elements": [], "screen_context": screen_context, "ask_confirmation": False}
 
-# Функция для тестирования
+# Общие для процесса менеджеры памяти по пространствам имен
+_shared_managers = {}
+_shared_manager_lock = threading.Lock()
+
+
+def get_memory_manager(namespace=None, **kwargs):
+    """
+    Возвращает общий для процесса менеджер памяти пространства имен (создается
+    при первом вызове). Модули одного процесса (find_text, telegram_bot, HTTP API)
+    работают с одним экземпляром, разные процессы - через общую базу SQLite:
+    каждый видит найденные другими элементы и статистику сразу после записи.
+    Память других пространств имен не открывается и не индексируется.
+    
+    Args:
+        namespace (str, optional): Пространство имен (приложение или экран);
+            по умолчанию - прежняя общая память
+        **kwargs: Параметры MemoryManager, используются только при создании
+        
+    Returns:
+        MemoryManager: Общий менеджер памяти пространства имен
+    """
+    key = namespace_key(namespace)
+    with _shared_manager_lock:
+        manager = _shared_managers.get(key)
+        if manager is None or manager._closed:
+            manager = MemoryManager(namespace=namespace, **kwargs)
+            _shared_managers[key] = manager
+        elif kwargs:
+            logger.debug("Общий менеджер памяти уже создан, параметры get_memory_manager игнорируются")
+        return manager
+
+
+def find_element_in_namespaces(search_text, screen_context, namespace=None, context_info=None, check_visually=True,
+                               search_other_namespaces=False):
+    """
+    Ищет элемент в памяти своего пространства имен. Только если явно включен
+    запасной вариант search_other_namespaces, при промахе проверяется память
+    остальных пространств, сохраненных на диске; это стоит открытия каждой их
+    базы, поэтому по умолчанию поиск ограничен памятью одного приложения.
+    
+    Args:
+        search_text (str): Текст для поиска
+        screen_context (str): Описание контекста текущего экрана
+        namespace (str, optional): Пространство имен текущего приложения или экрана
+        context_info (str, optional): Дополнительный пользовательский контекст
+        check_visually (bool): Проверять ли визуально наличие элемента (координаты
+            из чужих пространств имен проверяются на текущем экране всегда)
+        search_other_namespaces (bool): Искать ли при промахе в остальных пространствах имен
+        
+    Returns:
+        dict: Результат find_element_by_text с дополнительным полем "namespace" -
+            пространство имен, в памяти которого найден элемент (или свое, если не найден)
+    """
+    manager = get_memory_manager(namespace)
+    result = manager.find_element_by_text(search_text, screen_context, context_info, check_visually)
+    result["namespace"] = manager.namespace
+    if result["coordinates"] or not search_other_namespaces:
+        return result
+    for other in list_namespaces(manager.working_dir):
+        if other == manager.namespace:
+            continue
+        other_result = _find_in_other_namespace(other, search_text, screen_context, context_info)
+        if other_result["coordinates"]:
+            logger.info(f"Элемент '{search_text}' найден в памяти пространства имен {other}")
+            other_result["namespace"] = other
+            return other_result
+    return result
+
+
+def _find_in_other_namespace(namespace, search_text, screen_context, context_info):
+    """
+    Ищет элемент в памяти другого пространства имен с визуальной проверкой:
+    сохраненные там координаты относятся к другому приложению и без проверки
+    на текущем экране не используются. Если общего менеджера этого пространства
+    в процессе нет, открывается временный - без фонового вытеснения - и
+    закрывается сразу после поиска.
+    """
+    with _shared_manager_lock:
+        manager = _shared_managers.get(namespace_key(namespace))
+    if manager is not None and not manager._closed:
+        return manager.find_element_by_text(search_text, screen_context, context_info, check_visually=True)
+    manager = MemoryManager(namespace=namespace, eviction_interval=0)
+    try:
+        return manager.find_element_by_text(search_text, screen_context, context_info, check_visually=True)
+    finally:
+        manager.close()
+
+
 def test_memory_manager():
     """
     Тестирует работу менеджера памяти.
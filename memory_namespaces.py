@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Пространство имен прежней общей памяти (search_memory.db и memory_screenshots)
+DEFAULT_NAMESPACE = "default"
+
+# Директория, в которой у каждого пространства имен своя поддиректория с памятью
+NAMESPACES_DIR = "memory_namespaces"
+
+# Разделители, которыми многие приложения отделяют свое название в заголовке окна
+_TITLE_SEPARATORS = re.compile(r"\s+[-–—|]\s+")
+
+_UNSAFE_CHARS = re.compile(r"[^\w.-]+", re.UNICODE)
+
+
+def namespace_key(namespace):
+    """
+    Приводит название пространства имен (приложения или экрана) к имени
+    директории без учета регистра. Если пришлось заменить символы, добавляется
+    короткий хеш, чтобы разные названия не попали в одну директорию.
+
+    Args:
+        namespace (str): Название пространства имен
+
+    Returns:
+        str: Имя директории
+    """
+    name = (namespace or "").strip().casefold()
+    if not name:
+        return DEFAULT_NAMESPACE
+    key = _UNSAFE_CHARS.sub("_", name).strip("._")
+    if key != name or len(key) > 64:
+        key = f"{key[:48] or 'namespace'}-{hashlib.md5(name.encode('utf-8')).hexdigest()[:8]}"
+    return key
+
+
+def namespace_paths(working_dir, namespace):
+    """
+    Возвращает файлы памяти пространства имен.
+
+    Args:
+        working_dir (str): Рабочая директория памяти
+        namespace (str): Название пространства имен
+
+    Returns:
+        tuple: (файл памяти, директория скриншотов) или (None, None) для пространства
+            по умолчанию, которое хранится в прежних файлах
+    """
+    key = namespace_key(namespace)
+    if key == DEFAULT_NAMESPACE:
+        return None, None
+    directory = os.path.join(working_dir, NAMESPACES_DIR, key)
+    return os.path.join(directory, "memory.db"), os.path.join(directory, "screenshots")
+
+
+def list_namespaces(working_dir):
+    """
+    Возвращает пространства имен, память которых уже есть на диске.
+
+    Args:
+        working_dir (str): Рабочая директория памяти
+
+    Returns:
+        list: Имена директорий пространств имен (пространство по умолчанию первым)
+    """
+    namespaces = [DEFAULT_NAMESPACE]
+    root = os.path.join(working_dir, NAMESPACES_DIR)
+    if os.path.isdir(root):
+        namespaces += sorted(name for name in os.listdir(root)
+                             if os.path.exists(os.path.join(root, name, "memory.db")))
+    return namespaces
+
+
+def application_from_title(title):
+    """
+    Выделяет название приложения из заголовка окна: "Отчет.docx - Word" -> "Word".
+
+    Args:
+        title (str): Заголовок окна
+
+    Returns:
+        str или None: Название приложения
+    """
+    parts = [part for part in _TITLE_SEPARATORS.split(title or "") if part.strip()]
+    return parts[-1].strip() if parts else None
+
+
+def active_application():
+    """
+    Определяет приложение активного окна. Заголовок окна доступен через
+    pyautogui (pygetwindow) не на всех платформах; если его получить
+    нельзя, возвращается None и используется пространство по умолчанию.
+
+    Returns:
+        str или None: Название приложения
+    """
+    try:
+        import pyautogui
+        window = pyautogui.getActiveWindow()
+    except Exception as e:
+        logger.debug(f"Активное окно недоступно: {str(e)}")
+        return None
+    return application_from_title(getattr(window, "title", None))
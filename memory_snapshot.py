@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файла снимка
+SNAPSHOT_VERSION = 1
+
+# Индексы, которые хранятся в снимке (префиксы массивов в файле .npz)
+SNAPSHOT_SECTIONS = ("text", "screen")
+
+
+class IndexSnapshot:
+    """
+    Компактный двоичный снимок заголовочного индекса памяти: нормализованные
+    тексты со списками вхождений триграмм и BK-дерево хешей экранов.
+    Снимок читается при запуске целиком (несколько массивов NumPy), а поисковые
+    структуры восстанавливаются из него при первом обращении - без просмотра
+    хранилища, нормализации текстов и вычисления расстояний Хэмминга.
+    Снимок действителен, пока ревизия хранилища совпадает с сохраненной.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Файл .npz снимка
+        """
+        self.path = path
+
+    def load(self, revision):
+        """
+        Читает снимок, если он соответствует ревизии хранилища.
+
+        Args:
+            revision (str): Текущая ревизия хранилища
+
+        Returns:
+            dict или None: Имя индекса -> массивы его to_arrays,
+                или None, если снимка нет или он устарел
+        """
+        if not revision or not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                if int(saved["version"]) != SNAPSHOT_VERSION or str(saved["revision"]) != revision:
+                    logger.info("Снимок индекса памяти устарел, индекс будет построен по хранилищу")
+                    return None
+                sections = {section: {} for section in SNAPSHOT_SECTIONS}
+                for name in saved.files:
+                    section, _, key = name.partition("__")
+                    if section in sections:
+                        sections[section][key] = saved[name]
+                return sections
+        except Exception as e:
+            logger.error(f"Ошибка при чтении снимка индекса памяти: {str(e)}")
+            return None
+
+    def save(self, revision, indexes):
+        """
+        Записывает снимок.
+
+        Args:
+            revision (str): Ревизия хранилища, которой соответствуют индексы
+            indexes (dict): Имя индекса -> объект с методом to_arrays()
+        """
+        try:
+            arrays = {"version": np.int64(SNAPSHOT_VERSION), "revision": np.array(revision)}
+            for section, index in indexes.items():
+                for key, value in index.to_arrays().items():
+                    arrays[f"{section}__{key}"] = value
+            temp_file = f"{self.path}.{os.getpid()}.temp.npz"
+            np.savez(temp_file, **arrays)
+            os.replace(temp_file, self.path)
+            logger.info(f"Снимок индекса памяти сохранен: {self.path}")
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении снимка индекса памяти: {str(e)}")
@@ -0,0 +1,996 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import threading
+import datetime
+import logging
+from text_index import normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+# Временные поля, которые MemoryManager добавляет к элементам во время поиска.
+# В хранилище они не записываются.
+TRANSIENT_ELEMENT_KEYS = ("text_match", "context_similarity", "combined_score")
+
+# Поля местоположения, которые хранятся в отдельных колонках таблицы locations
+_LOCATION_COLUMNS = ("coordinates", "screen_size", "element_rect", "match_percentage",
+                     "timestamp", "screen_hash", "screenshot")
+
+# Поля элемента, которые хранятся в отдельных колонках таблицы elements
+_ELEMENT_COLUMNS = ("id", "search_text", "context_info", "screen_context", "created",
+                    "last_found", "success_count", "total_searches", "success_rate", "locations")
+
+
+def strip_transient_keys(element):
+    """
+    Возвращает копию элемента без временных полей поиска.
+
+    Args:
+        element (dict): Элемент памяти
+
+    Returns:
+        dict: Копия элемента для записи в хранилище
+    """
+    return {key: value for key, value in element.items() if key not in TRANSIENT_ELEMENT_KEYS}
+
+
+def copy_element(element):
+    """
+    Возвращает независимую копию элемента: списки местоположений и кластеров
+    копируются вместе со словарями, поэтому изменения копии не видны другим
+    потокам, читающим тот же элемент.
+
+    Args:
+        element (dict): Элемент памяти
+
+    Returns:
+        dict: Копия элемента без временных полей поиска
+    """
+    copy = strip_transient_keys(element)
+    for key in ("locations", "clusters"):
+        if key in copy:
+            copy[key] = [dict(item) for item in copy[key]]
+    return copy
+
+
+class JsonMemoryStorage:
+    """
+    Хранилище памяти в одном JSON файле.
+    Элементы индексируются в памяти процесса по ID (поиск по тексту выполняет
+    триграммный индекс менеджера памяти), а файл перезаписывается фоновым потоком, который объединяет изменения
+    за окно flush_interval секунд (write-behind).
+    Элементы отдаются и принимаются копиями: вызывающий код может изменять
+    полученный элемент, не мешая другим потокам и записи файла.
+    """
+
+    def __init__(self, path, flush_interval=2.0):
+        """
+        Инициализирует JSON хранилище.
+
+        Args:
+            path (str): Путь к JSON файлу памяти
+            flush_interval (float): Окно объединения изменений перед записью на диск
+                в секундах. 0 - синхронная запись при каждом изменении.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.memory = self._load()
+
+        # Основной индекс по ID (порядок вставки сохраняется) и счетчик местоположений
+        self._elements = {}
+        self._location_counts = {}
+        self._location_total = 0
+        for element in self.memory.pop("elements"):
+            self._index(element)
+
+        # Повторно входимая: change в update может читать хранилище
+        self._lock = threading.RLock()
+        # Запись файла (фоновый поток, синхронное сохранение, закрытие) выполняется по одной
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._dirty_event = threading.Event()
+        self._closed = threading.Event()
+        self._writer = None
+        if self.flush_interval > 0:
+            self._writer = threading.Thread(target=self._write_behind_loop, name="memory-write-behind", daemon=True)
+            self._writer.start()
+        atexit.register(self.close)
+
+    def _load(self):
+        """
+        Загружает данные из файла памяти или создает пустую структуру.
+
+        Returns:
+            dict: Структура памяти
+        """
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    memory = json.load(f)
+                memory.setdefault("elements", [])
+                memory.setdefault("revision", uuid.uuid4().hex)
+                logger.info(f"Память успешно загружена из {self.path} - найдено {len(memory['elements'])} элементов")
+                return memory
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке памяти: {str(e)}")
+                return self._create_empty()
+        logger.info(f"Файл памяти не найден: {self.path}. Создаем новую память.")
+        return self._create_empty()
+
+    def _create_empty(self):
+        """
+        Создает пустую структуру памяти.
+
+        Returns:
+            dict: Пустая структура памяти
+        """
+        return {
+            "elements": [],
+            "last_updated": datetime.datetime.now().isoformat(),
+            "revision": uuid.uuid4().hex,
+            "version": "1.0"
+        }
+
+    def _index(self, element):
+        """Добавляет элемент во все индексы."""
+        location_count = len(element.get("locations", []))
+        self._elements[element["id"]] = element
+        # Количество запоминаем отдельно: элемент может измениться до повторной индексации
+        self._location_counts[element["id"]] = location_count
+        self._location_total += location_count
+
+    def _unindex(self, element_id):
+        """Удаляет элемент из всех индексов и возвращает его."""
+        element = self._elements.pop(element_id, None)
+        if element is None:
+            return None
+        self._location_total -= self._location_counts.pop(element_id)
+        return element
+
+    def _bump_revision(self):
+        """Меняет ревизию памяти при добавлении, изменении или удалении элементов."""
+        self.memory["revision"] = uuid.uuid4().hex
+
+    def _mark_dirty(self):
+        """
+        Отмечает память как измененную. Запись на диск выполняет фоновый поток,
+        при flush_interval=0 - сразу.
+        """
+        self.memory["last_updated"] = datetime.datetime.now().isoformat()
+        if self._writer is None or self._closed.is_set():
+            self._save()
+            return
+        self._dirty = True
+        self._dirty_event.set()
+
+    def _write_behind_loop(self):
+        """Фоновый поток: ждет изменений, выдерживает окно объединения и сохраняет файл."""
+        while not self._closed.is_set():
+            self._dirty_event.wait()
+            # Собираем все изменения, пришедшие за окно, в одну запись
+            # (при закрытии ожидание прерывается, остаток сохраняет close)
+            if self._closed.wait(self.flush_interval):
+                break
+            self._dirty_event.clear()
+            self._save()
+
+    def _save(self):
+        """
+        Сохраняет текущую память в файл.
+        """
+        try:
+            with self._save_lock:
+                with self._lock:
+                    self._dirty = False
+                    snapshot = dict(self.memory, elements=list(self._elements.values()))
+                    data = json.dumps(snapshot, ensure_ascii=False, indent=2)
+
+                # Сначала сохраняем во временный файл для предотвращения повреждения при сбое
+                temp_file = f"{self.path}.{os.getpid()}.temp"
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                os.replace(temp_file, self.path)
+
+            logger.info(f"Память успешно сохранена в {self.path} - {len(snapshot['elements'])} элементов")
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении памяти: {str(e)}")
+
+    def get(self, element_id):
+        """
+        Возвращает элемент по ID.
+
+        Args:
+            element_id (str): ID элемента
+
+        Returns:
+            dict или None: Элемент или None, если не найден
+        """
+        with self._lock:
+            element = self._elements.get(element_id)
+            return copy_element(element) if element is not None else None
+
+    def all(self):
+        """
+        Возвращает все элементы.
+
+        Returns:
+            list: Список элементов
+        """
+        with self._lock:
+            return [copy_element(element) for element in self._elements.values()]
+
+    def texts(self):
+        """
+        Возвращает ID и текст всех элементов (для построения текстового индекса).
+
+        Returns:
+            list: Пары (ID элемента, search_text)
+        """
+        with self._lock:
+            return [(element_id, element.get("search_text", "")) for element_id, element in self._elements.items()]
+
+    def contexts(self):
+        """
+        Возвращает ID и контекст экрана всех элементов (для индекса контекстов).
+
+        Returns:
+            list: Пары (ID элемента, screen_context)
+        """
+        with self._lock:
+            return [(element_id, element.get("screen_context", "")) for element_id, element in self._elements.items()]
+
+    def screen_hashes(self):
+        """
+        Возвращает хеши экранов всех местоположений (для индекса похожих экранов).
+
+        Returns:
+            list: Пары (ID элемента, screen_hash)
+        """
+        with self._lock:
+            return [(element_id, location.get("screen_hash")) for element_id, element in self._elements.items()
+                    for location in element.get("locations", [])]
+
+    def put(self, element):
+        """
+        Добавляет новый элемент или заменяет существующий с тем же ID.
+
+        Args:
+            element (dict): Элемент памяти
+        """
+        element = copy_element(element)
+        with self._lock:
+            self._unindex(element["id"])
+            self._index(element)
+            self._bump_revision()
+        self._mark_dirty()
+
+    def put_many(self, elements):
+        """
+        Добавляет или заменяет несколько элементов одной записью.
+
+        Args:
+            elements (iterable): Элементы памяти
+        """
+        elements = [copy_element(element) for element in elements]
+        with self._lock:
+            for element in elements:
+                self._unindex(element["id"])
+                self._index(element)
+            self._bump_revision()
+        self._mark_dirty()
+
+    def record_search(self, element_id, success, timestamp):
+        """
+        Учитывает результат поиска элемента в статистике.
+        Запись на диск откладывается, поиск не ждет ввода-вывода.
+
+        Args:
+            element_id (str): ID элемента
+            success (bool): Был ли поиск успешным
+            timestamp (int): Время поиска
+
+        Returns:
+            dict или None: Обновленный элемент или None, если не найден
+        """
+        with self._lock:
+            element = self._elements.get(element_id)
+            if element is None:
+                return None
+            element["total_searches"] += 1
+            if success:
+                element["success_count"] += 1
+                element["last_found"] = timestamp
+            element["success_rate"] = element["success_count"] / element["total_searches"]
+            element = copy_element(element)
+        self._mark_dirty()
+        return element
+
+    def update(self, element_id, change):
+        """
+        Изменяет элемент атомарно: чтение, change и запись выполняются
+        под блокировкой хранилища.
+
+        Args:
+            element_id (str): ID элемента
+            change (callable): Получает копию текущего элемента (None, если его нет)
+                и возвращает элемент для записи или None, если записывать не нужно
+
+        Returns:
+            dict или None: Записанный элемент или None, если запись не понадобилась
+        """
+        with self._lock:
+            element = self._elements.get(element_id)
+            element = change(copy_element(element) if element is not None else None)
+            if element is None:
+                return None
+            element = copy_element(element)
+            self._unindex(element["id"])
+            self._index(element)
+            self._bump_revision()
+        self._mark_dirty()
+        return copy_element(element)
+
+    def update_fields(self, element_id, **fields):
+        """
+        Обновляет отдельные поля элемента.
+
+        Args:
+            element_id (str): ID элемента
+            **fields: Новые значения полей
+
+        Returns:
+            bool: True если элемент найден и обновлен
+        """
+        return self.update(element_id, lambda element: dict(element, **fields) if element else None) is not None
+
+    def delete(self, element_ids):
+        """
+        Удаляет элементы по ID.
+
+        Args:
+            element_ids (iterable): ID элементов для удаления
+
+        Returns:
+            int: Количество удаленных элементов
+        """
+        removed_count = 0
+        with self._lock:
+            for element_id in set(element_ids):
+                if self._unindex(element_id) is not None:
+                    removed_count += 1
+            if removed_count:
+                self._bump_revision()
+        if removed_count:
+            self._mark_dirty()
+        return removed_count
+
+    def count(self):
+        """Возвращает количество элементов."""
+        return len(self._elements)
+
+    def location_count(self):
+        """Возвращает общее количество местоположений."""
+        return self._location_total
+
+    def element_summaries(self):
+        """
+        Возвращает статистику всех элементов без местоположений (для политики вытеснения).
+
+        Returns:
+            list: Словари с полями id, last_found, success_count, total_searches,
+                success_rate, location_count
+        """
+        with self._lock:
+            return [{
+                "id": element_id,
+                "last_found": element["last_found"],
+                "success_count": element["success_count"],
+                "total_searches": element["total_searches"],
+                "success_rate": element["success_rate"],
+                "location_count": self._location_counts[element_id]
+            } for element_id, element in self._elements.items()]
+
+    def average_success_rate(self):
+        """Возвращает среднюю точность по всем элементам."""
+        with self._lock:
+            if not self._elements:
+                return 0
+            return sum(element["success_rate"] for element in self._elements.values()) / len(self._elements)
+
+    def last_updated(self):
+        """Возвращает время последнего изменения памяти."""
+        return self.memory.get("last_updated", "")
+
+    def revision(self):
+        """Возвращает ревизию памяти (меняется при изменении состава или содержимого элементов)."""
+        return self.memory.get("revision", "")
+
+    def data_version(self):
+        """
+        JSON файл принадлежит одному процессу: изменения других процессов
+        не отслеживаются.
+        """
+        return None
+
+    def last_change(self):
+        """Журнала изменений у JSON хранилища нет."""
+        return 0
+
+    def changes_since(self, seq):
+        """Журнала изменений у JSON хранилища нет."""
+        return seq, set()
+
+    def file_size(self):
+        """Возвращает размер файла памяти в байтах."""
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def flush(self):
+        """Синхронно записывает несохраненные изменения на диск."""
+        if self._dirty:
+            self._save()
+
+    def close(self):
+        """Останавливает фоновую запись и сохраняет несохраненные изменения."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._dirty_event.set()
+        if self._writer is not None and self._writer is not threading.current_thread():
+            self._writer.join(timeout=self.flush_interval + 5)
+        self.flush()
+        atexit.unregister(self.close)
+
+
+class SqliteMemoryStorage:
+    """
+    Хранилище памяти в SQLite (режим WAL).
+    Элементы и их местоположения лежат в отдельных таблицах,
+    статистика обновляется построчно без перезаписи всей памяти.
+    """
+
+    SCHEMA_VERSION = 1
+
+    # Сколько последних изменений хранится в журнале и как часто он очищается
+    CHANGE_LOG_SIZE = 10000
+    CHANGE_LOG_PRUNE_STEP = 1000
+
+    def __init__(self, path, migrate_from=None):
+        """
+        Инициализирует SQLite хранилище.
+
+        Args:
+            path (str): Путь к файлу базы данных
+            migrate_from (str, optional): Путь к старому JSON файлу памяти
+                для однократного переноса данных
+        """
+        self.path = path
+        # Одно соединение используется из нескольких потоков: транзакции и запросы упорядочиваются блокировкой
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self._create_schema()
+
+        if migrate_from:
+            migrate_json_to_sqlite(migrate_from, self)
+
+        logger.info(f"SQLite хранилище памяти открыто: {self.path} - {self.count()} элементов")
+
+    def _create_schema(self):
+        """Создает таблицы и индексы, если их еще нет."""
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS elements (
+                id TEXT PRIMARY KEY,
+                search_text TEXT NOT NULL,
+                search_text_norm TEXT NOT NULL,
+                context_info TEXT NOT NULL DEFAULT '',
+                screen_context TEXT NOT NULL DEFAULT '',
+                created INTEGER,
+                last_found INTEGER,
+                success_count INTEGER NOT NULL DEFAULT 0,
+                total_searches INTEGER NOT NULL DEFAULT 0,
+                success_rate REAL NOT NULL DEFAULT 0,
+                extra TEXT
+            );
+            CREATE TABLE IF NOT EXISTS locations (
+                pk INTEGER PRIMARY KEY AUTOINCREMENT,
+                element_id TEXT NOT NULL REFERENCES elements(id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                coordinates TEXT,
+                screen_size TEXT,
+                element_rect TEXT,
+                match_percentage REAL,
+                timestamp INTEGER,
+                screen_hash TEXT,
+                screenshot TEXT,
+                extra TEXT
+            );
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                element_id TEXT NOT NULL
+            );
+            -- Поиск по тексту выполняет триграммный индекс в памяти процесса;
+            -- индекс прежних версий по нормализованному тексту не используется
+            DROP INDEX IF EXISTS idx_elements_text_norm;
+            CREATE INDEX IF NOT EXISTS idx_locations_element ON locations(element_id, position);
+        """)
+        self._set_meta("schema_version", str(self.SCHEMA_VERSION), overwrite=False)
+        self._set_meta("revision", uuid.uuid4().hex, overwrite=False)
+
+    def _get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def _set_meta(self, key, value, overwrite=True):
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        self.conn.execute(f"{verb} INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _touch(self):
+        """Обновляет время последнего изменения памяти."""
+        self._set_meta("last_updated", datetime.datetime.now().isoformat())
+
+    def _bump_revision(self):
+        """Меняет ревизию памяти при добавлении, изменении или удалении элементов."""
+        self._set_meta("revision", uuid.uuid4().hex)
+
+    def _log_changes(self, element_ids):
+        """
+        Записывает ID измененных элементов в журнал изменений, по которому другие
+        процессы обновляют свои индексы. Старые записи журнала удаляются.
+        """
+        seq = None
+        for element_id in element_ids:
+            seq = self.conn.execute("INSERT INTO changes (element_id) VALUES (?)", (element_id,)).lastrowid
+        if seq is not None and seq // self.CHANGE_LOG_PRUNE_STEP != (seq - len(element_ids)) // self.CHANGE_LOG_PRUNE_STEP:
+            self.conn.execute("DELETE FROM changes WHERE seq <= ?", (seq - self.CHANGE_LOG_SIZE,))
+
+    def _location_from_row(self, row):
+        """Собирает словарь местоположения из строки таблицы locations."""
+        location = json.loads(row["extra"]) if row["extra"] else {}
+        location.update({
+            "coordinates": json.loads(row["coordinates"]) if row["coordinates"] else None,
+            "screen_size": json.loads(row["screen_size"]) if row["screen_size"] else None,
+            "element_rect": json.loads(row["element_rect"]) if row["element_rect"] else None,
+            "match_percentage": row["match_percentage"],
+            "timestamp": row["timestamp"],
+            "screen_hash": row["screen_hash"],
+            "screenshot": row["screenshot"]
+        })
+        return location
+
+    def _element_from_row(self, row, locations):
+        """Собирает словарь элемента из строки таблицы elements."""
+        element = json.loads(row["extra"]) if row["extra"] else {}
+        element.update({
+            "id": row["id"],
+            "search_text": row["search_text"],
+            "context_info": row["context_info"],
+            "screen_context": row["screen_context"],
+            "created": row["created"],
+            "last_found": row["last_found"],
+            "locations": locations,
+            "success_count": row["success_count"],
+            "total_searches": row["total_searches"],
+            "success_rate": row["success_rate"]
+        })
+        return element
+
+    def _load_elements(self, rows):
+        """Загружает местоположения для строк элементов и собирает словари."""
+        rows = list(rows)
+        if not rows:
+            return []
+        locations_by_element = {row["id"]: [] for row in rows}
+        ids = list(locations_by_element)
+        # Ограничение SQLite на количество параметров запроса
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for location_row in self.conn.execute(
+                f"SELECT * FROM locations WHERE element_id IN ({placeholders}) ORDER BY element_id, position",
+                chunk
+            ):
+                locations_by_element[location_row["element_id"]].append(self._location_from_row(location_row))
+        return [self._element_from_row(row, locations_by_element[row["id"]]) for row in rows]
+
+    def get(self, element_id):
+        """
+        Возвращает элемент по ID (поиск по первичному ключу).
+
+        Args:
+            element_id (str): ID элемента
+
+        Returns:
+            dict или None: Элемент или None, если не найден
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM elements WHERE id = ?", (element_id,)).fetchone()
+            if row is None:
+                return None
+            return self._load_elements([row])[0]
+
+    def all(self):
+        """
+        Возвращает все элементы в порядке добавления.
+
+        Returns:
+            list: Список элементов
+        """
+        with self._lock:
+            return self._load_elements(self.conn.execute("SELECT * FROM elements ORDER BY rowid"))
+
+    def texts(self):
+        """
+        Возвращает ID и текст всех элементов без загрузки местоположений.
+
+        Returns:
+            list: Пары (ID элемента, search_text)
+        """
+        with self._lock:
+            return [(row["id"], row["search_text"]) for row in
+                    self.conn.execute("SELECT id, search_text FROM elements ORDER BY rowid")]
+
+    def contexts(self):
+        """
+        Возвращает ID и контекст экрана всех элементов без загрузки местоположений.
+
+        Returns:
+            list: Пары (ID элемента, screen_context)
+        """
+        with self._lock:
+            return [(row["id"], row["screen_context"]) for row in
+                    self.conn.execute("SELECT id, screen_context FROM elements ORDER BY rowid")]
+
+    def screen_hashes(self):
+        """
+        Возвращает хеши экранов всех местоположений без загрузки остальных полей.
+
+        Returns:
+            list: Пары (ID элемента, screen_hash)
+        """
+        with self._lock:
+            return [(row["element_id"], row["screen_hash"]) for row in
+                    self.conn.execute("SELECT element_id, screen_hash FROM locations")]
+
+    def _write_element(self, element):
+        """Записывает строку элемента и все его местоположения."""
+        element = strip_transient_keys(element)
+        extra = {key: value for key, value in element.items() if key not in _ELEMENT_COLUMNS}
+        self.conn.execute(
+            "INSERT INTO elements (id, search_text, search_text_norm, context_info, screen_context, created, "
+            "last_found, success_count, total_searches, success_rate, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET search_text = excluded.search_text, "
+            "search_text_norm = excluded.search_text_norm, context_info = excluded.context_info, "
+            "screen_context = excluded.screen_context, created = excluded.created, "
+            "last_found = excluded.last_found, success_count = excluded.success_count, "
+            "total_searches = excluded.total_searches, success_rate = excluded.success_rate, extra = excluded.extra",
+            (
+                element["id"], element.get("search_text", ""), normalize_search_text(element.get("search_text", "")),
+                element.get("context_info") or "", element.get("screen_context") or "",
+                element.get("created"), element.get("last_found"),
+                element.get("success_count", 0), element.get("total_searches", 0), element.get("success_rate", 0),
+                json.dumps(extra, ensure_ascii=False) if extra else None
+            )
+        )
+        self.conn.execute("DELETE FROM locations WHERE element_id = ?", (element["id"],))
+        for position, location in enumerate(element.get("locations", [])):
+            location_extra = {key: value for key, value in location.items() if key not in _LOCATION_COLUMNS}
+            self.conn.execute(
+                "INSERT INTO locations (element_id, position, coordinates, screen_size, element_rect, "
+                "match_percentage, timestamp, screen_hash, screenshot, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    element["id"], position,
+                    json.dumps(list(location["coordinates"])) if location.get("coordinates") is not None else None,
+                    json.dumps(list(location["screen_size"])) if location.get("screen_size") is not None else None,
+                    json.dumps(list(location["element_rect"])) if location.get("element_rect") is not None else None,
+                    location.get("match_percentage"), location.get("timestamp"),
+                    location.get("screen_hash"), location.get("screenshot"),
+                    json.dumps(location_extra, ensure_ascii=False) if location_extra else None
+                )
+            )
+
+    def put(self, element):
+        """
+        Добавляет новый элемент или заменяет существующий с тем же ID.
+
+        Args:
+            element (dict): Элемент памяти
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._write_element(element)
+                self._log_changes([element["id"]])
+                self._bump_revision()
+                self._touch()
+
+    def put_many(self, elements):
+        """
+        Добавляет или заменяет несколько элементов в одной транзакции.
+
+        Args:
+            elements (iterable): Элементы памяти
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                element_ids = []
+                for element in elements:
+                    self._write_element(element)
+                    element_ids.append(element["id"])
+                self._log_changes(element_ids)
+                self._bump_revision()
+                self._touch()
+
+    def record_search(self, element_id, success, timestamp):
+        """
+        Учитывает результат поиска элемента в статистике одним UPDATE.
+
+        Args:
+            element_id (str): ID элемента
+            success (bool): Был ли поиск успешным
+            timestamp (int): Время поиска
+
+        Returns:
+            dict или None: Обновленный элемент или None, если не найден
+        """
+        with self._lock:
+            success_increment = 1 if success else 0
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                cursor = self.conn.execute(
+                    "UPDATE elements SET total_searches = total_searches + 1, "
+                    "success_count = success_count + ?, "
+                    "success_rate = CAST(success_count + ? AS REAL) / (total_searches + 1), "
+                    "last_found = CASE WHEN ? THEN ? ELSE last_found END "
+                    "WHERE id = ?",
+                    (success_increment, success_increment, success_increment, timestamp, element_id)
+                )
+                if cursor.rowcount == 0:
+                    return None
+                self._touch()
+            return self.get(element_id)
+
+    def update(self, element_id, change):
+        """
+        Изменяет элемент атомарно: чтение, change и запись выполняются в одной
+        транзакции BEGIN IMMEDIATE. Другие процессы не могут записать элемент
+        между чтением и записью, поэтому их изменения (статистика поиска,
+        новые местоположения) не перезаписываются устаревшей копией.
+
+        Args:
+            element_id (str): ID элемента
+            change (callable): Получает текущий элемент (None, если его нет)
+                и возвращает элемент для записи или None, если записывать не нужно
+
+        Returns:
+            dict или None: Записанный элемент или None, если запись не понадобилась
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                row = self.conn.execute("SELECT * FROM elements WHERE id = ?", (element_id,)).fetchone()
+                element = change(self._load_elements([row])[0] if row is not None else None)
+                if element is None:
+                    return None
+                self._write_element(element)
+                self._log_changes([element["id"]])
+                self._bump_revision()
+                self._touch()
+            return element
+
+    def update_fields(self, element_id, **fields):
+        """
+        Обновляет отдельные поля элемента.
+
+        Args:
+            element_id (str): ID элемента
+            **fields: Новые значения полей
+
+        Returns:
+            bool: True если элемент найден и обновлен
+        """
+        return self.update(element_id, lambda element: dict(element, **fields) if element else None) is not None
+
+    def delete(self, element_ids):
+        """
+        Удаляет элементы по ID вместе с их местоположениями.
+
+        Args:
+            element_ids (iterable): ID элементов для удаления
+
+        Returns:
+            int: Количество удаленных элементов
+        """
+        with self._lock:
+            ids = list(element_ids)
+            if not ids:
+                return 0
+            removed_count = 0
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    removed_count += self.conn.execute(
+                        f"DELETE FROM elements WHERE id IN ({placeholders})", chunk
+                    ).rowcount
+                if removed_count:
+                    self._log_changes(ids)
+                    self._bump_revision()
+                    self._touch()
+            return removed_count
+
+    def count(self):
+        """Возвращает количество элементов."""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM elements").fetchone()[0]
+
+    def location_count(self):
+        """Возвращает общее количество местоположений."""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
+
+    def element_summaries(self):
+        """
+        Возвращает статистику всех элементов без загрузки местоположений.
+
+        Returns:
+            list: Словари с полями id, last_found, success_count, total_searches,
+                success_rate, location_count
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT e.id, e.last_found, e.success_count, e.total_searches, e.success_rate, "
+                "(SELECT COUNT(*) FROM locations l WHERE l.element_id = e.id) AS location_count "
+                "FROM elements e"
+            )
+            return [dict(row) for row in rows]
+
+    def average_success_rate(self):
+        """Возвращает среднюю точность по всем элементам."""
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(AVG(success_rate), 0) FROM elements").fetchone()[0]
+
+    def last_updated(self):
+        """Возвращает время последнего изменения памяти."""
+        with self._lock:
+            return self._get_meta("last_updated", "")
+
+    def revision(self):
+        """Возвращает ревизию памяти (меняется при изменении состава или содержимого элементов)."""
+        with self._lock:
+            return self._get_meta("revision", "")
+
+    def data_version(self):
+        """
+        Возвращает номер версии данных, который меняется, когда изменения
+        фиксирует другое соединение (другой процесс или экземпляр хранилища).
+        """
+        with self._lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def last_change(self):
+        """Возвращает номер последней записи журнала изменений."""
+        with self._lock:
+            return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def changes_since(self, seq):
+        """
+        Возвращает элементы, измененные после записи журнала seq.
+
+        Args:
+            seq (int): Номер последней обработанной записи журнала
+
+        Returns:
+            tuple: (номер последней записи, множество ID элементов); вместо множества
+                None, если нужные записи уже удалены из журнала
+        """
+        with self._lock:
+            rows = self.conn.execute("SELECT seq, element_id FROM changes WHERE seq > ? ORDER BY seq", (seq,)).fetchall()
+            if not rows:
+                return seq, set()
+            first_seq = self.conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            if first_seq > seq + 1:
+                return rows[-1]["seq"], None
+            return rows[-1]["seq"], {row["element_id"] for row in rows}
+
+    def file_size(self):
+        """Возвращает размер файлов базы данных в байтах (вместе с WAL)."""
+        size = 0
+        for path in (self.path, self.path + "-wal"):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        return size
+
+    def flush(self):
+        """Переносит WAL в основной файл базы данных."""
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        """Закрывает соединение с базой данных."""
+        with self._lock:
+            try:
+                self.flush()
+                self.conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка при закрытии SQLite хранилища: {str(e)}")
+
+
+def migrate_json_to_sqlite(json_path, storage):
+    """
+    Однократно переносит память из старого JSON файла в SQLite хранилище.
+    Факт миграции запоминается в таблице meta, исходный файл не изменяется.
+
+    Args:
+        json_path (str): Путь к JSON файлу памяти
+        storage (SqliteMemoryStorage): Целевое хранилище
+
+    Returns:
+        int: Количество перенесенных элементов
+    """
+    if storage._get_meta("migrated_from_json"):
+        return 0
+    if not os.path.exists(json_path):
+        return 0
+
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            memory = json.load(f)
+    except Exception as e:
+        logger.error(f"Ошибка при чтении JSON памяти для миграции: {str(e)}")
+        return 0
+
+    started = time.time()
+    elements = memory.get("elements", [])
+    with storage.conn:
+        storage.conn.execute("BEGIN IMMEDIATE")
+        for element in elements:
+            storage._write_element(element)
+        storage._set_meta("migrated_from_json", json_path)
+        storage._log_changes([element["id"] for element in elements if "id" in element])
+        storage._bump_revision()
+        storage._set_meta("last_updated", str(memory.get("last_updated") or datetime.datetime.now().isoformat()))
+
+    logger.info(f"Миграция памяти из {json_path} в {storage.path}: перенесено {len(elements)} элементов "
+                f"за {time.time() - started:.2f} с")
+    return len(elements)
+
+
+def export_to_json(storage, json_path):
+    """
+    Выгружает память в JSON файл в формате JsonMemoryStorage
+    (для просмотра, резервной копии или переноса).
+
+    Args:
+        storage: Хранилище памяти (JsonMemoryStorage или SqliteMemoryStorage)
+        json_path (str): Путь к JSON файлу
+
+    Returns:
+        int: Количество выгруженных элементов
+    """
+    elements = [strip_transient_keys(element) for element in storage.all()]
+    memory = {
+        "elements": elements,
+        "last_updated": storage.last_updated() or datetime.datetime.now().isoformat(),
+        "revision": storage.revision(),
+        "version": "1.0"
+    }
+    temp_file = json_path + ".temp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(memory, f, ensure_ascii=False, indent=2)
+    os.replace(temp_file, json_path)
+    logger.info(f"Память выгружена в {json_path}: {len(elements)} элементов")
+    return len(elements)
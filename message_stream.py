@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SSEParser:
+    """
+    Построчный разбор потока server-sent events. Подходит и для синхронного,
+    и для асинхронного чтения ответа: строки подаются по одной.
+    """
+
+    def __init__(self):
+        self._event = None
+        self._data = []
+
+    def feed_line(self, line):
+        """
+        Обрабатывает одну строку потока.
+
+        Args:
+            line (str или bytes): Строка без завершающего перевода строки
+
+        Returns:
+            tuple или None: (имя события, данные события как dict), если строка завершила событие
+        """
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r")
+        if not line:
+            return self.flush()
+        if line.startswith(":"):
+            return None
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            self._event = value
+        elif field == "data":
+            self._data.append(value)
+        return None
+
+    def flush(self):
+        """Завершает накопленное событие (пустая строка или конец потока)."""
+        event, data = self._event, self._data
+        self._event = None
+        self._data = []
+        if not data:
+            return None
+        return event, json.loads("\n".join(data))
+
+
+def iter_sse_events(lines):
+    """
+    Разбирает поток server-sent events на события.
+
+    Args:
+        lines (iterable): Строки потока (str или bytes) без завершающих переводов строки
+
+    Yields:
+        tuple: (имя события, данные события как dict)
+    """
+    parser = SSEParser()
+    for line in lines:
+        event = parser.feed_line(line)
+        if event:
+            yield event
+    event = parser.flush()
+    if event:
+        yield event
+
+
+class MessageStream:
+    """
+    Собирает ответ Messages API из событий потока.
+    Блоки содержимого (текст, размышления с подписью, вызовы инструментов)
+    собираются по мере поступления дельт; как только блок вызова инструмента
+    закрыт и его входной JSON полностью получен, вызывается on_tool_use -
+    остальная часть сообщения в это время еще генерируется.
+    """
+
+    def __init__(self, on_tool_use=None):
+        """
+        Инициализирует сборщик.
+
+        Args:
+            on_tool_use (callable, optional): Вызывается с готовым блоком tool_use
+        """
+        self.on_tool_use = on_tool_use
+        self.message = None
+        self.error = None
+        self.complete = False
+        self._partial_json = {}
+        self._finished = set()
+
+    def feed(self, event, data):
+        """
+        Обрабатывает одно событие потока.
+
+        Args:
+            event (str): Имя события (может отсутствовать, тогда берется поле type)
+            data (dict): Данные события
+        """
+        kind = data.get("type") or event
+        if kind == "message_start":
+            self.message = dict(data["message"])
+            self.message["content"] = []
+            self.message["usage"] = dict(self.message.get("usage") or {})
+        elif kind == "content_block_start":
+            block = dict(data["content_block"])
+            if block.get("type") == "tool_use":
+                self._partial_json[data["index"]] = []
+            self._set_block(data["index"], block)
+        elif kind == "content_block_delta":
+            self._apply_delta(data["index"], data["delta"])
+        elif kind == "content_block_stop":
+            self._finish_block(data["index"])
+        elif kind == "message_delta":
+            self.message.update({key: value for key, value in data.get("delta", {}).items() if value is not None})
+            self.message["usage"].update(data.get("usage") or {})
+        elif kind == "message_stop":
+            self.complete = True
+        elif kind == "error":
+            self.error = data.get("error", data)
+            logger.error(f"Ошибка в потоке ответа: {self.error}")
+
+    def _set_block(self, index, block):
+        """Кладет блок на его позицию в содержимом сообщения."""
+        content = self.message["content"]
+        while len(content) <= index:
+            content.append(None)
+        content[index] = block
+
+    def _apply_delta(self, index, delta):
+        """Дописывает дельту в блок."""
+        block = self.message["content"][index]
+        kind = delta.get("type")
+        if kind == "text_delta":
+            block["text"] = block.get("text", "") + delta["text"]
+        elif kind == "thinking_delta":
+            block["thinking"] = block.get("thinking", "") + delta["thinking"]
+        elif kind == "signature_delta":
+            block["signature"] = block.get("signature", "") + delta["signature"]
+        elif kind == "input_json_delta":
+            self._partial_json[index].append(delta["partial_json"])
+        elif kind == "citations_delta":
+            block.setdefault("citations", []).append(delta["citation"])
+
+    def _finish_block(self, index):
+        """Завершает блок; готовый вызов инструмента сразу передается в on_tool_use."""
+        self._finished.add(index)
+        block = self.message["content"][index]
+        if block.get("type") != "tool_use":
+            return
+        partial_json = "".join(self._partial_json.pop(index, []))
+        block["input"] = json.loads(partial_json) if partial_json else (block.get("input") or {})
+        if self.on_tool_use:
+            self.on_tool_use(block)
+
+    def partial_message(self):
+        """
+        Возвращает сообщение только из завершенных блоков - для потока, оборванного
+        после того, как часть вызовов инструментов уже передана в on_tool_use.
+
+        Returns:
+            dict или None: Сообщение с завершенными блоками (None, если сообщение не начато)
+        """
+        if self.message is None:
+            return None
+        message = dict(self.message)
+        message["content"] = [block for index, block in enumerate(self.message["content"])
+                              if index in self._finished]
+        return message
@@ -4,20 +4,58 @@ import os
 import json
 import requests
 import time
-import base64
+from concurrent import futures
 import pyautogui
 import numpy as np
 from PIL import Image
-from io import BytesIO
 import find_element
 from find_element import find_element_on_image, load_api_keys
+from conversation_history import ConversationHistory
+from agent_loop import AgentLoop
+from message_stream import MessageStream, iter_sse_events
+from display_profile import DisplayProfile
+from screen_diff import ScreenTracker
+from ui_settle import UISettle
+from tool_scheduler import ToolScheduler
+from bash_session import BashSession, MAX_OUTPUT_BYTES
+
+# Точка кэширования промпта: префикс запроса до этого блока кэшируется на несколько минут
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Ожидание ответа: потоковый ответ шлет ping, но обычный может генерироваться долго
+REQUEST_TIMEOUT = 600.0
+CONNECT_TIMEOUT = 10.0
+
+
+def build_tools(display_width, display_height):
+    """Описания инструментов computer use (последний блок - точка кэширования)"""
+    return [
+        {
+            "type": "computer_20250124",
+            "name": "computer",
+            "display_width_px": display_width,
+            "display_height_px": display_height,
+            "display_number": 1
+        },
+        {
+            "type": "text_editor_20250124",
+            "name": "str_replace_editor"
+        },
+        {
+            "type": "bash_20250124",
+            "name": "bash",
+            "cache_control": CACHE_CONTROL
+        }
+    ]
+
 
 class AnthropicComputerController:
     """
     Клас для управления компьютером з помощю API Anthropic і PyAutoGUI
     """
     
-    def __init__(self, model_name="claude-3-opus-20240229", api_host=None):
+    def __init__(self, model_name="claude-3-opus-20240229", api_host=None, history=None, stream=True, display=None,
+                 settle_profiles=None, tool_timeouts=None, on_tool_output=None, max_output_bytes=MAX_OUTPUT_BYTES):
         self.working_dir = os.getcwd()
         self.element_path = os.path.join(self.working_dir, "element.png")
         self.screen_path = os.path.join(self.working_dir, "screen.png")
@@ -33,9 +71,16 @@ class AnthropicComputerController:
             self.api_host = api_host
         else:
             self.api_host = "api.anthropic.com"
+        # api_host может содержать схему (например, http://localhost:8080 для локального сервера)
+        if "://" in self.api_host:
+            self.messages_url = f"{self.api_host.rstrip('/')}/v1/messages"
+        else:
+            self.messages_url = f"https://{self.api_host}/v1/messages"
         
-        # Initialize PyAutoGUI with a small pause between actions
-        pyautogui.PAUSE = 0.5
+        # Фиксированной паузы после каждого вызова PyAutoGUI нет: после действия
+        # контроллер ждет, пока экран перестанет меняться (профили по видам действий)
+        pyautogui.PAUSE = 0
+        self.settle = UISettle(settle_profiles)
         
         print(f"Контролер ініціалізовано. Робоча директорія: {self.working_dir}")
         
@@ -44,7 +89,62 @@ class AnthropicComputerController:
         
         # Инициализация контроллера с API ключами
         self.model = "claude-3-7-sonnet-20250219"
-        self.messages = []  # История сообщений для Anthropic
+        # История сообщений для Anthropic: старые скриншоты заменяются заглушками,
+        # старые шаги сворачиваются, чтобы размер запроса не рос с длиной сессии
+        self.history = history if history is not None else ConversationHistory()
+        
+        # Объявляемый модели дисплей: скриншоты уменьшаются до его размера,
+        # координаты модели пересчитываются в координаты экрана
+        self.display = display if display is not None else DisplayProfile()
+        
+        # Неизменившийся экран не выгружается повторно, небольшое изменение отправляется
+        # вырезкой. Полный кадр, к которому относятся вырезки, должен оставаться в истории
+        self.screen_tracker = ScreenTracker(max_partial=max(0, self.history.keep_screenshots - 1))
+        self._summarized_turns = self.history.turns_summarized
+        
+        # Неизменный префикс запроса строится один раз: заголовки, модель, инструменты.
+        # Точка кэширования на последнем инструменте кэширует определения инструментов,
+        # точки на последних сообщениях истории - накопленный префикс диалога
+        self.request_headers = {
+            "content-type": "application/json",
+            "x-api-key": self.anthropic_api_key,
+            "anthropic-version": "2023-06-01",
+            "anthropic-beta": "computer-use-2025-01-24"
+        }
+        self.request_prefix = {
+            "model": self.model,
+            "max_tokens": 2048,
+            "tools": build_tools(self.display.width, self.display.height),
+            "thinking": {
+                "type": "enabled",
+                "budget_tokens": 1024
+            }
+        }
+        
+        # Потоковый ответ (SSE): вызов инструмента начинает выполняться, как только
+        # его входные данные получены, пока остальная часть ответа еще генерируется
+        self.stream = stream
+        self._started_tools = {}
+        
+        # Действия с экраном выполняются по одному в порядке вызовов, bash и редактор -
+        # параллельно с ними, каждый со своим таймаутом
+        self.tools = ToolScheduler(self.execute_tool, timeouts=tool_timeouts)
+        
+        # Одна оболочка на агента: cd и переменные окружения сохраняются между командами.
+        # Вывод команд передается в on_tool_output(имя потока, фрагмент) по мере поступления,
+        # модель получает начало и конец вывода в пределах max_output_bytes
+        self.on_tool_output = on_tool_output
+        self.bash = BashSession(timeout=self.tools.timeout("bash"), max_output_bytes=max_output_bytes,
+                                on_output=self._tool_output)
+        
+        # Использование токенов за сессию (из поля usage ответов)
+        self.usage = {"input_tokens": 0, "output_tokens": 0,
+                      "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+
+    @property
+    def messages(self):
+        """Сообщения истории (в том виде, в котором они хранятся после сжатия)"""
+        return self.history.messages
 
     def take_screenshot(self, filepath=None):
         """Take a screenshot and save it to the specified path"""
@@ -90,15 +190,24 @@ class AnthropicComputerController:
             print(f"Попередження при масштабуванні: {e}")
             return x, y
     
+    def to_screen_coordinates(self, x, y):
+        """Пересчитывает координаты модели (в объявленном дисплее) в координаты экрана"""
+        if x is None or y is None:
+            return x, y
+        if (self.display.width, self.display.height) == (self.display.screen_width, self.display.screen_height):
+            return x, y
+        return self.scale_coordinates(x, y, self.display.screen_width, self.display.screen_height,
+                                      self.display.width, self.display.height)
+    
     def click_at_position(self, x, y):
         """Click at the specified coordinates"""
         try:
-            # Переміщення курсора з анімацією для надійності
-            pyautogui.moveTo(x, y, duration=0.5)
-            # Невелика пауза перед кліком
-            time.sleep(0.2)
-            # Виконання кліка
+            # Переміщення курсора; елементи з реакцією на наведення встигають оновитися
+            pyautogui.moveTo(x, y)
+            self.settle.wait("move")
+            # Виконання кліка і очікування реакції інтерфейсу
             pyautogui.click(x, y)
+            self.settle.wait("click")
             print(f"Клік виконано в позиції ({x}, {y})")
             return True
         except Exception as e:
@@ -108,14 +217,13 @@ class AnthropicComputerController:
     def type_text(self, text):
         """Type the specified text"""
         try:
-            # Невелика пауза перед введенням
-            time.sleep(0.3)
-            # Альтернативний спосіб введення з інтервалами між клавішами
-            pyautogui.write(text, interval=0.05)
+            # Введення з інтервалами між клавішами з профілю
+            pyautogui.write(text, interval=self.settle.profile("type")["key_interval"])
+            self.settle.wait("type")
             print(f"Текст введено: {text}")
             # Перевірка з фокусом
             pyautogui.press('escape')  # Для зняття будь-яких модальних вікон, якщо вони з'явилися
-            time.sleep(0.2)
+            self.settle.wait("key")
             return True
         except Exception as e:
             print(f"Помилка при введенні тексту: {e}")
@@ -124,6 +232,7 @@ class AnthropicComputerController:
     def press_key(self, key):
         """Press the specified key"""
         pyautogui.press(key)
+        self.settle.wait("key")
         print(f"Клавішу натиснуто: {key}")
         return True
     
@@ -152,72 +261,175 @@ class AnthropicComputerController:
         # Возвращаем найденные координаты
         return coordinates
 
-    def send_to_anthropic(self, prompt, add_coordinate=None):
-        """Отправляет запрос к Anthropic API с поддержкой Computer use"""
-        headers = {
-            "content-type": "application/json",
-            "x-api-key": self.anthropic_api_key,
-            "anthropic-version": "2023-06-01",
-            "anthropic-beta": "computer-use-2025-01-24"
-        }
+    def send_to_anthropic(self, prompt, add_coordinate=None, **loop_options):
+        """Отправляет запрос к Anthropic API с поддержкой Computer use и возвращает последний ответ"""
+        return self.run_agent(prompt, add_coordinate, **loop_options)["response"]
+
+    def run_agent(self, prompt, add_coordinate=None, **loop_options):
+        """
+        Добавляет запрос пользователя в историю и выполняет цикл агента.
+        Параметры цикла (max_steps, max_tokens, deadline, stop_conditions, on_step)
+        передаются в AgentLoop; возвращается результат запуска со статистикой шагов.
+        """
+        self._add_prompt(prompt, add_coordinate)
+        run = AgentLoop(self, **loop_options).run()
+        self._report_run(run)
+        return run
 
-        # Добавляем сообщение пользователя в историю
+    def _add_prompt(self, prompt, add_coordinate=None):
+        """Добавляет запрос пользователя в историю"""
         if add_coordinate:
             x, y = add_coordinate
             message_content = f"{prompt} Кликни на координаты X={x}, Y={y} на экране и введи текст 'Успых'."
         else:
             message_content = prompt
         
-        self.messages.append({"role": "user", "content": message_content})
+        self.history.add("user", message_content)
 
-        payload = {
-            "model": self.model,
-            "max_tokens": 2048,
-            "tools": [
-                {
-                    "type": "computer_20250124",
-                    "name": "computer",
-                    "display_width_px": 1920,
-                    "display_height_px": 1080,
-                    "display_number": 1
-                },
-                {
-                    "type": "text_editor_20250124",
-                    "name": "str_replace_editor"
-                },
-                {
-                    "type": "bash_20250124",
-                    "name": "bash"
-                }
-            ],
-            "messages": self.messages,
-            "thinking": {
-                "type": "enabled",
-                "budget_tokens": 1024
-            }
-        }
+    def _report_run(self, run):
+        """Печатает итог запуска агента"""
+        print(f"Агент зупинився ({run['stop_reason']}): кроків {len(run['steps'])}, "
+              f"модель {run['model_time']:.1f} с, дії {run['action_time']:.1f} с, "
+              f"токенів {run['tokens']}")
 
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers=headers,
-            json=payload
-        )
+    def request_model(self):
+        """Один запрос к модели с текущей историей; None при ошибке"""
+        return self._checked_response(self._post_messages(self._build_payload()))
 
-        if response.status_code != 200:
-            print(f"Error: {response.status_code}")
-            print(response.text)
+    def _checked_response(self, response):
+        """Отбрасывает ответ без содержимого"""
+        if response is not None and "content" not in response:
+            print("Error: No content in response")
             return None
+        return response
 
-        return self.handle_anthropic_response(response.json())
+    def _build_payload(self):
+        """
+        Собирает запрос из неизменного префикса (модель, инструменты, настройки
+        размышлений) и текущей истории с точками кэширования
+        """
+        payload = dict(self.request_prefix)
+        payload["messages"] = self.history.request_messages(cache_breakpoints=2)
+        if self.stream:
+            payload["stream"] = True
+        return payload
 
-    def handle_anthropic_response(self, response):
-        """Обрабатывает ответ от Anthropic API и выполняет действия с инструментами"""
-        if "content" not in response:
-            print("Error: No content in response")
+    def _encode_payload(self, payload):
+        """Сериализует запрос и учитывает его размер в статистике истории"""
+        body = json.dumps(payload).encode("utf-8")
+        self.history.record_request(len(body))
+        stats = self.history.stats()
+        print(f"Запит #{stats['requests']}: {len(body) / 1024:.1f} KB, повідомлень: {stats['messages']}, "
+              f"прибрано знімків: {stats['screenshots_elided']}, згорнуто кроків: {stats['turns_summarized']}")
+        return body
+
+    def _post_messages(self, payload):
+        """Отправляет запрос к Messages API и учитывает его размер и использование кэша"""
+        body = self._encode_payload(payload)
+
+        try:
+            response = requests.post(
+                self.messages_url,
+                headers=self.request_headers,
+                data=body,
+                stream=bool(payload.get("stream")),
+                timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT)
+            )
+
+            if response.status_code != 200:
+                print(f"Error: {response.status_code}")
+                print(response.text)
+                return None
+
+            if payload.get("stream"):
+                result = self._read_stream(response)
+            else:
+                result = response.json()
+        except requests.RequestException as e:
+            print(f"Помилка запиту: {e}")
+            # Действия, начатые до ошибки, дожидаются: ответа для истории у них нет
+            started, self._started_tools = self._started_tools, {}
+            futures.wait(started.values())
             return None
 
+        if result is None:
+            return None
+        self.record_usage(result.get("usage"))
+        return result
+
+    def _read_stream(self, response):
+        """
+        Читает потоковый ответ и собирает сообщение. Готовые вызовы инструментов
+        сразу отправляются на выполнение; их результаты забирает run_tools
+        """
+        self._started_tools = {}
+        stream = MessageStream(on_tool_use=self._start_tool)
+        try:
+            for event, data in iter_sse_events(response.iter_lines()):
+                stream.feed(event, data)
+        except Exception as e:
+            stream.error = str(e)
+        finally:
+            response.close()
+
+        if stream.error or not stream.complete:
+            print(f"Помилка потоку відповіді: {stream.error or 'потік обірвано'}")
+            return self._interrupted_message(stream)
+        return stream.message
+
+    def _interrupted_message(self, stream):
+        """
+        Ответ оборванного потока. Если часть действий уже начата, они выполнены
+        на экране: завершенная часть ответа возвращается как обычный ответ, и
+        run_tools записывает ее и результаты этих действий в историю, чтобы
+        следующий запрос исходил из того экрана, который видит модель
+        """
+        if not self._started_tools:
+            return None
+        print(f"Виконано інструментів до обриву потоку: {len(self._started_tools)}; відповідь збережено частково")
+        return stream.partial_message()
+
+    def _start_tool(self, tool_use):
+        """Ставит готовый вызов инструмента в очередь выполнения"""
+        print(f"Інструмент {tool_use['name']} запущено до завершення відповіді")
+        self._started_tools[tool_use["id"]] = self.tools.submit(tool_use)
+
+    def record_usage(self, usage):
+        """Учитывает токены ответа, в том числе прочитанные из кэша и записанные в кэш"""
+        if not usage:
+            return
+        for key in self.usage:
+            self.usage[key] += usage.get(key) or 0
+        print(f"Кеш: прочитано {usage.get('cache_read_input_tokens') or 0}, "
+              f"записано {usage.get('cache_creation_input_tokens') or 0}, "
+              f"без кешу {usage.get('input_tokens') or 0} токенів; "
+              f"частка попадань за сесію {self.cache_hit_rate() * 100:.1f}%")
+
+    def cache_hit_rate(self):
+        """Доля входных токенов сессии, прочитанных из кэша"""
+        total = (self.usage["input_tokens"] + self.usage["cache_read_input_tokens"] +
+                 self.usage["cache_creation_input_tokens"])
+        return self.usage["cache_read_input_tokens"] / total if total else 0.0
+
+    def run_tools(self, response):
+        """
+        Добавляет ответ ассистента в историю, выполняет вызванные инструменты
+        и добавляет их результаты. Возвращает имена выполненных инструментов
+        """
+        tool_uses = self._accept_tool_uses(response)
+        if not tool_uses:
+            return []
+            
+        # Обработка вызовов инструментов (уже запущенные при чтении потока только дожидаемся)
+        started, self._started_tools = self._started_tools, {}
+        results = self.tools.run(tool_uses, started)
+            
+        return self._add_tool_results(tool_uses, results)
+
+    def _accept_tool_uses(self, response):
+        """Добавляет ответ ассистента в историю и возвращает его вызовы инструментов"""
         # Добавляем ответ ассистента в историю сообщений
-        self.messages.append({"role": "assistant", "content": response["content"]})
+        self.history.add("assistant", response["content"])
         
         # Проверяем, использует ли ассистент инструменты
         tool_uses = []
@@ -227,82 +439,98 @@ class AnthropicComputerController:
                 
         if not tool_uses:
             print("Assistant is not using any tools")
-            return response
-            
-        # Обработка вызовов инструментов
+        return tool_uses
+
+    def _add_tool_results(self, tool_uses, results):
+        """
+        Добавляет результаты инструментов в историю в порядке вызовов и возвращает
+        имена инструментов. Вызов без результата (например, отмененный) получает ошибку
+        """
         tool_results = []
         for tool_use in tool_uses:
-            tool_name = tool_use["name"]
-            tool_input = tool_use["input"]
-            tool_id = tool_use["id"]
-            
-            result = None
-            if tool_name == "computer":
-                result = self.execute_computer_action(tool_input)
-            elif tool_name == "bash":
-                result = self.execute_bash_command(tool_input)
-            elif tool_name == "str_replace_editor":
-                result = self.execute_text_editor(tool_input)
-                
+            result = results.get(tool_use["id"], {"error": "Виконання скасовано"})
             tool_results.append({
                 "type": "tool_result",
-                "tool_use_id": tool_id,
+                "tool_use_id": tool_use["id"],
                 "content": result
             })
             
         # Добавляем результаты работы инструментов в историю сообщений
-        if tool_results:
-            self.messages.append({"role": "user", "content": tool_results})
-            # Рекурсивно продолжаем беседу с Anthropic
-            return self.continue_conversation()
-            
-        return response
+        self.history.add("user", tool_results)
+        return [tool_use["name"] for tool_use in tool_uses]
+
+    def execute_tool(self, tool_use):
+        """Выполняет один вызов инструмента и возвращает его результат"""
+        tool_name = tool_use["name"]
+        tool_input = tool_use["input"]
+        
+        result = None
+        if tool_name == "computer":
+            result = self.execute_computer_action(tool_input)
+        elif tool_name == "bash":
+            result = self.execute_bash_command(tool_input)
+        elif tool_name == "str_replace_editor":
+            result = self.execute_text_editor(tool_input)
+        return result
 
     def execute_computer_action(self, action_input):
-        """Выполняет действия с компьютером (мышь, клавиатура, скриншот)"""
+        """
+        Выполняет действия с компьютером (мышь, клавиатура, скриншот).
+        После действия ждет, пока экран перестанет меняться, чтобы следующий
+        скриншот показал результат
+        """
         action_type = action_input.get("action_type")
         
+        # Координаты модели заданы в объявленном дисплее, pyautogui получает координаты экрана
+        screen_x, screen_y = self.to_screen_coordinates(action_input.get("x"), action_input.get("y"))
+        
         if action_type == "screenshot":
-            # Делаем скриншот
-            screenshot = pyautogui.screenshot()
-            buffered = BytesIO()
-            screenshot.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            return {"screenshot": img_str}
+            # Делаем скриншот и уменьшаем его до объявленного размера дисплея
+            frame = self.display.fit(pyautogui.screenshot())
+            # После сворачивания старых шагов модель могла потерять последний полный кадр
+            if self.history.turns_summarized != self._summarized_turns:
+                self._summarized_turns = self.history.turns_summarized
+                self.screen_tracker.reset()
+            return self.screen_tracker.screenshot_result(frame, self.display.encode)
             
         elif action_type == "left_click":
             # Клик левой кнопкой мыши по координатам
             x = action_input.get("x")
             y = action_input.get("y")
-            pyautogui.click(x=x, y=y)
+            pyautogui.click(x=screen_x, y=screen_y)
+            self.settle.wait("click")
             return {"success": True, "x": x, "y": y}
             
         elif action_type == "left_mouse_down":
             # Нажатие левой кнопки мыши
             x = action_input.get("x")
             y = action_input.get("y")
-            pyautogui.mouseDown(x=x, y=y, button='left')
+            pyautogui.mouseDown(x=screen_x, y=screen_y, button='left')
+            self.settle.wait("move")
             return {"success": True, "x": x, "y": y}
             
         elif action_type == "left_mouse_up":
             # Отпускание левой кнопки мыши
             x = action_input.get("x")
             y = action_input.get("y")
-            pyautogui.mouseUp(x=x, y=y, button='left')
+            pyautogui.mouseUp(x=screen_x, y=screen_y, button='left')
+            self.settle.wait("click")
             return {"success": True, "x": x, "y": y}
             
         elif action_type == "move_mouse":
             # Перемещение мыши
             x = action_input.get("x")
             y = action_input.get("y")
-            pyautogui.moveTo(x=x, y=y)
+            pyautogui.moveTo(x=screen_x, y=screen_y)
+            self.settle.wait("move")
             return {"success": True, "x": x, "y": y}
             
         elif action_type == "double_click":
             # Двойной клик
             x = action_input.get("x")
             y = action_input.get("y")
-            pyautogui.doubleClick(x=x, y=y)
+            pyautogui.doubleClick(x=screen_x, y=screen_y)
+            self.settle.wait("click")
             return {"success": True, "x": x, "y": y}
             
         elif action_type == "keypress":
@@ -311,12 +539,15 @@ class AnthropicComputerController:
             text = action_input.get("text")
             
             if text:
-                pyautogui.write(text)
+                pyautogui.write(text, interval=self.settle.profile("type")["key_interval"])
+                self.settle.wait("type")
                 return {"success": True, "text": text}
             
             if keys:
                 for key in keys:
                     pyautogui.press(key)
+                # Enter обычно отправляет форму или открывает что-то - ждем дольше
+                self.settle.wait("submit" if keys[-1] in ("enter", "return") else "key")
                 return {"success": True, "keys": keys}
                 
         elif action_type == "key_down":
@@ -329,6 +560,7 @@ class AnthropicComputerController:
             # Отпускание клавиши
             key = action_input.get("key")
             pyautogui.keyUp(key)
+            self.settle.wait("key")
             return {"success": True, "key": key}
             
         elif action_type == "scroll":
@@ -337,21 +569,23 @@ class AnthropicComputerController:
             y = action_input.get("y")
             delta_x = action_input.get("delta_x", 0)
             delta_y = action_input.get("delta_y", 0)
-            pyautogui.scroll(delta_y * -1, x=x, y=y)  # PyAutoGUI использует отрицательные значения для прокрутки вниз
+            pyautogui.scroll(delta_y * -1, x=screen_x, y=screen_y)  # PyAutoGUI использует отрицательные значения для прокрутки вниз
+            self.settle.wait("scroll")
             return {"success": True, "x": x, "y": y, "delta_x": delta_x, "delta_y": delta_y}
             
         return {"error": f"Unknown action type: {action_type}"}
 
     def execute_bash_command(self, command_input):
-        """Выполняет bash команду"""
-        command = command_input.get("command", "")
-        import subprocess
-        
-        try:
-            result = subprocess.run(command, shell=True, check=True, capture_output=True, text=True)
-            return {"stdout": result.stdout, "stderr": result.stderr, "exit_code": result.returncode}
-        except subprocess.CalledProcessError as e:
-            return {"error": str(e), "stdout": e.stdout, "stderr": e.stderr, "exit_code": e.returncode}
+        """Выполняет bash команду в оболочке агента (restart - перезапуск оболочки)"""
+        if command_input.get("restart"):
+            self.bash.restart()
+            return {"success": True, "restarted": True}
+        return self.bash.run(command_input.get("command", ""))
+
+    def _tool_output(self, name, text):
+        """Передает вывод команды в on_tool_output по мере поступления"""
+        if self.on_tool_output:
+            self.on_tool_output(name, text)
 
     def execute_text_editor(self, editor_input):
         """Выполняет операции с текстовым редактором"""
@@ -369,55 +603,6 @@ class AnthropicComputerController:
         except Exception as e:
             return {"error": str(e), "text": text}
 
-    def continue_conversation(self):
-        """Продолжает беседу с Anthropic API после получения результатов от инструментов"""
-        headers = {
-            "content-type": "application/json",
-            "x-api-key": self.anthropic_api_key,
-            "anthropic-version": "2023-06-01",
-            "anthropic-beta": "computer-use-2025-01-24"
-        }
-        
-        payload = {
-            "model": self.model,
-            "max_tokens": 2048,
-            "tools": [
-                {
-                    "type": "computer_20250124",
-                    "name": "computer",
-                    "display_width_px": 1920,
-                    "display_height_px": 1080,
-                    "display_number": 1
-                },
-                {
-                    "type": "text_editor_20250124",
-                    "name": "str_replace_editor"
-                },
-                {
-                    "type": "bash_20250124",
-                    "name": "bash"
-                }
-            ],
-            "messages": self.messages,
-            "thinking": {
-                "type": "enabled",
-                "budget_tokens": 1024
-            }
-        }
-        
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers=headers,
-            json=payload
-        )
-        
-        if response.status_code != 200:
-            print(f"Error: {response.status_code}")
-            print(response.text)
-            return None
-            
-        return self.handle_anthropic_response(response.json())
-
     def run_workflow(self):
         """Run a standard workflow"""
         try:
@@ -462,6 +647,8 @@ class AnthropicComputerController:
     
     def stop(self):
         """Stop the controller and clean up"""
+        self.tools.shutdown(wait=True)
+        self.bash.close()
         print("Контролер зупинено")
         return True
 
@@ -518,8 +705,8 @@ class AnthropicComputerController:
                 print(f"Поточна позиція миші: X={original_x}, Y={original_y}")
                 
                 # Переміщуємо мишу до елемента
-                pyautogui.moveTo(scaled_x, scaled_y, duration=1)
-                time.sleep(1)
+                pyautogui.moveTo(scaled_x, scaled_y)
+                self.settle.wait("move")
                 
                 # Робимо знімок із позицією курсора
                 cursor_check_path = os.path.join(self.working_dir, "cursor_position.png")
@@ -559,8 +746,8 @@ class AnthropicComputerController:
                 pyautogui.click(scaled_x, scaled_y)
                 print(f"Подвійний клік виконано в позиції ({scaled_x}, {scaled_y})")
                 
-                # Чекаємо трохи після кліка
-                time.sleep(1.5)  # Збільшено час очікування
+                # Чекаємо, поки інтерфейс відреагує на клік
+                self.settle.wait("click")
                 
                 # Автоматическое подтверждение вместо ручного
                 print("Автоматично продовжуємо (поле вводу активовано)")
@@ -590,8 +777,8 @@ class AnthropicComputerController:
                 print("Натискаємо Enter для виконання пошуку...")
                 pyautogui.press('enter')
                 
-                # Чекаємо деякий час, щоб побачити результат дії
-                time.sleep(2.0)  # Даем время для загрузки результатов
+                # Чекаємо, поки завантажаться результати пошуку
+                self.settle.wait("submit")
                 
                 # Делаем скриншот результатов поиска
                 result_path = os.path.join(self.working_dir, "appstore_result.png")
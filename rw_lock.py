@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Блокировка "много читателей или один писатель".
+    Читатели не мешают друг другу; писатель ждет выхода читателей, а новые
+    читатели ждут, пока есть ожидающий писатель (писатели не голодают).
+    Повторный захват тем же потоком разрешен: читатель может снова взять
+    чтение, писатель - чтение и запись.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = {}
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """Захватывает блокировку на чтение."""
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer != me and me not in self._readers:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers[me] = self._readers.get(me, 0) + 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers[me] -= 1
+                if not self._readers[me]:
+                    del self._readers[me]
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Захватывает блокировку на запись."""
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                if me in self._readers:
+                    raise RuntimeError("Нельзя повысить блокировку чтения до записи")
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._condition.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._condition.notify_all()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Размер плитки, по которой ищутся изменившиеся области кадра
+TILE_SIZE = 32
+
+# Разница яркости пикселя (0-255), которая не считается изменением (шум, сглаживание)
+PIXEL_TOLERANCE = 12
+
+# Если изменившаяся область занимает больше этой доли кадра, отправляется весь кадр
+MAX_CROP_FRACTION = 0.25
+
+
+class ScreenTracker:
+    """
+    Отслеживает, какой кадр экрана модель уже видела, и отвечает на запрос
+    скриншота без лишней выгрузки: если кадр не изменился, возвращается
+    короткий текст со ссылкой на номер прошлого скриншота, если изменилась
+    небольшая область - только ее вырезка со смещением.
+
+    Эталон сравнения - именно то, что видела модель: последний полный кадр
+    с наложенными на него отправленными вырезками. Поэтому медленные
+    изменения ниже порога не накапливаются незамеченными.
+    """
+
+    def __init__(self, tile_size=TILE_SIZE, pixel_tolerance=PIXEL_TOLERANCE,
+                 max_crop_fraction=MAX_CROP_FRACTION, max_partial=2):
+        """
+        Инициализирует трекер.
+
+        Args:
+            tile_size (int): Размер плитки сравнения в пикселях
+            pixel_tolerance (int): Допустимая разница яркости пикселя
+            max_crop_fraction (float): Максимальная доля кадра, которая отправляется вырезкой
+            max_partial (int): Сколько вырезок подряд можно отправить до следующего полного кадра
+                (полный кадр должен оставаться в истории, которая хранит несколько последних скриншотов)
+        """
+        self.tile_size = tile_size
+        self.pixel_tolerance = pixel_tolerance
+        self.max_crop_fraction = max_crop_fraction
+        self.max_partial = max_partial
+        self.screenshot_id = 0
+        self.counters = {"full": 0, "partial": 0, "unchanged": 0}
+        self.reset()
+
+    def reset(self):
+        """Забывает эталон: следующий скриншот будет отправлен полностью."""
+        self._reference = None
+        self._reference_id = None
+        self._full_id = None
+        self._partial_count = 0
+
+    def changed_box(self, frame):
+        """
+        Находит прямоугольник изменившихся плиток относительно эталона.
+
+        Args:
+            frame (numpy.ndarray): Кадр в оттенках серого (int16)
+
+        Returns:
+            tuple или None: (x, y, ширина, высота) или None, если кадр не изменился
+        """
+        changed = np.abs(frame - self._reference) > self.pixel_tolerance
+        height, width = changed.shape
+        tile = self.tile_size
+        rows = np.add.reduceat(changed.any(axis=1), np.arange(0, height, tile)) > 0
+        columns = np.add.reduceat(changed.any(axis=0), np.arange(0, width, tile)) > 0
+        if not rows.any():
+            return None
+        top, bottom = np.flatnonzero(rows)[[0, -1]] * tile
+        left, right = np.flatnonzero(columns)[[0, -1]] * tile
+        bottom = min(height, bottom + tile)
+        right = min(width, right + tile)
+        return int(left), int(top), int(right - left), int(bottom - top)
+
+    def screenshot_result(self, frame, encode):
+        """
+        Формирует результат действия screenshot.
+
+        Args:
+            frame (PIL.Image): Кадр объявленного размера
+            encode (callable): Кодирует изображение в base64
+
+        Returns:
+            dict: Полный кадр, вырезка со смещением или сообщение о неизменном экране
+        """
+        pixels = np.asarray(frame.convert('L'), dtype=np.int16)
+        box = None
+        if self._reference is not None and self._reference.shape == pixels.shape:
+            box = self.changed_box(pixels)
+            if box is None:
+                self.counters["unchanged"] += 1
+                return {
+                    "screen_unchanged": True,
+                    "same_as_screenshot_id": self._reference_id,
+                    "text": f"Экран не изменился со скриншота {self._reference_id}"
+                }
+
+        self.screenshot_id += 1
+        x, y, width, height = box or (0, 0, 0, 0)
+        if (box is None or self._partial_count >= self.max_partial
+                or width * height > self.max_crop_fraction * pixels.size):
+            self._reference = pixels
+            self._reference_id = self._full_id = self.screenshot_id
+            self._partial_count = 0
+            self.counters["full"] += 1
+            return {"screenshot": encode(frame), "screenshot_id": self.screenshot_id}
+
+        previous_id = self._reference_id
+        self._reference = self._reference.copy()
+        self._reference[y:y + height, x:x + width] = pixels[y:y + height, x:x + width]
+        self._reference_id = self.screenshot_id
+        self._partial_count += 1
+        self.counters["partial"] += 1
+        return {
+            "screenshot": encode(frame.crop((x, y, x + width, y + height))),
+            "screenshot_id": self.screenshot_id,
+            "region": {"x": x, "y": y, "width": width, "height": height},
+            "base_screenshot_id": self._full_id,
+            "text": (f"Изменилась только область x={x}, y={y}, {width}x{height}; "
+                     f"остальной экран как на скриншоте {previous_id}")
+        }
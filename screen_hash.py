@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+import logging
+import numpy as np
+from PIL import Image
+from text_index import pack_strings, unpack_strings
+
+logger = logging.getLogger(__name__)
+
+# Экраны с расстоянием Хэмминга pHash не больше этого считаются одним и тем же экраном
+SAME_SCREEN_DISTANCE = 6
+
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+
+
+def _dct_matrix(size):
+    """Матрица DCT-II размера size x size."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def phash(image):
+    """
+    Перцептивный хеш изображения (pHash, 64 бита).
+    Изображение уменьшается до 32x32 в оттенках серого, берутся низкочастотные
+    коэффициенты DCT 8x8 и сравниваются с медианой. Мелкие изменения (часы,
+    курсор, значок) не меняют хеш или меняют несколько бит.
+
+    Args:
+        image (PIL.Image): Изображение
+
+    Returns:
+        int: 64-битный хеш
+    """
+    small = image.convert('L').resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.float64)
+    coefficients = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    # Постоянная составляющая не учитывается в медиане
+    bits = coefficients > np.median(coefficients[1:])
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hash_to_hex(value):
+    """Записывает 64-битный хеш как 16 шестнадцатеричных символов."""
+    return f"{value:016x}"
+
+
+def hash_from_hex(text):
+    """
+    Разбирает хеш из шестнадцатеричной строки.
+
+    Args:
+        text (str): 16 шестнадцатеричных символов
+
+    Returns:
+        int или None: Хеш или None для старых MD5 хешей и пустых значений
+    """
+    if not text or len(text) != 16:
+        return None
+    try:
+        return int(text, 16)
+    except ValueError:
+        return None
+
+
+def hamming_distance(a, b):
+    """Количество различающихся бит двух хешей."""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    BK-дерево по расстоянию Хэмминга: поиск всех хешей в радиусе r
+    без перебора всех сохраненных хешей.
+    """
+
+    def __init__(self):
+        # Узел: [хеш, множество элементов, {расстояние: дочерний узел}]
+        self._root = None
+        self._nodes = {}
+
+    def add(self, value, item):
+        """
+        Добавляет элемент с указанным хешем.
+
+        Args:
+            value (int): Хеш
+            item: Идентификатор, связанный с хешем
+        """
+        node = self._nodes.get(value)
+        if node is not None:
+            node[1].add(item)
+            return
+        new_node = [value, {item}, {}]
+        self._nodes[value] = new_node
+        if self._root is None:
+            self._root = new_node
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = new_node
+                return
+            node = child
+
+    def discard(self, value, item):
+        """
+        Убирает элемент с хешем. Пустой узел остается в дереве для поиска.
+
+        Args:
+            value (int): Хеш
+            item: Идентификатор, связанный с хешем
+        """
+        node = self._nodes.get(value)
+        if node is not None:
+            node[1].discard(item)
+
+    def query(self, value, radius):
+        """
+        Находит все элементы с хешами в радиусе radius.
+
+        Args:
+            value (int): Искомый хеш
+            radius (int): Максимальное расстояние Хэмминга
+
+        Returns:
+            list: Пары (расстояние, элемент), отсортированные по расстоянию
+        """
+        results = []
+        if self._root is None:
+            return results
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= radius:
+                results.extend((distance, item) for item in node[1])
+            # Неравенство треугольника: дочерние узлы вне [d - r, d + r] пропускаются
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+class ScreenHashIndex:
+    """
+    Индекс перцептивных хешей экранов, на которых были найдены элементы памяти.
+    """
+
+    def __init__(self):
+        self._tree = BKTree()
+        self._hashes_by_element = {}
+
+    def set_element(self, element_id, hashes):
+        """
+        Заменяет набор хешей экранов элемента.
+
+        Args:
+            element_id (str): ID элемента
+            hashes (iterable): Хеши экранов его местоположений
+        """
+        new_hashes = set(hashes)
+        old_hashes = self._hashes_by_element.get(element_id, set())
+        for value in old_hashes - new_hashes:
+            self._tree.discard(value, element_id)
+        for value in new_hashes - old_hashes:
+            self._tree.add(value, element_id)
+        if new_hashes:
+            self._hashes_by_element[element_id] = new_hashes
+        else:
+            self._hashes_by_element.pop(element_id, None)
+
+    def to_arrays(self):
+        """
+        Представляет индекс в виде массивов для снимка: узлы BK-дерева
+        в порядке обхода в ширину (хеш, родитель, расстояние до родителя)
+        и элементы каждого узла.
+
+        Returns:
+            dict: Массивы NumPy
+        """
+        ids = list(self._hashes_by_element)
+        rows = {element_id: row for row, element_id in enumerate(ids)}
+        nodes, parents, distances = [], [], []
+        if self._tree._root is not None:
+            queue = [(self._tree._root, -1, 0)]
+            for node, parent, distance in queue:
+                index = len(nodes)
+                nodes.append(node)
+                parents.append(parent)
+                distances.append(distance)
+                queue.extend((child, index, child_distance) for child_distance, child in node[2].items())
+        items = [[rows[item] for item in node[1] if item in rows] for node in nodes]
+        return {
+            "ids": pack_strings(ids),
+            "values": np.array([node[0] for node in nodes], dtype=np.uint64),
+            "parents": np.array(parents, dtype=np.int32),
+            "distances": np.array(distances, dtype=np.int8),
+            "item_counts": np.array([len(node_items) for node_items in items], dtype=np.int32),
+            "item_rows": np.array([row for node_items in items for row in node_items], dtype=np.int32)
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Восстанавливает индекс из массивов to_arrays без вычисления расстояний.
+
+        Args:
+            arrays (dict): Массивы снимка
+
+        Returns:
+            ScreenHashIndex: Индекс
+        """
+        index = cls()
+        ids = unpack_strings(arrays["ids"])
+        values = arrays["values"].tolist()
+        item_rows = arrays["item_rows"].tolist()
+        offsets = np.concatenate(([0], np.cumsum(arrays["item_counts"]))).tolist()
+        nodes = []
+        for i, value in enumerate(values):
+            node_items = {ids[row] for row in item_rows[offsets[i]:offsets[i + 1]]}
+            nodes.append([value, node_items, {}])
+            for element_id in node_items:
+                index._hashes_by_element.setdefault(element_id, set()).add(value)
+        for i, (parent, distance) in enumerate(zip(arrays["parents"].tolist(), arrays["distances"].tolist())):
+            if parent >= 0:
+                nodes[parent][2][distance] = nodes[i]
+        index._tree._root = nodes[0] if nodes else None
+        index._tree._nodes = {node[0]: node for node in nodes}
+        return index
+
+    def remove(self, element_id):
+        """
+        Удаляет все хеши элемента.
+
+        Args:
+            element_id (str): ID элемента
+        """
+        self.set_element(element_id, ())
+
+    def query(self, value, radius=SAME_SCREEN_DISTANCE):
+        """
+        Находит элементы, сохраненные на похожих экранах.
+
+        Args:
+            value (int): Хеш текущего экрана
+            radius (int): Максимальное расстояние Хэмминга
+
+        Returns:
+            list: Пары (расстояние, ID элемента) с минимальным расстоянием для каждого элемента
+        """
+        best = {}
+        for distance, element_id in self._tree.query(value, radius):
+            if element_id not in best:
+                best[element_id] = distance
+        return sorted(((distance, element_id) for element_id, distance in best.items()), key=lambda pair: pair[0])
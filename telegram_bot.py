@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 
 import os
+import asyncio
 import logging
 import pyautogui
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
 import time
 from find_text import find_text_on_image, load_api_keys
-from memory_manager import MemoryManager
-from robot_controller import AnthropicComputerController
+from memory_manager import get_memory_manager
+from memory_namespaces import active_application
+from async_controller import AsyncAnthropicComputerController, GUI_EXECUTOR, run_blocking
+from agent_loop import format_step
 from PIL import Image, ImageDraw, ImageFont
 import datetime
 import json
@@ -41,9 +44,21 @@ MEMORY_BROWSE_ELEMENT, MEMORY_ELEMENT_DETAILS = range(3, 5)
 # Определение состояний для просмотра памяти
 SHOW_MEMORY_LIST, SHOW_MEMORY_DETAIL, MEMORY_ACTION = range(10, 13)
 
-# Инициализация менеджера памяти
-memory_manager = MemoryManager()
-logger.info("Менеджер памяти инициализирован для Telegram бота")
+def user_memory_manager(context, browsed=False):
+    """
+    Возвращает менеджер памяти пространства имен пользователя - приложения,
+    активного при последнем скриншоте: поиски бота сохраняют элементы туда же.
+
+    Args:
+        context: Контекст обработчика Telegram
+        browsed (bool): Взять пространство имен, элементы которого открыты
+            в просмотре памяти (пользователь мог сделать скриншот другого приложения)
+
+    Returns:
+        MemoryManager: Общий менеджер памяти пространства имен
+    """
+    key = 'memory_namespace' if browsed else 'namespace'
+    return get_memory_manager(context.user_data.get(key))
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отправляет приветственное сообщение при команде /start."""
@@ -82,7 +97,9 @@ async def take_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Делает скриншот экрана и возвращает путь к файлу."""
     await update.message.reply_text("Делаю скриншот экрана...")
     try:
-        screenshot = pyautogui.screenshot()
+        # Память ведется отдельно для каждого приложения, если активное окно удается определить
+        context.user_data['namespace'] = active_application()
+        screenshot = await run_blocking(pyautogui.screenshot, executor=GUI_EXECUTOR)
         screenshot.save(screenshot_path)
         logger.info(f"Скриншот сохранен в {screenshot_path}")
         return screenshot_path
@@ -110,7 +127,7 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     try:
         # Ищем текст на скриншоте
         await update.message.reply_text("Анализирую скриншот...")
-        coordinates = find_text_on_image(screenshot_path, search_text)
+        coordinates = await run_blocking(find_text_on_image, screenshot_path, search_text, namespace=context.user_data.get('namespace'))
         
         if coordinates:
             x, y = coordinates
@@ -169,7 +186,7 @@ async def search_with_context_command(update: Update, context: ContextTypes.DEFA
     try:
         # Ищем текст на скриншоте с учетом контекста
         await update.message.reply_text("Анализирую скриншот...")
-        coordinates = find_text_on_image(screenshot_path, search_text, context_text)
+        coordinates = await run_blocking(find_text_on_image, screenshot_path, search_text, context_text, namespace=context.user_data.get('namespace'))
         
         if coordinates:
             x, y = coordinates
@@ -215,7 +232,7 @@ async def click_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     try:
         # Ищем текст на скриншоте
         await update.message.reply_text("Анализирую скриншот...")
-        coordinates = find_text_on_image(screenshot_path, search_text)
+        coordinates = await run_blocking(find_text_on_image, screenshot_path, search_text, namespace=context.user_data.get('namespace'))
         
         if coordinates:
             x, y = coordinates
@@ -224,11 +241,11 @@ async def click_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             )
             
             # Кликаем по найденным координатам
-            pyautogui.click(x, y)
+            await run_blocking(pyautogui.click, x, y, executor=GUI_EXECUTOR)
             
             # Делаем новый скриншот после клика
-            time.sleep(1)  # Даем время для отклика интерфейса
-            new_screenshot = pyautogui.screenshot()
+            await asyncio.sleep(1)  # Даем время для отклика интерфейса
+            new_screenshot = await run_blocking(pyautogui.screenshot, executor=GUI_EXECUTOR)
             new_screenshot_path = os.path.join(working_dir, "after_click.png")
             new_screenshot.save(new_screenshot_path)
             
@@ -259,7 +276,7 @@ async def anthropic_click_command(update: Update, context: ContextTypes.DEFAULT_
     try:
         # Ищем текст на скриншоте
         await update.message.reply_text("Анализирую скриншот...")
-        coordinates = find_text_on_image(screenshot_path, search_text)
+        coordinates = await run_blocking(find_text_on_image, screenshot_path, search_text, namespace=context.user_data.get('namespace'))
         
         if coordinates:
             x, y = coordinates
@@ -268,12 +285,12 @@ async def anthropic_click_command(update: Update, context: ContextTypes.DEFAULT_
             )
             
             # Кликаем по найденным координатам с помощью Anthropic API
-            success = await click_using_anthropic(x, y)
+            success = await click_using_anthropic(x, y, progress=update.message.reply_text)
             
             if success:
                 # Делаем новый скриншот после клика
-                time.sleep(1)  # Даем время для отклика интерфейса
-                new_screenshot = pyautogui.screenshot()
+                await asyncio.sleep(1)  # Даем время для отклика интерфейса
+                new_screenshot = await run_blocking(pyautogui.screenshot, executor=GUI_EXECUTOR)
                 new_screenshot_path = os.path.join(working_dir, "after_anthropic_click.png")
                 new_screenshot.save(new_screenshot_path)
                 
@@ -287,17 +304,24 @@ async def anthropic_click_command(update: Update, context: ContextTypes.DEFAULT_
         logger.error(f"Ошибка при поиске и клике через Anthropic: {str(e)}")
         await update.message.reply_text(f"Произошла ошибка при поиске и клике через Anthropic: {str(e)}")
 
-async def click_using_anthropic(x, y):
-    """Выполняет клик по координатам с использованием Anthropic API."""
+async def click_using_anthropic(x, y, progress=None):
+    """
+    Выполняет клик по координатам с использованием Anthropic API.
+    Асинхронный контроллер не блокирует бота во время сессии агента;
+    если передан progress (асинхронная функция от строки), после каждого шага
+    в нее отправляется строка прогресса.
+    """
     try:
-        # Создаем и инициализируем контроллер
-        controller = AnthropicComputerController()
-        
         # Подготавливаем промт для Anthropic
         prompt = f"Выполни клик по координатам X={x}, Y={y} на экране."
         
-        # Отправляем запрос к Anthropic API с указанием координат
-        response = controller.send_to_anthropic(prompt, add_coordinate=(x, y))
+        async def on_step(step, response):
+            if progress:
+                await progress(format_step(step))
+        
+        # Создаем контроллер и отправляем запрос к Anthropic API с указанием координат
+        async with AsyncAnthropicComputerController() as controller:
+            response = await controller.send_to_anthropic(prompt, add_coordinate=(x, y), on_step=on_step)
         
         # Проверка результата
         if response:
@@ -341,7 +365,7 @@ async def type_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     try:
         # Ищем текст на скриншоте
         await update.message.reply_text("Анализирую скриншот...")
-        coordinates = find_text_on_image(screenshot_path, search_text)
+        coordinates = await run_blocking(find_text_on_image, screenshot_path, search_text, namespace=context.user_data.get('namespace'))
         
         if coordinates:
             x, y = coordinates
@@ -350,16 +374,16 @@ async def type_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             )
             
             # Кликаем по найденным координатам
-            pyautogui.click(x, y)
-            time.sleep(0.5)  # Даем время для отклика интерфейса
+            await run_blocking(pyautogui.click, x, y, executor=GUI_EXECUTOR)
+            await asyncio.sleep(0.5)  # Даем время для отклика интерфейса
             
             # Вводим текст
-            pyautogui.write(type_text)
-            pyautogui.press('enter')
+            await run_blocking(pyautogui.write, type_text, executor=GUI_EXECUTOR)
+            await run_blocking(pyautogui.press, 'enter', executor=GUI_EXECUTOR)
             
             # Делаем новый скриншот после ввода
-            time.sleep(1)  # Даем время для отклика интерфейса
-            new_screenshot = pyautogui.screenshot()
+            await asyncio.sleep(1)  # Даем время для отклика интерфейса
+            new_screenshot = await run_blocking(pyautogui.screenshot, executor=GUI_EXECUTOR)
             new_screenshot_path = os.path.join(working_dir, "after_type.png")
             new_screenshot.save(new_screenshot_path)
             
@@ -386,7 +410,7 @@ async def text_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     try:
         # Ищем текст на скриншоте
         await update.message.reply_text("Анализирую скриншот...")
-        coordinates = find_text_on_image(screenshot_path, text)
+        coordinates = await run_blocking(find_text_on_image, screenshot_path, text, namespace=context.user_data.get('namespace'))
         
         if coordinates:
             x, y = coordinates
@@ -454,7 +478,7 @@ async def get_context_and_search(update: Update, context: ContextTypes.DEFAULT_T
         
         # Запоминаем время начала поиска
         start_time = time.time()
-        coordinates = find_text_on_image(screenshot_path, search_text, context_info)
+        coordinates = await run_blocking(find_text_on_image, screenshot_path, search_text, context_info, namespace=context.user_data.get('namespace'))
         # Вычисляем затраченное время
         search_time = time.time() - start_time
         
@@ -600,7 +624,7 @@ async def get_context_and_search_for_click(update: Update, context: ContextTypes
         
         # Запоминаем время начала поиска
         start_time = time.time()
-        coordinates = find_text_on_image(screenshot_path, search_text, context_info)
+        coordinates = await run_blocking(find_text_on_image, screenshot_path, search_text, context_info, namespace=context.user_data.get('namespace'))
         # Вычисляем затраченное время
         search_time = time.time() - start_time
         
@@ -711,7 +735,7 @@ async def execute_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
             x, y = coordinates
             try:
                 # Получаем размер экрана и размер скриншота для масштабирования
-                screen_width, screen_height = pyautogui.size()
+                screen_width, screen_height = await run_blocking(pyautogui.size, executor=GUI_EXECUTOR)
                 
                 # Получаем размер последнего скриншота
                 screenshot_info = None
@@ -729,7 +753,7 @@ async def execute_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
                 
                 # Если не удалось получить размер последнего скриншота, используем текущий
                 if not screenshot_info:
-                    screenshot = pyautogui.screenshot()
+                    screenshot = await run_blocking(pyautogui.screenshot, executor=GUI_EXECUTOR)
                     screenshot_width, screenshot_height = screenshot.size
                     screenshot_info = (screenshot_width, screenshot_height)
                 
@@ -751,22 +775,22 @@ async def execute_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
                     )
                 
                 # Логируем текущую позицию мыши перед кликом
-                current_mouse_x, current_mouse_y = pyautogui.position()
+                current_mouse_x, current_mouse_y = await run_blocking(pyautogui.position, executor=GUI_EXECUTOR)
                 logger.info(f"Текущая позиция мыши перед кликом: ({current_mouse_x}, {current_mouse_y})")
                 
                 # Выполняем клик
                 await update.message.reply_text(f"Выполняю клик по координатам (X: {x}, Y: {y})...")
-                pyautogui.click(x, y)
+                await run_blocking(pyautogui.click, x, y, executor=GUI_EXECUTOR)
                 
                 # Логируем позицию мыши после клика
-                after_mouse_x, after_mouse_y = pyautogui.position()
+                after_mouse_x, after_mouse_y = await run_blocking(pyautogui.position, executor=GUI_EXECUTOR)
                 logger.info(f"Позиция мыши после клика: ({after_mouse_x}, {after_mouse_y})")
                 
                 await update.message.reply_text(f"Клик по тексту '{search_text}' выполнен успешно!")
                 
                 # Делаем новый скриншот после клика
-                time.sleep(1)  # Небольшая пауза для обновления экрана
-                screenshot_after = pyautogui.screenshot()
+                await asyncio.sleep(1)  # Небольшая пауза для обновления экрана
+                screenshot_after = await run_blocking(pyautogui.screenshot, executor=GUI_EXECUTOR)
                 after_path = os.path.join(working_dir, "after_click.png")
                 screenshot_after.save(after_path)
                 
@@ -798,16 +822,21 @@ async def memory_stats_command(update: Update, context: ContextTypes.DEFAULT_TYP
     """Показывает статистику системы памяти."""
     logger.info("Запрошена статистика системы памяти")
     
+    memory_manager = user_memory_manager(context)
     stats = memory_manager.get_memory_stats()
     
     if stats:
         await update.message.reply_text(
-            f"📊 Статистика системы памяти:\n\n"
+            f"📊 Статистика системы памяти ({memory_manager.namespace}):\n\n"
             f"📝 Всего элементов: {stats['total_elements']}\n"
             f"📍 Всего местоположений: {stats['total_locations']}\n"
             f"⭐ Средняя точность: {stats['avg_success_rate']:.2f}%\n"
             f"🖼 Скриншотов: {stats['screenshot_count']} (общий размер: {stats['screenshot_size_kb']:.2f} KB)\n"
             f"💾 Размер файла памяти: {stats['memory_file_size_kb']:.2f} KB\n"
+            f"📂 Пространства имен: {', '.join(stats['namespaces'])}\n"
+            f"🧹 Вытеснено: {stats['eviction']['evicted_elements']} элементов, "
+            f"{stats['eviction']['trimmed_locations']} местоположений "
+            f"(доля попаданий {stats['eviction']['hit_rate'] * 100:.1f}%)\n"
             f"🔄 Последнее обновление: {stats['last_updated']}"
         )
     else:
@@ -817,6 +846,7 @@ async def memory_debug_command(update: Update, context: ContextTypes.DEFAULT_TYP
     """Проверяет содержимое файла памяти напрямую."""
     logger.info("Запрошена проверка файла памяти напрямую")
     
+    memory_manager = user_memory_manager(context)
     memory_file = memory_manager.memory_file
     
     try:
@@ -837,20 +867,18 @@ async def memory_debug_command(update: Update, context: ContextTypes.DEFAULT_TYP
             f"Чтение содержимого файла..."
         )
         
-        # Читаем и анализируем содержимое файла
-        with open(memory_file, 'r', encoding='utf-8') as f:
-            memory_data = json.load(f)
+        # Читаем содержимое памяти через хранилище (JSON или SQLite)
+        elements = memory_manager.get_all_elements()
         
         # Подготовка основной информации
-        elements_count = len(memory_data.get('elements', []))
-        last_updated = memory_data.get('last_updated', 'Неизвестно')
-        version = memory_data.get('version', 'Неизвестно')
+        elements_count = len(elements)
+        last_updated = memory_manager.storage.last_updated() or 'Неизвестно'
         
         summary = (
             f"📋 Содержимое файла памяти:\n\n"
             f"🔢 Количество элементов: {elements_count}\n"
             f"🔄 Последнее обновление: {last_updated}\n"
-            f"📊 Версия формата: {version}\n\n"
+            f"📊 Формат хранилища: {memory_manager.backend}\n\n"
         )
         
         await update.message.reply_text(summary)
@@ -859,7 +887,7 @@ async def memory_debug_command(update: Update, context: ContextTypes.DEFAULT_TYP
         if elements_count > 0:
             details = "🔍 Детальная информация о элементах:\n\n"
             
-            for i, element in enumerate(memory_data.get('elements', []), 1):
+            for i, element in enumerate(elements, 1):
                 search_text = element.get('search_text', 'Неизвестно')
                 context_info = element.get('context_info', '')
                 locations_count = len(element.get('locations', []))
@@ -881,8 +909,6 @@ async def memory_debug_command(update: Update, context: ContextTypes.DEFAULT_TYP
             if details:
                 await update.message.reply_text(details)
         
-    except json.JSONDecodeError:
-        await update.message.reply_text(f"❌ Ошибка при чтении файла памяти: неверный формат JSON")
     except Exception as e:
         logger.error(f"Ошибка при проверке файла памяти: {str(e)}")
         await update.message.reply_text(f"❌ Произошла ошибка при проверке файла памяти: {str(e)}")
@@ -909,10 +935,11 @@ async def memory_clean_command(update: Update, context: ContextTypes.DEFAULT_TYP
             return
     
     # Выполняем очистку
+    memory_manager = user_memory_manager(context)
     removed_count = memory_manager.clean_old_entries(max_age_days, min_success_rate)
     
     await update.message.reply_text(
-        f"🧹 Очистка памяти завершена!\n\n"
+        f"🧹 Очистка памяти ({memory_manager.namespace}) завершена!\n\n"
         f"🗑 Удалено элементов: {removed_count}\n"
         f"⏳ Макс. возраст записей: {max_age_days} дней\n"
         f"📈 Мин. коэффициент успеха: {min_success_rate:.2f}"
@@ -934,8 +961,9 @@ async def memory_browse_command(update: Update, context: ContextTypes.DEFAULT_TY
     logger.info("Запущен просмотр элементов памяти")
     
     try:
-        # Получаем все элементы из памяти
-        elements = memory_manager.get_all_elements()
+        # Получаем все элементы из памяти; удаление и изменение работают с тем же пространством имен
+        context.user_data['memory_namespace'] = context.user_data.get('namespace')
+        elements = user_memory_manager(context, browsed=True).get_all_elements()
         
         if not elements:
             await update.message.reply_text("📭 В памяти нет сохраненных элементов.")
@@ -1111,7 +1139,7 @@ async def memory_detail_callback(update: Update, context: ContextTypes.DEFAULT_T
         # Удаление элемента из памяти
         try:
             element_id = element.get("id")
-            memory_manager.remove_element(element_id)
+            user_memory_manager(context, browsed=True).remove_element(element_id)
             await query.edit_message_text(f"✅ Элемент '{element.get('search_text')}' успешно удален из памяти.")
             return ConversationHandler.END
         except Exception as e:
@@ -1133,7 +1161,7 @@ async def memory_detail_callback(update: Update, context: ContextTypes.DEFAULT_T
         
         try:
             # Выполняем поиск с использованием данных из памяти
-            result = await memory_manager.execute_search_from_memory(element)
+            result = await user_memory_manager(context, browsed=True).execute_search_from_memory(element)
             
             if result and result.get("success"):
                 coords = result.get("coordinates")
@@ -1257,7 +1285,7 @@ async def memory_update_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
             new_search_text = context.user_data.get('new_search_text')
             new_context = user_input
             
-            memory_manager.update_element(
+            user_memory_manager(context, browsed=True).update_element(
                 element_id, 
                 new_search_text=new_search_text, 
                 new_context_info=new_context
@@ -1272,13 +1300,13 @@ async def memory_update_text(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         elif update_mode == "text":
             # Обновляем только текст
-            memory_manager.update_element(element_id, new_search_text=user_input)
+            user_memory_manager(context, browsed=True).update_element(element_id, new_search_text=user_input)
             await update.message.reply_text(f"✅ Текст поиска успешно обновлен на '{user_input}'")
             return ConversationHandler.END
         
         elif update_mode == "context":
             # Обновляем только контекст
-            memory_manager.update_element(element_id, new_context_info=user_input)
+            user_memory_manager(context, browsed=True).update_element(element_id, new_context_info=user_input)
             await update.message.reply_text(f"✅ Контекст поиска успешно обновлен на '{user_input}'")
             return ConversationHandler.END
         
@@ -1297,7 +1325,7 @@ async def memory_elements_command(update: Update, context: ContextTypes.DEFAULT_
     
     try:
         # Получаем все элементы из памяти
-        elements = memory_manager.get_all_elements()
+        elements = user_memory_manager(context).get_all_elements()
         
         if not elements or len(elements) == 0:
             await update.message.reply_text("📭 В памяти нет сохраненных элементов.")
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+
+import math
+import logging
+import threading
+import numpy as np
+from PIL import Image
+from template_store import TemplateFeatureStore, FEATURE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Порог совпадения шаблона (как у прежнего cv2.TM_CCOEFF_NORMED >= 0.7)
+MATCH_THRESHOLD = 0.7
+
+# Порог для поиска сдвинутого элемента выше: в большой области больше случайных совпадений
+RELOCATION_THRESHOLD = 0.8
+
+# Совпадение, после которого поиск сдвинутого элемента не расширяется дальше
+CONFIDENT_THRESHOLD = 0.95
+
+# Стандартное отклонение яркости, ниже которого шаблон считается однотонным
+_FLAT_STD = 2.0
+
+
+def _window_sums(values, height, width):
+    """
+    Суммы по всем окнам height x width через интегральное изображение.
+
+    Args:
+        values (np.ndarray): Массив (N, H, W)
+        height, width (int): Размер окна
+
+    Returns:
+        np.ndarray: Массив (N, H - height + 1, W - width + 1)
+    """
+    integral = np.zeros((values.shape[0], values.shape[1] + 1, values.shape[2] + 1), dtype=np.float64)
+    integral[:, 1:, 1:] = values.cumsum(axis=1).cumsum(axis=2)
+    return (integral[:, height:, width:] - integral[:, :-height, width:]
+            - integral[:, height:, :-width] + integral[:, :-height, :-width])
+
+
+def batch_match(regions, templates, template_mean=None, template_std=None):
+    """
+    Сопоставляет пачку шаблонов с пачкой областей поиска во всех смещениях.
+    Для текстурных шаблонов считается нормированная кросс-корреляция (NCC),
+    для однотонных - сходство по среднеквадратичной ошибке в float.
+
+    Args:
+        regions (np.ndarray): Области поиска (N, H, W), float32, яркость 0-255
+        templates (np.ndarray): Шаблоны (N, h, w), float32, яркость 0-255
+        template_mean, template_std (np.ndarray, optional): Заранее посчитанные
+            среднее и стандартное отклонение шаблонов (N,)
+
+    Returns:
+        np.ndarray: Оценки (N, H - h + 1, W - w + 1) от 0 до 1
+    """
+    height, width = templates.shape[1], templates.shape[2]
+    pixels = height * width
+    windows = np.lib.stride_tricks.sliding_window_view(regions, (height, width), axis=(1, 2))
+
+    if template_mean is None:
+        template_mean = templates.mean(axis=(1, 2))
+    template_centered = templates - template_mean[:, None, None]
+    if template_std is None:
+        template_norm = np.sqrt((template_centered ** 2).sum(axis=(1, 2)))
+    else:
+        template_norm = template_std * math.sqrt(pixels)
+
+    window_sum = _window_sums(regions.astype(np.float64), height, width)
+    window_sq_sum = _window_sums(regions.astype(np.float64) ** 2, height, width)
+    window_var = np.maximum(window_sq_sum - window_sum ** 2 / pixels, 0.0)
+
+    # Сумма произведений окна на центрированный шаблон равна числителю NCC
+    dots = np.einsum("nijab,nab->nij", windows, template_centered, optimize=True)
+    denominator = template_norm[:, None, None] * np.sqrt(window_var)
+    # Однотонное окно не коррелирует ни с каким шаблоном
+    textured = window_var / pixels >= _FLAT_STD ** 2
+    ncc = np.where(textured, dots / np.maximum(denominator, 1e-6), 0.0)
+    ncc = np.clip(ncc, 0.0, 1.0)
+
+    # Однотонные шаблоны сравниваются по MSE: sum((W - t)^2) = sum(W^2) - 2t*sum(W) + h*w*t^2,
+    # шкала прежней проверки: сходство 100 - MSE / 10 процентов
+    flat = template_norm / math.sqrt(pixels) < _FLAT_STD
+    if flat.any():
+        mean = template_mean[:, None, None]
+        mse = np.maximum(window_sq_sum - 2 * mean * window_sum + pixels * mean ** 2, 0.0) / pixels
+        mse_score = np.clip(1.0 - mse / 1000.0, 0.0, 1.0)
+        ncc[flat] = mse_score[flat]
+    return ncc
+
+
+def is_flat(template):
+    """Проверяет, что шаблон почти однотонный (для него NCC не определена)."""
+    return float(np.std(template)) < _FLAT_STD
+
+
+def downscale(array, factor):
+    """
+    Уменьшает изображение в factor раз усреднением блоков.
+
+    Args:
+        array (np.ndarray): Изображение (H, W)
+        factor (int): Коэффициент уменьшения
+
+    Returns:
+        np.ndarray: Изображение (H // factor, W // factor)
+    """
+    if factor == 1:
+        return array
+    height, width = array.shape[0] // factor, array.shape[1] // factor
+    return array[:height * factor, :width * factor].reshape(height, factor, width, factor).mean(axis=(1, 3))
+
+
+def pyramid_search(image, template, factor, candidates=5, min_template_size=8):
+    """
+    Ищет шаблон на изображении от грубого масштаба к точному: NCC по уменьшенным
+    в factor раз изображению и шаблону, затем уточнение лучших позиций
+    в полном разрешении в окрестности factor пикселей.
+
+    Args:
+        image (np.ndarray): Область поиска (H, W) float32
+        template (np.ndarray): Шаблон (h, w) float32 в масштабе области поиска
+        factor (int): Коэффициент уменьшения грубого уровня
+        candidates (int): Сколько лучших позиций грубого уровня уточняется
+        min_template_size (int): Минимальный размер шаблона на грубом уровне
+
+    Returns:
+        tuple или None: (оценка, x, y) левого верхнего угла или None, если шаблон не помещается
+    """
+    height, width = template.shape
+    if image.shape[0] < height or image.shape[1] < width:
+        return None
+    while factor > 1 and min(height, width) // factor < min_template_size:
+        factor //= 2
+
+    if factor == 1:
+        scores = batch_match(image[None], template[None])[0]
+        y, x = np.unravel_index(int(scores.argmax()), scores.shape)
+        return float(scores[y, x]), int(x), int(y)
+
+    coarse = batch_match(downscale(image, factor)[None], downscale(template, factor)[None])[0]
+    flat_coarse = coarse.reshape(-1)
+    top = np.argpartition(-flat_coarse, min(candidates, flat_coarse.size) - 1)[:candidates]
+
+    best = None
+    for index in top:
+        coarse_y, coarse_x = np.unravel_index(int(index), coarse.shape)
+        left = max(0, coarse_x * factor - factor)
+        top_y = max(0, coarse_y * factor - factor)
+        window = image[top_y:top_y + height + 2 * factor, left:left + width + 2 * factor]
+        if window.shape[0] < height or window.shape[1] < width:
+            continue
+        scores = batch_match(window[None], template[None])[0]
+        y, x = np.unravel_index(int(scores.argmax()), scores.shape)
+        if best is None or scores[y, x] > best[0]:
+            best = (float(scores[y, x]), int(left + x), int(top_y + y))
+    return best
+
+
+class TemplateVerifier:
+    """
+    Проверка элементов памяти на экране одним проходом.
+    Шаблоны всех местоположений всех кандидатов приводятся к одному рабочему
+    размеру, складываются в пачку NumPy и сопоставляются с одним скриншотом.
+    Хранилище признаков изменяется и читается под блокировкой, само
+    сопоставление выполняется без нее и может идти в нескольких потоках.
+    """
+
+    def __init__(self, load_image, features_path=None, max_margin=16):
+        """
+        Инициализирует проверку шаблонов.
+
+        Args:
+            load_image (callable): Возвращает изображение элемента (PIL.Image) по значению
+                поля "screenshot" местоположения или None, если его нет
+            features_path (str, optional): Файл .npy с признаками шаблонов
+            max_margin (int): Максимальный запас поиска вокруг шаблона в рабочих пикселях
+        """
+        self.load_image = load_image
+        self.template_size = FEATURE_SIZE
+        self.max_margin = max_margin
+        self.features = TemplateFeatureStore(features_path, FEATURE_SIZE)
+        self._lock = threading.RLock()
+
+    def add_template(self, filename, image):
+        """
+        Считает и сохраняет признаки шаблона при сохранении элемента.
+        Признаки уже известного скриншота не пересчитываются.
+
+        Args:
+            filename (str): Ключ скриншота элемента
+            image (PIL.Image): Изображение элемента
+        """
+        with self._lock:
+            if filename not in self.features:
+                self.features.add(filename, image)
+
+    def remove_template(self, filename):
+        """
+        Удаляет признаки шаблона, скриншот которого удален.
+
+        Args:
+            filename (str): Ключ скриншота элемента
+        """
+        with self._lock:
+            self.features.remove(filename)
+
+    def load_template(self, filename):
+        """
+        Проверяет, что признаки шаблона посчитаны. Для элементов, сохраненных
+        до появления хранилища признаков, они считаются из изображения один раз.
+
+        Args:
+            filename (str): Ключ скриншота элемента
+
+        Returns:
+            bool: True если признаки есть, False если скриншота нет
+        """
+        with self._lock:
+            if filename in self.features:
+                return True
+            image = self.load_image(filename)
+            if image is None:
+                return False
+            self.features.add(filename, image)
+            return filename in self.features
+
+    def close(self):
+        """
+        Записывает признаки шаблонов на диск.
+        """
+        with self._lock:
+            self.features.flush()
+
+    def verify(self, screenshot, elements, max_offset_pixels=10, threshold=MATCH_THRESHOLD):
+        """
+        Проверяет все местоположения всех элементов на одном скриншоте.
+
+        Args:
+            screenshot (PIL.Image): Текущий скриншот
+            elements (list): Элементы памяти
+            max_offset_pixels (int): Допустимое смещение элемента в пикселях экрана
+            threshold (float): Порог совпадения (0-1)
+
+        Returns:
+            dict: ID элемента -> лучшее совпадение {"score", "location", "coordinates", "matched"}
+        """
+        gray = screenshot.convert('L')
+        screen_width, screen_height = gray.size
+        size = self.template_size
+
+        entries = []
+        # Признаки читаются одной выборкой, пока шаблоны не удалены другим потоком
+        with self._lock:
+            for element in elements:
+                for location in element.get("locations", []):
+                    if not location.get("screenshot"):
+                        continue
+                    if not self.load_template(location["screenshot"]):
+                        continue
+                    saved_width, saved_height = location["screen_size"]
+                    scale_x = screen_width / saved_width
+                    scale_y = screen_height / saved_height
+                    element_x, element_y, element_width, element_height = location["element_rect"]
+                    rect = (element_x * scale_x, element_y * scale_y,
+                            max(1.0, element_width * scale_x), max(1.0, element_height * scale_y))
+                    entries.append((element, location, location["screenshot"], rect, scale_x, scale_y))
+            while entries:
+                try:
+                    templates, means, stds = self.features.get_many([entry[2] for entry in entries])
+                    break
+                except KeyError as e:
+                    # Шаблон удален другим процессом после проверки: его местоположение пропускается
+                    entries = [entry for entry in entries if entry[2] != e.args[0]]
+            if not entries:
+                return {}
+
+        # Один запас поиска для всей пачки: не меньше max_offset_pixels для самого мелкого шаблона
+        margin = max(1, min(self.max_margin, max(
+            math.ceil(max_offset_pixels * size / min(rect[2], rect[3])) for _, _, _, rect, _, _ in entries)))
+        region_size = size + 2 * margin
+
+        regions = np.empty((len(entries), region_size, region_size), dtype=np.float32)
+        for i, (_, _, _, (x, y, width, height), _, _) in enumerate(entries):
+            cell_x, cell_y = width / size, height / size
+            box = (x - margin * cell_x, y - margin * cell_y,
+                   x + width + margin * cell_x, y + height + margin * cell_y)
+            # crop дополняет черным области за краем экрана, resize берет дробную рамку внутри вырезки
+            left, top = math.floor(box[0]), math.floor(box[1])
+            patch = gray.crop((left, top, math.ceil(box[2]), math.ceil(box[3])))
+            patch = patch.resize((region_size, region_size), Image.BILINEAR,
+                                 box=(box[0] - left, box[1] - top, box[2] - left, box[3] - top))
+            regions[i] = np.asarray(patch, dtype=np.float32)
+
+        scores = batch_match(regions, templates, means, stds)
+        flat_scores = scores.reshape(len(entries), -1)
+        # При равных оценках (однотонные области) предпочитается смещение ближе к сохраненной позиции
+        steps = np.arange(-margin, margin + 1)
+        center_penalty = 1e-6 * (np.abs(steps)[:, None] + np.abs(steps)[None, :]).reshape(-1)
+        best_offsets = (flat_scores - center_penalty).argmax(axis=1)
+        best_scores = flat_scores[np.arange(len(entries)), best_offsets]
+
+        results = {}
+        for i, (element, location, _, (x, y, width, height), scale_x, scale_y) in enumerate(entries):
+            score = float(best_scores[i])
+            current = results.get(element["id"])
+            if current is not None and current["score"] >= score:
+                continue
+            offset_y, offset_x = divmod(int(best_offsets[i]), 2 * margin + 1)
+            shift_x = (offset_x - margin) * width / size
+            shift_y = (offset_y - margin) * height / size
+            original_x, original_y = location["coordinates"]
+            results[element["id"]] = {
+                "score": score,
+                "location": location,
+                "coordinates": (int(original_x * scale_x + shift_x), int(original_y * scale_y + shift_y)),
+                "matched": score >= threshold
+            }
+        return results
+
+    def relocate(self, screenshot, location, search_radii=(40, 160), threshold=RELOCATION_THRESHOLD):
+        """
+        Ищет сдвинувшийся элемент: сначала в расширяющихся окнах вокруг сохраненного
+        прямоугольника, затем по всему экрану. Каждый этап - грубый поиск
+        по уменьшенному изображению и уточнение в полном разрешении.
+
+        Args:
+            screenshot (PIL.Image): Текущий скриншот
+            location (dict): Местоположение элемента с сохраненным изображением
+            search_radii (tuple): Радиусы окон поиска в пикселях до поиска по всему экрану
+            threshold (float): Порог совпадения (0-1)
+
+        Returns:
+            dict или None: {"score", "coordinates", "element_rect"} на текущем экране или None
+        """
+        if not location.get("screenshot"):
+            return None
+        image = self.load_image(location["screenshot"])
+        if image is None:
+            return None
+
+        screen_width, screen_height = screenshot.size
+        saved_width, saved_height = location["screen_size"]
+        scale_x = screen_width / saved_width
+        scale_y = screen_height / saved_height
+        element_x, element_y, element_width, element_height = location["element_rect"]
+        rect_x, rect_y = int(element_x * scale_x), int(element_y * scale_y)
+        template_width = max(1, int(round(element_width * scale_x)))
+        template_height = max(1, int(round(element_height * scale_y)))
+
+        template = np.asarray(image.convert('L').resize((template_width, template_height), Image.BILINEAR),
+                              dtype=np.float32)
+        # Однотонный шаблон совпадет с любой однотонной областью экрана
+        if is_flat(template):
+            return None
+        gray = np.asarray(screenshot.convert('L'), dtype=np.float32)
+
+        # Окна растут вместе с коэффициентом уменьшения, последний этап - весь экран.
+        # Неуверенное совпадение рядом (например, соседняя строка списка) не останавливает
+        # поиск: побеждает лучшее совпадение среди всех этапов
+        stages = [(radius, 2 ** (i + 1)) for i, radius in enumerate(search_radii)] + [(None, 2 ** (len(search_radii) + 1))]
+        best = None
+        for radius, factor in stages:
+            if radius is None:
+                left, top, right, bottom = 0, 0, screen_width, screen_height
+            else:
+                left, top = max(0, rect_x - radius), max(0, rect_y - radius)
+                right = min(screen_width, rect_x + template_width + radius)
+                bottom = min(screen_height, rect_y + template_height + radius)
+            found = pyramid_search(gray[top:bottom, left:right], template, factor)
+            if found is None:
+                continue
+            score, x, y = found
+            logger.info(f"Поиск сдвинутого элемента (радиус {radius or 'весь экран'}): уверенность {score:.2f}")
+            if best is None or score > best[0]:
+                best = (score, left + x, top + y)
+            if score >= CONFIDENT_THRESHOLD:
+                break
+
+        if best is None or best[0] < threshold:
+            return None
+        score, found_x, found_y = best
+        original_x, original_y = location["coordinates"]
+        return {
+            "score": score,
+            "coordinates": (int(original_x * scale_x) + found_x - rect_x, int(original_y * scale_y) + found_y - rect_y),
+            "element_rect": (found_x, found_y, template_width, template_height)
+        }
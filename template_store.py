@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import os
+import logging
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image
+from screen_hash import phash
+
+try:
+    # Блокировка файла признаков между процессами; без fcntl (Windows)
+    # файл признаков должен использоваться одним процессом
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Рабочий размер шаблона для проверки на экране
+FEATURE_SIZE = 32
+
+_NAME_LENGTH = 64
+
+
+def feature_dtype(size=FEATURE_SIZE):
+    """
+    Тип записи признаков шаблона: имя файла скриншота, среднее и стандартное
+    отклонение яркости для NCC, pHash и шаблон в оттенках серого size x size.
+    """
+    return np.dtype([
+        ("name", f"S{_NAME_LENGTH}"),
+        ("mean", "<f4"),
+        ("std", "<f4"),
+        ("phash", "<u8"),
+        ("pixels", "u1", (size, size)),
+    ])
+
+
+class TemplateFeatureStore:
+    """
+    Хранилище заранее посчитанных признаков шаблонов элементов.
+    Признаки считаются один раз при сохранении элемента и лежат в файле .npy,
+    который открывается через memmap: проверка читает несколько килобайт
+    нужных строк вместо декодирования и уменьшения PNG.
+    Хранится один рабочий размер - тот, на котором TemplateVerifier.verify
+    проверяет кандидатов. Поиск сдвинувшегося элемента (relocate) строит
+    шаблон из исходного изображения: его размер зависит от масштаба текущего
+    экрана и заранее неизвестен, а уровни пирамиды pyramid_search получает
+    уменьшением этого шаблона.
+    Файл может быть открыт несколькими процессами: выбор строки, запись,
+    удаление и расширение выполняются под блокировкой файла .lock. Расширение
+    атомарно подменяет файл, и остальные процессы переоткрывают его перед
+    следующим обращением под блокировкой, а не пишут в старую копию.
+    """
+
+    def __init__(self, path=None, size=FEATURE_SIZE, initial_capacity=256):
+        """
+        Открывает или создает хранилище признаков.
+
+        Args:
+            path (str, optional): Файл .npy (без него признаки хранятся только в памяти)
+            size (int): Рабочий размер шаблона
+            initial_capacity (int): Начальное количество строк файла
+        """
+        self.path = path
+        self.size = size
+        self.dtype = feature_dtype(size)
+        self._rows = {}
+        self._file_id = None
+        with self._file_lock():
+            self._array = self._open(initial_capacity)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, name):
+        row = self._rows.get(name)
+        if row is None:
+            return False
+        # Файл признаков может использоваться несколькими процессами: строка,
+        # занятая другим процессом, считается отсутствующей и пересчитывается
+        if row >= len(self._array) or self._array[row]["name"] != name.encode("utf-8"):
+            del self._rows[name]
+            return False
+        return True
+
+    @contextmanager
+    def _file_lock(self, exclusive=True):
+        """Блокирует файл признаков от других процессов (в памяти и без fcntl - ничего не делает)."""
+        if not self.path or fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock_file:
+            # Блокировка снимается при закрытии файла
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _sync(self):
+        """Переоткрывает файл признаков, если другой процесс заменил его (вызывается под блокировкой)."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        stat = os.stat(self.path)
+        if (stat.st_dev, stat.st_ino) != self._file_id:
+            capacity = len(self._array)
+            self._array = None
+            self._array = self._open(capacity)
+
+    def _find(self, name):
+        """
+        Возвращает строку шаблона в текущем файле или None.
+        Строка из кэша проверяется по имени: другой процесс мог освободить ее
+        или занять другим шаблоном; тогда имя ищется по всему файлу.
+        """
+        encoded = name.encode("utf-8")
+        row = self._rows.get(name)
+        if row is not None and row < len(self._array) and self._array[row]["name"] == encoded:
+            return row
+        self._rows.pop(name, None)
+        rows = np.flatnonzero(self._array["name"] == encoded)
+        if not len(rows):
+            return None
+        self._rows[name] = int(rows[0])
+        return self._rows[name]
+
+    def _open(self, capacity):
+        """Открывает файл признаков через memmap или создает новый."""
+        array = None
+        if self.path and os.path.exists(self.path):
+            try:
+                array = np.load(self.path, mmap_mode="r+")
+                if array.dtype != self.dtype or array.ndim != 1:
+                    logger.info("Формат файла признаков шаблонов изменился, файл будет пересоздан")
+                    del array
+                    array = None
+            except Exception as e:
+                logger.error(f"Ошибка при открытии файла признаков шаблонов: {str(e)}")
+                array = None
+        if array is None:
+            array = self._create(capacity)
+        elif self.path:
+            stat = os.stat(self.path)
+            self._file_id = (stat.st_dev, stat.st_ino)
+
+        names = array["name"]
+        used = np.flatnonzero(names != b"")
+        self._rows = {names[row].decode("utf-8"): int(row) for row in used}
+        return array
+
+    def _temp_file(self, capacity):
+        """Создает временный файл признаков рядом с основным и возвращает его путь и memmap."""
+        temp_file = f"{self.path}.{os.getpid()}.temp.npy"
+        return temp_file, np.lib.format.open_memmap(temp_file, mode="w+", dtype=self.dtype, shape=(capacity,))
+
+    def _replace(self, temp_file):
+        """
+        Атомарно подменяет файл признаков временным и открывает его.
+        Файл не перезаписывается на месте: процессы, открывшие старый файл,
+        видят замену по inode и переоткрывают его в _sync.
+        """
+        os.replace(temp_file, self.path)
+        stat = os.stat(self.path)
+        self._file_id = (stat.st_dev, stat.st_ino)
+        return np.load(self.path, mmap_mode="r+")
+
+    def _create(self, capacity):
+        """Создает пустой массив признаков (в файле или в памяти)."""
+        if not self.path:
+            return np.zeros(capacity, dtype=self.dtype)
+        temp_file, array = self._temp_file(capacity)
+        array.flush()
+        del array
+        return self._replace(temp_file)
+
+    def _grow(self):
+        """Удваивает количество строк (вызывается под блокировкой)."""
+        old_capacity = len(self._array)
+        if self.path:
+            temp_file, grown = self._temp_file(old_capacity * 2)
+            grown[:old_capacity] = self._array
+            grown.flush()
+            del grown
+            self._array.flush()
+            self._array = None
+            self._array = self._replace(temp_file)
+        else:
+            self._array = np.concatenate([self._array, np.zeros(old_capacity, dtype=self.dtype)])
+
+    def features(self, image):
+        """
+        Считает признаки шаблона.
+
+        Args:
+            image (PIL.Image): Изображение элемента
+
+        Returns:
+            tuple: (шаблон uint8 size x size, среднее, стандартное отклонение, pHash)
+        """
+        pixels = np.asarray(image.convert('L').resize((self.size, self.size), Image.BILINEAR), dtype=np.uint8)
+        values = pixels.astype(np.float32)
+        return pixels, float(values.mean()), float(values.std()), phash(image)
+
+    def add(self, name, image):
+        """
+        Добавляет или обновляет признаки шаблона.
+
+        Args:
+            name (str): Имя файла скриншота элемента
+            image (PIL.Image): Изображение элемента
+        """
+        encoded = name.encode("utf-8")
+        if len(encoded) > _NAME_LENGTH:
+            return
+        pixels, mean, std, value = self.features(image)
+        with self._file_lock():
+            self._sync()
+            row = self._find(name)
+            if row is None:
+                # Свободная строка выбирается по файлу, а не по кэшу: ее мог занять другой процесс
+                free = np.flatnonzero(self._array["name"] == b"")
+                if not len(free):
+                    free = [len(self._array)]
+                    self._grow()
+                row = int(free[0])
+                self._rows[name] = row
+            record = self._array[row:row + 1]
+            record["name"] = encoded
+            record["mean"] = mean
+            record["std"] = std
+            record["phash"] = value
+            record["pixels"] = pixels
+
+    def remove(self, name):
+        """
+        Освобождает строку шаблона.
+
+        Args:
+            name (str): Имя файла скриншота элемента
+        """
+        with self._file_lock():
+            self._sync()
+            row = self._find(name)
+            if row is not None:
+                self._array[row:row + 1]["name"] = b""
+                del self._rows[name]
+
+    def get_many(self, names):
+        """
+        Читает признаки нескольких шаблонов одной выборкой строк.
+
+        Args:
+            names (list): Имена файлов скриншотов
+
+        Returns:
+            tuple: (шаблоны float32 (N, size, size), средние (N,), стандартные отклонения (N,))
+
+        Raises:
+            KeyError: Шаблона нет в хранилище (например, его удалил другой процесс)
+        """
+        with self._file_lock(exclusive=False):
+            self._sync()
+            rows = []
+            for name in names:
+                row = self._find(name)
+                if row is None:
+                    raise KeyError(name)
+                rows.append(row)
+            records = self._array[np.array(rows, dtype=np.int64)]
+        return records["pixels"].astype(np.float32), records["mean"].astype(np.float32), records["std"].astype(np.float32)
+
+    def flush(self):
+        """
+        Записывает изменения memmap на диск.
+        """
+        if isinstance(self._array, np.memmap):
+            self._array.flush()
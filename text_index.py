@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import re
+import unicodedata
+import logging
+import numpy as np
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Кириллические буквы, которые в нижнем регистре выглядят как латинские.
+# OCR и языковые модели часто путают их в смешанном тексте, поэтому обе
+# стороны сравнения приводятся к латинскому написанию.
+_HOMOGLYPHS = str.maketrans({
+    "а": "a", "в": "b", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x",
+    "к": "k", "м": "m", "т": "t", "н": "h", "ѕ": "s", "і": "i", "ј": "j", "ԁ": "d",
+    "һ": "h", "ԛ": "q", "ԝ": "w", "ӏ": "l",
+})
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_search_text(text):
+    """
+    Нормализует текст для нечеткого поиска: Unicode NFKD без диакритики,
+    casefold, приведение кириллических двойников к латинице и схлопывание
+    пунктуации и пробелов.
+
+    Args:
+        text (str): Исходный текст
+
+    Returns:
+        str: Нормализованный текст
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = text.casefold().translate(_HOMOGLYPHS)
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def trigrams(normalized_text):
+    """
+    Разбивает нормализованный текст на триграммы символов.
+    Каждое слово дополняется пробелами, чтобы начало и конец слова
+    давали собственные триграммы ("get" -> " ge", "get", "et ").
+
+    Args:
+        normalized_text (str): Текст после normalize_search_text
+
+    Returns:
+        set: Множество триграмм
+    """
+    grams = set()
+    for word in normalized_text.split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def pack_strings(strings):
+    """
+    Склеивает строки без переводов строки в один массив байтов UTF-8
+    (компактное хранение в файлах .npz без pickle).
+
+    Args:
+        strings (iterable): Строки
+
+    Returns:
+        numpy.ndarray: Массив uint8
+    """
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def unpack_strings(packed, count=None):
+    """
+    Разбирает массив байтов, склеенный pack_strings.
+
+    Args:
+        packed (numpy.ndarray): Массив uint8
+        count (int, optional): Ожидаемое количество строк (нужно, если строки могут быть пустыми)
+
+    Returns:
+        list: Строки
+    """
+    if count == 0 or (count is None and len(packed) == 0):
+        return []
+    return packed.tobytes().decode("utf-8").split("\n")
+
+
+def edit_distance(a, b):
+    """
+    Расстояние Левенштейна между двумя строками.
+
+    Args:
+        a, b (str): Сравниваемые строки
+
+    Returns:
+        int: Минимальное количество вставок, удалений и замен
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def word_edit_similarity(query, text):
+    """
+    Сходство запроса с лучшим фрагментом текста из того же количества слов,
+    по расстоянию Левенштейна (0-1). "get" против "get started" дает 1.0,
+    против "budget" - 0.5.
+
+    Args:
+        query (str): Нормализованный запрос
+        text (str): Нормализованный текст элемента
+
+    Returns:
+        float: Сходство от 0 до 1
+    """
+    query_words = query.split()
+    text_words = text.split()
+    if not query_words or not text_words:
+        return 0.0
+    if len(query_words) >= len(text_words):
+        windows = [text]
+    else:
+        size = len(query_words)
+        windows = [" ".join(text_words[i:i + size]) for i in range(len(text_words) - size + 1)]
+    best = 0.0
+    for window in windows:
+        longest = max(len(query), len(window))
+        best = max(best, 1.0 - edit_distance(query, window) / longest)
+        if best == 1.0:
+            break
+    return best
+
+
+class TrigramTextIndex:
+    """
+    Инвертированный индекс триграмм по search_text элементов памяти.
+    Кандидаты отбираются по общим триграммам, затем ранжируются по
+    покрытию, коэффициенту Жаккара и расстоянию Левенштейна по словам.
+    """
+
+    def __init__(self, max_posting_share=0.05, candidate_limit=200):
+        """
+        Инициализирует пустой индекс.
+
+        Args:
+            max_posting_share (float): Триграммы, встречающиеся в большей доле
+                элементов, не используются для отбора кандидатов (если есть более редкие)
+            candidate_limit (int): Сколько лучших кандидатов пересчитывается точно
+        """
+        self.max_posting_share = max_posting_share
+        self.candidate_limit = candidate_limit
+        self._postings = {}
+        self._texts = {}
+        self._grams = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, element_id, search_text):
+        """
+        Добавляет или обновляет текст элемента в индексе.
+
+        Args:
+            element_id (str): ID элемента
+            search_text (str): Текст элемента
+        """
+        self.remove(element_id)
+        normalized = normalize_search_text(search_text)
+        grams = trigrams(normalized)
+        self._texts[element_id] = normalized
+        self._grams[element_id] = grams
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(element_id)
+
+    def load(self, items):
+        """
+        Заполняет индекс текстами элементов.
+
+        Args:
+            items (iterable): Пары (ID элемента, search_text)
+        """
+        for element_id, text in items:
+            self.add(element_id, text)
+
+    def to_arrays(self):
+        """
+        Представляет индекс в виде массивов для снимка: ID и нормализованные
+        тексты элементов, триграммы и списки вхождений (номера элементов).
+
+        Returns:
+            dict: Массивы NumPy
+        """
+        ids = list(self._texts)
+        rows = {element_id: row for row, element_id in enumerate(ids)}
+        grams = list(self._postings)
+        counts = np.array([len(self._postings[gram]) for gram in grams], dtype=np.int32)
+        posting_rows = np.fromiter((rows[element_id] for gram in grams for element_id in self._postings[gram]),
+                                   dtype=np.int32, count=int(counts.sum()))
+        return {
+            "ids": pack_strings(ids),
+            "texts": pack_strings(self._texts[element_id] for element_id in ids),
+            "grams": pack_strings(grams),
+            "posting_counts": counts,
+            "posting_rows": posting_rows
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, **kwargs):
+        """
+        Восстанавливает индекс из массивов to_arrays без нормализации текстов
+        и разбиения на триграммы. Триграммы отдельных элементов считаются
+        при первой оценке.
+
+        Args:
+            arrays (dict): Массивы снимка
+            **kwargs: Параметры конструктора
+
+        Returns:
+            TrigramTextIndex: Индекс
+        """
+        index = cls(**kwargs)
+        ids = unpack_strings(arrays["ids"])
+        texts = unpack_strings(arrays["texts"], len(ids))
+        grams = unpack_strings(arrays["grams"])
+        index._texts = dict(zip(ids, texts))
+        offsets = np.concatenate(([0], np.cumsum(arrays["posting_counts"]))).tolist()
+        posting_ids = np.array(ids, dtype=object)[arrays["posting_rows"]] if ids else np.zeros(0, dtype=object)
+        index._postings = {gram: set(posting_ids[offsets[i]:offsets[i + 1]]) for i, gram in enumerate(grams)}
+        return index
+
+    def _element_grams(self, element_id):
+        """Возвращает триграммы текста элемента (считает при первом обращении)."""
+        grams = self._grams.get(element_id)
+        if grams is None:
+            grams = trigrams(self._texts[element_id])
+            self._grams[element_id] = grams
+        return grams
+
+    def remove(self, element_id):
+        """
+        Удаляет элемент из индекса.
+
+        Args:
+            element_id (str): ID элемента
+        """
+        if element_id not in self._texts:
+            return
+        grams = self._element_grams(element_id)
+        del self._grams[element_id]
+        del self._texts[element_id]
+        for gram in grams:
+            posting = self._postings[gram]
+            posting.discard(element_id)
+            if not posting:
+                del self._postings[gram]
+
+    def _candidates(self, query_grams):
+        """Считает общие триграммы по спискам вхождений, начиная с самых редких."""
+        postings = sorted((self._postings.get(gram, ()) for gram in query_grams), key=len)
+        postings = [posting for posting in postings if posting]
+        if not postings:
+            return []
+        max_posting = max(1000, int(len(self._texts) * self.max_posting_share))
+        selective = [posting for posting in postings if len(posting) <= max_posting] or postings[:1]
+        counts = Counter()
+        for posting in selective:
+            counts.update(posting)
+        return [element_id for element_id, _ in counts.most_common(self.candidate_limit)]
+
+    def score(self, query, element_id):
+        """
+        Оценивает сходство нормализованного запроса с текстом элемента.
+
+        Args:
+            query (str): Нормализованный запрос
+            element_id (str): ID элемента
+
+        Returns:
+            float: Оценка от 0 до 1
+        """
+        query_grams = trigrams(query)
+        grams = self._element_grams(element_id)
+        shared = len(query_grams & grams)
+        if not shared:
+            return 0.0
+        # Покрытие в обе стороны сохраняет прежнее поведение "подстрока в любую сторону"
+        containment = max(shared / len(query_grams), shared / len(grams))
+        jaccard = shared / (len(query_grams) + len(grams) - shared)
+        return 0.4 * containment + 0.3 * jaccard + 0.3 * word_edit_similarity(query, self._texts[element_id])
+
+    def search(self, search_text, limit=10, min_score=0.55):
+        """
+        Возвращает до limit элементов, наиболее похожих на искомый текст.
+
+        Args:
+            search_text (str): Искомый текст
+            limit (int): Максимальное количество результатов
+            min_score (float): Минимальная оценка сходства
+
+        Returns:
+            list: Пары (ID элемента, оценка), отсортированные по убыванию оценки
+        """
+        query = normalize_search_text(search_text)
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        scored = []
+        for element_id in self._candidates(query_grams):
+            score = self.score(query, element_id)
+            if score >= min_score:
+                scored.append((element_id, score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
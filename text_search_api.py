@@ -74,6 +74,8 @@ def search_text():
         return jsonify({"error": "Параметр 'text' не найден в запросе"}), 400
     
     search_text = request.form['text']
+    # Необязательное пространство имен памяти (приложение, с которого сделан скриншот)
+    namespace = request.form.get('namespace') or None
     logger.info(f"Искомый текст: {search_text}")
     
     # Сохраняем поисковый запрос для последующего использования
@@ -104,7 +106,7 @@ def search_text():
     
     try:
         # Вызываем функцию поиска текста
-        result = find_text_on_image(image_path, search_text)
+        result = find_text_on_image(image_path, search_text, namespace=namespace)
         
         if result:
             center_x, center_y = result
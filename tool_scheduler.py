@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Инструменты, которые работают с экраном и вводом: они выполняются строго
+# по одному и в порядке вызовов, остальные - параллельно с ними и между собой
+GUI_TOOLS = {"computer"}
+
+# Инструменты со своей очередью: у bash одна оболочка на агента, поэтому его команды
+# выполняются по одной и в порядке вызовов (параллельно с экраном и редактором)
+SERIAL_TOOLS = {"bash"}
+
+# Таймауты инструментов (секунды). Для действий с экраном таймаут не нужен:
+# каждое из них ограничено ожиданием успокоения интерфейса
+TOOL_TIMEOUTS = {
+    "bash": 120.0,
+    "str_replace_editor": 30.0,
+}
+
+# Сколько сверх таймаута ждать результат: инструмент сам завершает работу
+# по своему таймауту (bash убивает команду) и возвращает частичный вывод
+TIMEOUT_GRACE = 5.0
+
+# Количество потоков для инструментов, не работающих с экраном
+MAX_WORKERS = 4
+
+
+class ToolScheduler:
+    """
+    Планировщик вызовов инструментов одного ответа модели.
+    Действия с экраном ставятся в очередь одного потока и выполняются по
+    порядку; команды bash - в свою такую же очередь, остальные инструменты
+    (редактор) сразу уходят в пул потоков. Очереди и пул работают
+    параллельно друг с другом. Результаты забираются в
+    порядке вызовов, поэтому порядок tool_result в истории не меняется.
+    """
+
+    def __init__(self, execute, gui_executor=None, timeouts=None, max_workers=MAX_WORKERS):
+        """
+        Инициализирует планировщик.
+
+        Args:
+            execute (callable): Выполняет один вызов инструмента и возвращает результат
+            gui_executor (Executor, optional): Поток для действий с экраном (по умолчанию - свой)
+            timeouts (dict, optional): Таймауты, которые заменяют или дополняют TOOL_TIMEOUTS
+            max_workers (int): Количество потоков для остальных инструментов
+        """
+        self.execute = execute
+        self._owns_gui = gui_executor is None
+        self.gui_executor = gui_executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="gui")
+        self.worker_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self.serial_executors = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+                                 for name in SERIAL_TOOLS}
+        self.timeouts = dict(TOOL_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+
+    def timeout(self, tool_name):
+        """Возвращает таймаут инструмента (None - без таймаута)."""
+        if tool_name in GUI_TOOLS:
+            return None
+        return self.timeouts.get(tool_name)
+
+    def submit(self, tool_use):
+        """
+        Ставит вызов инструмента на выполнение.
+
+        Args:
+            tool_use (dict): Блок tool_use из ответа модели
+
+        Returns:
+            concurrent.futures.Future: Будущий результат инструмента
+        """
+        if tool_use["name"] in GUI_TOOLS:
+            executor = self.gui_executor
+        else:
+            executor = self.serial_executors.get(tool_use["name"], self.worker_executor)
+        return executor.submit(self.execute, tool_use)
+
+    def timeout_result(self, tool_use):
+        """Результат инструмента, который не ответил за отведенное время."""
+        timeout = self.timeout(tool_use["name"])
+        logger.warning(f"Инструмент {tool_use['name']} не завершился за {timeout} с")
+        return {"error": f"Інструмент не завершився за {timeout:g} с", "timed_out": True}
+
+    def result(self, tool_use, future):
+        """
+        Дожидается результата вызова с учетом таймаута инструмента.
+
+        Args:
+            tool_use (dict): Блок tool_use
+            future (concurrent.futures.Future): Будущий результат из submit
+
+        Returns:
+            dict: Результат инструмента или ошибка таймаута
+        """
+        timeout = self.timeout(tool_use["name"])
+        try:
+            return future.result(None if timeout is None else timeout + TIMEOUT_GRACE)
+        except FutureTimeoutError:
+            future.cancel()
+            return self.timeout_result(tool_use)
+        except Exception as e:
+            logger.error(f"Ошибка инструмента {tool_use['name']}: {e}")
+            return {"error": str(e)}
+
+    def run(self, tool_uses, started=None):
+        """
+        Выполняет вызовы инструментов и возвращает их результаты.
+
+        Args:
+            tool_uses (list): Блоки tool_use в порядке вызовов
+            started (dict, optional): Уже запущенные вызовы (id -> Future)
+
+        Returns:
+            dict: Результаты по tool_use_id
+        """
+        started = dict(started or {})
+        # Сначала запускаются все вызовы, потом результаты забираются по порядку
+        for tool_use in tool_uses:
+            if tool_use["id"] not in started:
+                started[tool_use["id"]] = self.submit(tool_use)
+        return {tool_use["id"]: self.result(tool_use, started[tool_use["id"]]) for tool_use in tool_uses}
+
+    def shutdown(self, wait=True):
+        """Останавливает потоки планировщика (общий поток экрана не останавливается)."""
+        self.worker_executor.shutdown(wait=wait)
+        for executor in self.serial_executors.values():
+            executor.shutdown(wait=wait)
+        if self._owns_gui:
+            self.gui_executor.shutdown(wait=wait)
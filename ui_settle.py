@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import time
+import logging
+import numpy as np
+import pyautogui
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Профили ожидания по видам действий (секунды):
+#   min_wait - пауза до первого кадра (интерфейс еще не начал реагировать)
+#   stable_for - сколько экран должен не меняться, чтобы считаться успокоившимся
+#   timeout - максимальное ожидание
+#   key_interval - пауза между символами при вводе текста
+SETTLE_PROFILES = {
+    "move": {"min_wait": 0.0, "stable_for": 0.05, "timeout": 0.3},
+    "click": {"min_wait": 0.05, "stable_for": 0.15, "timeout": 2.0},
+    "key": {"min_wait": 0.05, "stable_for": 0.15, "timeout": 1.5},
+    "type": {"min_wait": 0.0, "stable_for": 0.1, "timeout": 1.0, "key_interval": 0.01},
+    "scroll": {"min_wait": 0.05, "stable_for": 0.2, "timeout": 1.5},
+    "submit": {"min_wait": 0.1, "stable_for": 0.3, "timeout": 5.0},
+    "default": {"min_wait": 0.05, "stable_for": 0.15, "timeout": 1.5},
+}
+
+# Размер кадра, по которому отслеживаются изменения экрана
+FRAME_SIZE = (160, 100)
+
+# Пиксель кадра считается изменившимся при разнице яркости больше этой
+PIXEL_TOLERANCE = 16
+
+# Экран считается изменившимся, если изменилось больше этой доли пикселей кадра
+# (мигающий курсор ввода на уменьшенном кадре занимает несколько пикселей и не учитывается)
+CHANGED_FRACTION = 0.002
+
+# Минимальный интервал между кадрами
+FRAME_INTERVAL = 0.03
+
+
+def capture_frame(size=FRAME_SIZE):
+    """
+    Делает уменьшенный кадр экрана в оттенках серого.
+
+    Args:
+        size (tuple): Размер кадра
+
+    Returns:
+        numpy.ndarray: Кадр (int16)
+    """
+    screenshot = pyautogui.screenshot()
+    factor = min(screenshot.width // size[0], screenshot.height // size[1])
+    if factor > 1:
+        screenshot = screenshot.reduce(factor)
+    frame = screenshot.convert('L').resize(size, Image.BILINEAR)
+    return np.asarray(frame, dtype=np.int16)
+
+
+class UISettle:
+    """
+    Ожидание, пока интерфейс успокоится после действия, вместо фиксированных пауз.
+    После действия в цикле снимаются уменьшенные кадры экрана; ожидание
+    заканчивается, когда экран не меняется stable_for секунд, или по таймауту.
+    Быстрый интерфейс не ждет лишнего, медленный получает время до таймаута.
+    """
+
+    def __init__(self, profiles=None, capture=capture_frame):
+        """
+        Инициализирует ожидание.
+
+        Args:
+            profiles (dict, optional): Профили, которые заменяют или дополняют SETTLE_PROFILES
+            capture (callable): Возвращает уменьшенный кадр экрана
+        """
+        self.profiles = {name: dict(profile) for name, profile in SETTLE_PROFILES.items()}
+        for name, profile in (profiles or {}).items():
+            self.profiles.setdefault(name, dict(SETTLE_PROFILES["default"])).update(profile)
+        self.capture = capture
+        self.stats = {}
+
+    def profile(self, action):
+        """Возвращает профиль действия (или профиль по умолчанию)."""
+        return self.profiles.get(action, self.profiles["default"])
+
+    def changed(self, previous, frame):
+        """Проверяет, изменился ли экран между двумя кадрами."""
+        return np.count_nonzero(np.abs(frame - previous) > PIXEL_TOLERANCE) > CHANGED_FRACTION * frame.size
+
+    def wait(self, action="default"):
+        """
+        Ждет, пока экран перестанет меняться после действия.
+
+        Args:
+            action (str): Вид действия (ключ профиля)
+
+        Returns:
+            dict: Успокоился ли экран, время ожидания и количество кадров
+        """
+        profile = self.profile(action)
+        started = time.perf_counter()
+        if profile["min_wait"]:
+            time.sleep(profile["min_wait"])
+
+        previous = self.capture()
+        stable_since = time.perf_counter()
+        frames = 1
+        settled = False
+        while True:
+            now = time.perf_counter()
+            if now - stable_since >= profile["stable_for"]:
+                settled = True
+                break
+            if now - started >= profile["timeout"]:
+                break
+            time.sleep(FRAME_INTERVAL)
+            frame = self.capture()
+            frames += 1
+            if self.changed(previous, frame):
+                stable_since = time.perf_counter()
+            previous = frame
+
+        waited = time.perf_counter() - started
+        stats = self.stats.setdefault(action, {"waits": 0, "timeouts": 0, "total_wait": 0.0})
+        stats["waits"] += 1
+        stats["timeouts"] += 0 if settled else 1
+        stats["total_wait"] += waited
+        if not settled:
+            logger.info(f"Экран не успокоился после действия {action} за {waited:.2f} с")
+        return {"settled": settled, "waited": waited, "frames": frames}